@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Multi-node central tier on one box.
+
+Starts N port_api.py processes, each with its own data directory, port and
+CENTRAL_NODE_ID, sharing one central_nodes.json, then:
+
+    1. registers --agents IPs the way start.sh does: /assign_project on a
+       round-robin entry node, follow "node" to the project's owner, ask it
+       again with &project=, run_add_project_address.py with the owner's
+       data directory and bind the port (the `ssh -R` step);
+    2. waits until every node holds the same ip_mapping.json (convergence);
+    3. releases --remove IPs on their owners and waits until every node
+       has dropped them (tombstone propagation);
+    4. reports how many of --ring-projects project names move when an
+       (N+1)-th node joins the ring.
+
+All nodes share 127.0.0.1, so a project's ports are taken by whichever
+node owns it; 'other' is served by every node from the same range.
+
+    python3 bench/central_cluster.py --nodes 3 --agents 60 --projects 6
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+FLUXSIGN_DIR = REPO_ROOT / "nginx" / "fluxsign"
+PROXYUSER_DIR = REPO_ROOT / "nginx" / "home" / "proxyuser"
+sys.path[:0] = [str(FLUXSIGN_DIR), str(Path(__file__).resolve().parent)]
+
+from central_nodes import HashRing  # noqa: E402
+from fleet_sim import http_get_json, port_is_busy  # noqa: E402
+
+
+def free_tcp_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Cluster:
+    def __init__(self, args, work_dir: Path):
+        self.args = args
+        self.work_dir = work_dir
+        self.nodes = {}  # node id -> {"url", "html_dir", "env"}
+        self.procs = []
+        self.tunnels = []
+        self.lock = threading.Lock()
+
+    def prepare(self):
+        port_mapping, base = {}, self.args.base_port
+        for i in range(self.args.projects):
+            port_mapping[f"project{i + 1}"] = [f"{base}-{base + self.args.ports_per_project - 1}"]
+            base += self.args.ports_per_project
+        port_mapping["other"] = [f"{base}-{base + self.args.ports_per_project - 1}"]
+
+        api_ports = {f"central-{i + 1}": free_tcp_port() for i in range(self.args.nodes)}
+        nodes_file = self.work_dir / "central_nodes.json"
+        nodes_file.write_text(json.dumps({"nodes": {
+            node_id: {"host": "127.0.0.1", "api_port": port, "ssh_port": 22, "peer_url": f"http://127.0.0.1:{port}"}
+            for node_id, port in api_ports.items()
+        }}), encoding="utf-8")
+
+        for node_id, api_port in api_ports.items():
+            html_dir = self.work_dir / node_id
+            html_dir.mkdir(parents=True)
+            for name, content in {
+                "port_mapping.json": port_mapping,
+                "ip_mapping.json": {p: [] for p in port_mapping},
+                "blacklist.json": {"blacklist": []},
+                "whitelist.json": {"whitelist": []},
+            }.items():
+                (html_dir / name).write_text(json.dumps(content), encoding="utf-8")
+            env = dict(os.environ)
+            env.update({
+                "NGINX_HTML_DIR": str(html_dir),
+                "FLUXSIGN_LOG_DIR": str(self.work_dir / "logs" / node_id),
+                "FLUXSIGN_DIR": str(FLUXSIGN_DIR),
+                "PORT_API_PORT": str(api_port),
+                "CENTRAL_NODE_ID": node_id,
+                "CENTRAL_NODES_FILE": str(nodes_file),
+                "REPLICATION_INTERVAL": str(self.args.interval),
+                "CENTRAL_REPLICATION_TOKEN": "bench",
+            })
+            self.nodes[node_id] = {"url": f"http://127.0.0.1:{api_port}", "html_dir": html_dir, "env": env}
+
+    def start(self):
+        for node_id, node in self.nodes.items():
+            log = open(self.work_dir / f"{node_id}.log", "w")
+            self.procs.append(subprocess.Popen(["python3", str(FLUXSIGN_DIR / "port_api.py")],
+                                               env=node["env"], stdout=log, stderr=subprocess.STDOUT))
+        deadline = time.monotonic() + 15
+        for node in self.nodes.values():
+            while True:
+                try:
+                    http_get_json(f"{node['url']}/available_ports?format=ranges")
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"port_api.py did not start, see {self.work_dir}")
+                    time.sleep(0.1)
+
+    def close(self):
+        for sock in self.tunnels:
+            sock.close()
+        for proc in self.procs:
+            proc.terminate()
+            proc.wait()
+
+    # === Agents ===
+
+    def register(self, index: int, record: dict):
+        ip = f"100.{64 + index // 65536}.{index // 256 % 256}.{index % 256}"
+        entry = list(self.nodes)[index % len(self.nodes)]
+        assignment = http_get_json(f"{self.nodes[entry]['url']}/assign_project?ip={ip}")
+        owner = assignment.get("node", {}).get("id", entry)
+        if owner != entry:
+            assignment = http_get_json(f"{self.nodes[owner]['url']}/assign_project?ip={ip}"
+                                       f"&project={assignment['project']}")
+        record.update(ip=ip, entry=entry, owner=owner, project=assignment["project"], redirected=owner != entry)
+        ports = assignment["available_ports"]
+        if not ports and assignment["project"] != "other":
+            record["project"] = "other"
+            ports = http_get_json(f"{self.nodes[owner]['url']}/available_ports?project=other&limit=20")["other"][
+                "available_ports"]
+        for port in ports:
+            if port_is_busy(port):
+                continue
+            subprocess.run(["python3", str(PROXYUSER_DIR / "run_add_project_address.py"), ip, record["project"],
+                            str(port)], capture_output=True, text=True, env=self.nodes[owner]["env"])
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                sock.bind(("127.0.0.1", port))
+                sock.listen(16)
+            except OSError:
+                sock.close()
+                continue
+            with self.lock:
+                self.tunnels.append(sock)
+            record["port"] = port
+            return
+
+    def register_all(self, agents: int) -> list:
+        records = [{} for _ in range(agents)]
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+            list(pool.map(lambda i: self.register(i, records[i]), range(agents)))
+        return records
+
+    # === Convergence ===
+
+    def mappings(self) -> dict:
+        result = {}
+        for node_id, node in self.nodes.items():
+            stored = json.loads((node["html_dir"] / "ip_mapping.json").read_text(encoding="utf-8"))
+            result[node_id] = {ip: project for project, ips in stored.items() for ip in ips}
+        return result
+
+    def wait_until(self, check, timeout: float) -> float:
+        started = time.monotonic()
+        while not check(self.mappings()):
+            if time.monotonic() - started > timeout:
+                return None
+            time.sleep(0.05)
+        return round(time.monotonic() - started, 3)
+
+    def release(self, ip: str, owner: str):
+        subprocess.run(["python3", "-c", f"import ip_leases; ip_leases.release({ip!r})"],
+                       cwd=FLUXSIGN_DIR, env=self.nodes[owner]["env"], check=True)
+
+
+def ring_movement(nodes: int, projects: int) -> dict:
+    names = [f"project-{i}" for i in range(projects)]
+    before = HashRing({f"central-{i + 1}": {} for i in range(nodes)})
+    after = HashRing({f"central-{i + 1}": {} for i in range(nodes + 1)})
+    moved = sum(1 for name in names if before.node_for(name) != after.node_for(name))
+    shares = {}
+    for name in names:
+        shares[after.node_for(name)] = shares.get(after.node_for(name), 0) + 1
+    return {"projects": projects, "moved": moved, "moved_share": round(moved / projects, 4),
+            "ideal_share": round(1 / (nodes + 1), 4), "per_node_after": dict(sorted(shares.items()))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several central nodes locally and measure replication")
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--agents", type=int, default=60)
+    parser.add_argument("--projects", type=int, default=6)
+    parser.add_argument("--ports-per-project", type=int, default=50)
+    parser.add_argument("--base-port", type=int, default=32000)
+    parser.add_argument("--interval", type=float, default=0.5, help="REPLICATION_INTERVAL of the nodes")
+    parser.add_argument("--concurrency", type=int, default=10, help="agents registering at once")
+    parser.add_argument("--remove", type=int, default=5, help="IPs to release after convergence")
+    parser.add_argument("--ring-projects", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--out", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix=f"flux-central-{args.nodes}-"))
+    cluster = Cluster(args, work_dir)
+    cluster.prepare()
+    cluster.start()
+    try:
+        started = time.monotonic()
+        records = cluster.register_all(args.agents)
+        registered = time.monotonic() - started
+        online = [r for r in records if "port" in r]
+        expected = {r["ip"]: r["project"] for r in online if r["project"] != "other"}
+
+        converged = cluster.wait_until(
+            lambda maps: all(m == expected for m in maps.values()), args.timeout)
+
+        removed = [r for r in online if r["project"] != "other"][:args.remove]
+        for r in removed:
+            cluster.release(r["ip"], r["owner"])
+        gone = {r["ip"] for r in removed}
+        tombstones = cluster.wait_until(
+            lambda maps: all(not gone & set(m) for m in maps.values()), args.timeout)
+
+        owners = {}
+        for r in online:
+            if r["project"] != "other":
+                owners.setdefault(r["owner"], set()).add(r["project"])
+        result = {
+            "nodes": args.nodes,
+            "agents": args.agents,
+            "online": len(online),
+            "in_other": sum(1 for r in online if r["project"] == "other"),
+            "redirected": sum(1 for r in records if r.get("redirected")),
+            "registrations_per_s": round(len(online) / registered, 2) if registered else 0.0,
+            "convergence_s": converged,
+            "tombstone_propagation_s": tombstones,
+            "projects_per_node": {node_id: sorted(p) for node_id, p in sorted(owners.items())},
+            "ring_movement": ring_movement(args.nodes, args.ring_projects),
+        }
+    finally:
+        cluster.close()
+
+    print(f"  N={args.nodes}: converged in {result['convergence_s']}s, "
+          f"tombstones in {result['tombstone_propagation_s']}s, "
+          f"ring moved {result['ring_movement']['moved_share']} on N+1", file=sys.stderr)
+    output = json.dumps(result, indent=2)
+    if args.out:
+        Path(args.out).write_text(output, encoding="utf-8")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Fleet simulator for load-testing the registration control plane.
+
+Starts N virtual reverse-proxy agents on one box. Each agent follows the
+start.sh flow against the real central scripts:
+
+    1. verdict check      -> check_blacklist.py <ip>            (IPHub stand-in)
+    2. project assignment -> GET /assign_project?ip=<ip>       (real port_api.py)
+    3. port scan          -> TCP connect to each candidate (the `nc -z` step)
+    4. mapping add        -> run_add_project_address.py <ip> <project> <port>
+    5. tunnel             -> bind 127.0.0.1:<port> (what sshd does for `ssh -R`),
+                             or a real `ssh -N -R` with --ssh user@host
+
+Scripts are started as separate processes, exactly like the SSH remote
+commands, or through a real local sshd with --ssh. Reports registrations
+per second, port-collision rate, lost mapping updates and time-to-online
+percentiles for every fleet size:
+
+    python3 bench/fleet_sim.py --agents 10,50,200 [--projects 3] [--latency-ms 20]
+    python3 bench/fleet_sim.py --agents 20 --ssh proxyuser@127.0.0.1
+"""
+import argparse
+import errno
+import json
+import math
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+FLUXSIGN_DIR = REPO_ROOT / "nginx" / "fluxsign"
+PROXYUSER_DIR = REPO_ROOT / "nginx" / "home" / "proxyuser"
+sys.path[:0] = [str(FLUXSIGN_DIR), str(Path(__file__).resolve().parent)]
+
+from mock_servers import start_iphub  # noqa: E402
+from port_api import PortAPIServer  # noqa: E402
+from trace_report import percentile  # noqa: E402
+
+
+def http_get_json(url: str) -> dict:
+    from urllib.request import urlopen
+    with urlopen(url, timeout=30) as response:
+        return json.loads(response.read() or b"{}")
+
+
+class Fleet:
+    def __init__(self, args, agents: int, work_dir: Path):
+        self.args = args
+        self.agents = agents
+        self.work_dir = work_dir
+        self.html_dir = work_dir / "html"
+        self.lock = threading.Lock()
+        self.tunnels = []
+        self.records = []
+        self.env = dict(os.environ)
+
+    # === Setup ===
+
+    def prepare(self, iphub_url: str):
+        self.html_dir.mkdir(parents=True, exist_ok=True)
+        per_project = math.ceil(self.agents * self.args.capacity / self.args.projects)
+        port_mapping, base = {}, self.args.base_port
+        for i in range(self.args.projects):
+            port_mapping[f"project{i + 1}"] = [f"{base}-{base + per_project - 1}"]
+            base += per_project
+        port_mapping["other"] = [f"{base}-{base + max(1, per_project // 2) - 1}"]
+        files = {
+            "port_mapping.json": port_mapping,
+            "ip_mapping.json": {p: [] for p in port_mapping},
+            "blacklist.json": {"blacklist": []},
+            "whitelist.json": {"whitelist": []},
+        }
+        for name, content in files.items():
+            (self.html_dir / name).write_text(json.dumps(content), encoding="utf-8")
+        self.env.update({
+            "NGINX_HTML_DIR": str(self.html_dir),
+            "FLUXSIGN_LOG_DIR": str(self.work_dir / "logs"),
+            "FLUXSIGN_DIR": str(FLUXSIGN_DIR),
+            "IPHUB_API_URL": f"{iphub_url}/ip/",
+            "IPHUB_API_KEY": "fleet",
+            "IPHUB_USAGE_LOG": str(self.work_dir / "iphub_api_usage.log"),
+            "DC_RANGES_DIR": str(self.work_dir / "dc_ranges"),
+        })
+
+    # === Remote commands (subprocess or real ssh) ===
+
+    def remote(self, script: Path, *argv: str) -> subprocess.CompletedProcess:
+        command = ["python3", str(script), *argv]
+        if self.args.ssh:
+            exports = " ".join(f"{k}={shlex.quote(self.env[k])}" for k in
+                               ("NGINX_HTML_DIR", "FLUXSIGN_LOG_DIR", "FLUXSIGN_DIR", "IPHUB_API_URL",
+                                "IPHUB_API_KEY", "IPHUB_USAGE_LOG", "DC_RANGES_DIR"))
+            command = ["ssh", "-o", "BatchMode=yes", "-o", "StrictHostKeyChecking=no", self.args.ssh,
+                       f"{exports} {shlex.join(command)}"]
+        return subprocess.run(command, capture_output=True, text=True, env=self.env)
+
+    def open_tunnel(self, port: int) -> Optional[object]:
+        """Returns a handle on success, None if the port is already taken (a collision)."""
+        if self.args.ssh:
+            proc = subprocess.Popen(
+                ["ssh", "-o", "BatchMode=yes", "-o", "StrictHostKeyChecking=no", "-o", "ExitOnForwardFailure=yes",
+                 "-N", "-R", f"127.0.0.1:{port}:127.0.0.1:9", self.args.ssh],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            for _ in range(50):
+                if proc.poll() is not None:
+                    return None
+                if port_is_busy(port):
+                    return proc
+                time.sleep(0.1)
+            proc.kill()
+            return None
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.bind(("127.0.0.1", port))
+            sock.listen(16)
+            return sock
+        except OSError as e:
+            sock.close()
+            if e.errno == errno.EADDRINUSE:
+                return None
+            raise
+
+    # === One agent ===
+
+    def run_agent(self, index: int, central_url: str, start_barrier: threading.Barrier):
+        ip = f"100.{64 + index // 65536}.{index // 256 % 256}.{index % 256}"
+        record = {"ip": ip, "online": False, "collisions": 0, "tunnel_attempts": 0, "project": None,
+                  "mapped": False, "stages": {}}
+        start_barrier.wait()
+        started = time.monotonic()
+
+        def stage(name, t0):
+            record["stages"][name] = round((time.monotonic() - t0) * 1000, 1)
+
+        t0 = time.monotonic()
+        verdict = self.remote(FLUXSIGN_DIR / "check_blacklist.py", ip).returncode
+        stage("verdict", t0)
+        record["verdict"] = verdict
+        if verdict != 0:
+            record["time_to_online_ms"] = None
+            return self._store(record)
+
+        for attempt in range(self.args.max_rounds):
+            t0 = time.monotonic()
+            assignment = http_get_json(f"{central_url}/assign_project?ip={ip}")
+            project, ports = assignment["project"], assignment["available_ports"]
+            if not ports and project != "other":
+                # Bound project is full: start.sh parks the node in 'other'
+                project = "other"
+                ports = http_get_json(f"{central_url}/available_ports")["other"]["available_ports"]
+            stage("discovery", t0)
+            record["project"] = project
+
+            for port in ports:
+                if port_is_busy(port):
+                    continue
+                t0 = time.monotonic()
+                response = self.remote(PROXYUSER_DIR / "run_add_project_address.py", ip, project, str(port))
+                stage("mapping_add", t0)
+                if project != "other" and response.stdout.strip().endswith("success"):
+                    record["mapped"] = True
+
+                record["tunnel_attempts"] += 1
+                handle = self.open_tunnel(port)
+                if handle is None:
+                    record["collisions"] += 1
+                    time.sleep(self.args.retry_delay)
+                    continue
+                with self.lock:
+                    self.tunnels.append(handle)
+                record.update(online=True, port=port, time_to_online_ms=round((time.monotonic() - started) * 1000, 1))
+                return self._store(record)
+            time.sleep(self.args.retry_delay)
+
+        record["time_to_online_ms"] = None
+        self._store(record)
+
+    def _store(self, record: dict):
+        with self.lock:
+            self.records.append(record)
+
+    # === Run ===
+
+    def close(self):
+        for handle in self.tunnels:
+            if isinstance(handle, socket.socket):
+                handle.close()
+            else:
+                handle.terminate()
+
+    def report(self, wall_s: float) -> dict:
+        online = [r for r in self.records if r["online"]]
+        ttl = [r["time_to_online_ms"] for r in online]
+        attempts = sum(r["tunnel_attempts"] for r in self.records)
+        collisions = sum(r["collisions"] for r in self.records)
+        stored = json.loads((self.html_dir / "ip_mapping.json").read_text(encoding="utf-8"))
+        stored_ips = {ip for ips in stored.values() for ip in ips}
+        claimed = [r for r in self.records if r["mapped"]]
+        lost = [r["ip"] for r in claimed if r["ip"] not in stored_ips]
+        stages = {}
+        for name in ("verdict", "discovery", "mapping_add"):
+            values = [r["stages"][name] for r in self.records if name in r["stages"]]
+            stages[name] = {"p50_ms": percentile(values, 50), "p99_ms": percentile(values, 99)}
+        return {
+            "agents": self.agents,
+            "online": len(online),
+            "in_other": sum(1 for r in online if r["project"] == "other"),
+            "failed": self.agents - len(online),
+            "wall_s": round(wall_s, 2),
+            "registrations_per_s": round(len(online) / wall_s, 2) if wall_s else 0.0,
+            "tunnel_attempts": attempts,
+            "port_collisions": collisions,
+            "collision_rate": round(collisions / attempts, 4) if attempts else 0.0,
+            "mapping_updates": len(claimed),
+            "lost_mapping_updates": len(lost),
+            "time_to_online_ms": {
+                "p50": percentile(ttl, 50),
+                "p99": percentile(ttl, 99),
+                "max": max(ttl) if ttl else None,
+            },
+            "stages": stages,
+        }
+
+
+def port_is_busy(port: int) -> bool:
+    """The `nc -z host port` check from start.sh."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.settimeout(1)
+        return sock.connect_ex(("127.0.0.1", port)) == 0
+
+
+def simulate(args, agents: int) -> dict:
+    work_dir = Path(tempfile.mkdtemp(prefix=f"flux-fleet-{agents}-"))
+    iphub = start_iphub(latency_ms=args.latency_ms, block_ratio=args.block_ratio)
+    fleet = Fleet(args, agents, work_dir)
+    fleet.prepare(iphub.url)
+    central = PortAPIServer(("127.0.0.1", 0), fleet.html_dir)
+    threading.Thread(target=central.serve_forever, daemon=True).start()
+
+    barrier = threading.Barrier(agents + 1)
+    threads = [threading.Thread(target=fleet.run_agent, args=(i, f"http://127.0.0.1:{central.server_address[1]}", barrier), daemon=True)
+               for i in range(agents)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    started = time.monotonic()
+    for t in threads:
+        t.join()
+    wall = time.monotonic() - started
+
+    try:
+        result = fleet.report(wall)
+        result["per_project"] = {p: len(ips) for p, ips in json.loads(
+            (fleet.html_dir / "ip_mapping.json").read_text(encoding="utf-8")).items()}
+        return result
+    finally:
+        fleet.close()
+        central.shutdown()
+        iphub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate N reverse-proxy agents registering at once")
+    parser.add_argument("--agents", default="10,50,100", help="comma-separated fleet sizes")
+    parser.add_argument("--projects", type=int, default=3)
+    parser.add_argument("--capacity", type=float, default=1.2, help="ports per agent across real projects")
+    parser.add_argument("--base-port", type=int, default=31000)
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="IPHub latency")
+    parser.add_argument("--block-ratio", type=float, default=0.0, help="share of IPs IPHub blocks")
+    parser.add_argument("--retry-delay", type=float, default=0.2, help="stands in for start.sh's 60 s sleeps")
+    parser.add_argument("--max-rounds", type=int, default=5)
+    parser.add_argument("--ssh", help="user@host of a local sshd; default binds sockets instead of ssh -R")
+    parser.add_argument("--out", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    from loguru import logger
+    logger.remove()  # port_api logs every assignment
+
+    results = []
+    for agents in [int(n) for n in args.agents.split(",") if n.strip()]:
+        result = simulate(args, agents)
+        print(f"  N={agents}: {result['registrations_per_s']} reg/s, collisions={result['collision_rate']}, "
+              f"lost={result['lost_mapping_updates']}, worst={result['time_to_online_ms']['max']}ms", file=sys.stderr)
+        results.append(result)
+
+    output = json.dumps({"mode": "ssh" if args.ssh else "stand-in", "results": results}, indent=2)
+    if args.out:
+        Path(args.out).write_text(output, encoding="utf-8")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
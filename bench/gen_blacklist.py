@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Synthetic blacklist generator (1k .. 10M entries).
+
+Entries are clustered inside a limited number of /16 networks so that
+optimize_blacklist.group_ips has something to promote, and a small share
+of entries are CIDR subnets like the ones the optimizer produces.
+
+    python3 bench/gen_blacklist.py 1000000 -o /tmp/blacklist.json
+"""
+import argparse
+import json
+import random
+from typing import List
+
+
+def generate_blacklist(size: int, seed: int = 1, subnet_ratio: float = 0.02, clusters: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    clusters = clusters or max(4, size // 2000)
+    bases = [(rng.randint(1, 223), rng.randint(0, 255)) for _ in range(clusters)]
+    entries = set()
+    while len(entries) < size:
+        a, b = bases[rng.randrange(clusters)]
+        c = rng.randint(0, 255)
+        if rng.random() < subnet_ratio:
+            entries.add(f"{a}.{b}.{c}.0/24")
+        else:
+            entries.add(f"{a}.{b}.{c}.{rng.randint(1, 254)}")
+    return list(entries)
+
+
+def random_ips(count: int, seed: int = 2) -> List[str]:
+    rng = random.Random(seed)
+    return [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+            for _ in range(count)]
+
+
+def write_blacklist(path: str, entries: List[str]):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"blacklist": entries}, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic blacklist.json")
+    parser.add_argument("size", type=int)
+    parser.add_argument("-o", "--output", default="blacklist.json")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--subnet-ratio", type=float, default=0.02)
+    args = parser.parse_args()
+    write_blacklist(args.output, generate_blacklist(args.size, args.seed, args.subnet_ratio))
+    print(f"✔ {args.size} entries written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Offline stand-ins for IPHub and the Flux API with configurable latency.
+
+IPHub:  GET /ip/<ip>                                   -> {"ip", "block"}
+Flux:   GET /apps/location?appname=                    -> {"status", "data": [{"ip": "host:port"}]}
+        GET /id/loginphrase                            -> {"status", "data"}
+        POST /id/providesign, POST /id/verifylogin     -> {"status": "success"}
+        GET /apps/appremove/<app>/..., /apps/apprestart/<app>
+
+The Flux stand-in also plays the node API, so instances reported by
+apps/location point back at it (127.0.0.1:<its port>) by default.
+
+Standalone:
+    python3 bench/mock_servers.py --iphub-port 18080 --flux-port 18081 --latency-ms 50
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import parse_qs, urlparse
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    server_version = "FluxMock/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _delay(self):
+        latency = self.server.latency_ms
+        if latency:
+            time.sleep(latency / 1000)
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _count(self, key: str):
+        with self.server.lock:
+            self.server.calls[key] = self.server.calls.get(key, 0) + 1
+
+
+class IPHubHandler(_MockHandler):
+    def do_GET(self):
+        self._delay()
+        path = urlparse(self.path).path
+        if not path.startswith("/ip/"):
+            return self._send_json({"error": "not found"}, 404)
+        if not self.headers.get("X-Key"):
+            return self._send_json({"error": "missing key"}, 403)
+        self._count("ip")
+        ip = path[len("/ip/"):]
+        # Deterministic verdict so repeated runs are comparable
+        digest = hashlib.sha1(ip.encode()).digest()[0]
+        block = 1 if digest < 256 * self.server.block_ratio else 0
+        self._send_json({"ip": ip, "countryCode": "ZZ", "asn": 64512, "isp": "mock", "block": block})
+
+
+class FluxHandler(_MockHandler):
+    def _instances(self) -> List[dict]:
+        return [{"ip": entry} for entry in self.server.instances]
+
+    def do_GET(self):
+        self._delay()
+        url = urlparse(self.path)
+        path = url.path
+        if path == "/apps/location":
+            self._count("location")
+            appname = parse_qs(url.query).get("appname", [""])[0]
+            return self._send_json({"status": "success", "data": self._instances() if appname else []})
+        if path == "/id/loginphrase":
+            self._count("loginphrase")
+            return self._send_json({"status": "success", "data": f"{int(time.time() * 1000)}mockphrase"})
+        if path.startswith("/apps/appremove/"):
+            self._count("appremove")
+            return self._send_json({"status": "success", "data": "removed"})
+        if path.startswith("/apps/apprestart/"):
+            self._count("apprestart")
+            return self._send_json({"status": "success", "data": "restarted"})
+        self._send_json({"status": "error"}, 404)
+
+    def do_POST(self):
+        self._delay()
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        path = urlparse(self.path).path
+        if path == "/id/providesign":
+            self._count("providesign")
+            return self._send_json({"status": "success", "data": {"message": "ok"}})
+        if path == "/id/verifylogin":
+            self._count("verifylogin")
+            return self._send_json({"status": "success", "data": {"message": "ok", "privilage": "admin"}})
+        self._send_json({"status": "error"}, 404)
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, port: int = 0, latency_ms: float = 0.0):
+        super().__init__(("127.0.0.1", port), handler)
+        self.latency_ms = latency_ms
+        self.block_ratio = 0.5
+        self.instances: List[str] = []
+        self.calls = {}
+        self.lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def start_iphub(port: int = 0, latency_ms: float = 0.0, block_ratio: float = 0.5) -> MockServer:
+    server = MockServer(IPHubHandler, port, latency_ms)
+    server.block_ratio = block_ratio
+    return server.start()
+
+
+def start_flux(port: int = 0, latency_ms: float = 0.0, instances: Optional[List[str]] = None) -> MockServer:
+    server = MockServer(FluxHandler, port, latency_ms)
+    server.instances = instances if instances is not None else [f"127.0.0.1:{server.server_address[1]}"]
+    return server.start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline IPHub and Flux API stand-ins")
+    parser.add_argument("--iphub-port", type=int, default=18080)
+    parser.add_argument("--flux-port", type=int, default=18081)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--block-ratio", type=float, default=0.5, help="share of IPs IPHub reports as block=1")
+    args = parser.parse_args()
+
+    iphub = start_iphub(args.iphub_port, args.latency_ms, args.block_ratio)
+    flux = start_flux(args.flux_port, args.latency_ms)
+    print(f"IPHUB_API_URL={iphub.url}/ip/")
+    print(f"FLUX_API_URL={flux.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        iphub.stop()
+        flux.stop()
+
+
+if __name__ == "__main__":
+    main()
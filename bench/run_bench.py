@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for the central scripts.
+
+Runs entirely against local stand-ins (bench/mock_servers.py) and
+synthetic data in a temporary directory (removed afterwards unless --keep
+is given), and prints one JSON document:
+
+    {"meta": {...}, "results": [{"name", "params", "ops", "throughput_ops_s", "p50_ms", "p99_ms", ...}]}
+
+Usage:
+    python3 bench/run_bench.py [--sizes 1000,10000,100000] [--writers 1,4,16]
+                               [--latency-ms 20] [--out bench.json]
+                               [--baseline previous.json --tolerance 0.25] [--keep]
+
+With --baseline the run exits with code 1 if any case got slower (p99) or
+lost throughput beyond the tolerance, so it can gate regressions.
+"""
+import argparse
+import ipaddress
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+FLUXSIGN_DIR = REPO_ROOT / "nginx" / "fluxsign"
+PROXYUSER_DIR = REPO_ROOT / "nginx" / "home" / "proxyuser"
+# Set by use_work_dir() in main(), before the scripts are imported
+WORK_DIR: Path = None
+HTML_DIR: Path = None
+sys.path[:0] = [str(FLUXSIGN_DIR), str(PROXYUSER_DIR), str(Path(__file__).resolve().parent)]
+
+from gen_blacklist import generate_blacklist, random_ips  # noqa: E402
+from mock_servers import start_flux, start_iphub  # noqa: E402
+from trace_report import percentile  # noqa: E402
+
+
+def use_work_dir(work_dir: Path):
+    global WORK_DIR, HTML_DIR
+    WORK_DIR, HTML_DIR = work_dir, work_dir / "html"
+    # The scripts read their paths and endpoints from the environment at import time
+    os.environ.update({
+        "NGINX_HTML_DIR": str(HTML_DIR),
+        "FLUXSIGN_LOG_DIR": str(WORK_DIR / "logs"),
+        "FLUXSIGN_DIR": str(FLUXSIGN_DIR),
+        "IPHUB_USAGE_LOG": str(WORK_DIR / "iphub_api_usage.log"),
+        "DC_RANGES_DIR": str(WORK_DIR / "dc_ranges"),
+        "IPHUB_API_KEY": "bench",
+        "APP_NAME": "benchapp",
+        "FLUX_ID": "bench",
+    })
+
+
+def reset_html_dir(port_mapping: dict = None):
+    HTML_DIR.mkdir(parents=True, exist_ok=True)
+    files = {
+        "blacklist.json": {"blacklist": []},
+        "whitelist.json": {"whitelist": []},
+        "ip_mapping.json": {"bench": [], "other": []},
+        "port_mapping.json": port_mapping or {"bench": [20000], "other": []},
+    }
+    for name, content in files.items():
+        (HTML_DIR / name).write_text(json.dumps(content), encoding="utf-8")
+
+
+def result(name: str, params: dict, latencies_ms: List[float], wall_s: float, **extra) -> dict:
+    entry = {
+        "name": name,
+        "params": params,
+        "ops": len(latencies_ms),
+        "throughput_ops_s": round(len(latencies_ms) / wall_s, 2) if wall_s > 0 else 0.0,
+        "p50_ms": round(percentile(latencies_ms, 50), 3),
+        "p99_ms": round(percentile(latencies_ms, 99), 3),
+    }
+    entry.update(extra)
+    print(f"  {name} {params}: {entry['throughput_ops_s']} ops/s, p50={entry['p50_ms']}ms, p99={entry['p99_ms']}ms",
+          file=sys.stderr)
+    return entry
+
+
+def timed_loop(fn: Callable[[int], None], count: int, max_seconds: float):
+    """Calls fn(i) up to count times or until the time budget runs out."""
+    latencies = []
+    started = time.perf_counter()
+    for i in range(count):
+        t0 = time.perf_counter()
+        fn(i)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        if time.perf_counter() - started > max_seconds:
+            break
+    return latencies, time.perf_counter() - started
+
+
+# === Cases ===
+
+def bench_is_ip_in_list(sizes: List[int], lookups: int, max_seconds: float) -> List[dict]:
+    import check_blacklist
+
+    results = []
+    for size in sizes:
+        entries = generate_blacklist(size)
+        singles = [e for e in entries if "/" not in e]
+        rng = random.Random(size)
+        # Half hits, half (almost certainly) misses
+        probes = [rng.choice(singles) for _ in range(lookups // 2)] + random_ips(lookups - lookups // 2)
+        rng.shuffle(probes)
+        latencies, wall = timed_loop(lambda i: check_blacklist.is_ip_in_list(probes[i], entries), len(probes),
+                                     max_seconds)
+        results.append(result("is_ip_in_list", {"size": size}, latencies, wall))
+    return results
+
+
+def bench_dc_ranges(sizes: List[int], lookups: int, max_seconds: float) -> List[dict]:
+    import dc_ranges
+
+    results = []
+    for size in sizes:
+        rng = random.Random(size)
+        directory = WORK_DIR / f"dc_ranges_{size}"
+        directory.mkdir(exist_ok=True)
+        with open(directory / "bench.csv", "w", encoding="utf-8") as f:
+            f.write("prefix,provider\n")
+            for i in range(size):
+                base = rng.getrandbits(32)
+                if i % 2:
+                    prefix = rng.randint(16, 28)
+                    f.write(f"{ipaddress.ip_network((base >> (32 - prefix) << (32 - prefix), prefix))},cloud-{i % 7}\n")
+                else:
+                    span_size = rng.randint(1, 4096)
+                    f.write(f"{ipaddress.ip_address(base)},{ipaddress.ip_address(min(base + span_size, 2 ** 32 - 1))},AS{i}\n")
+
+        started = time.perf_counter()
+        index = dc_ranges.load_index(directory)
+        compile_s = time.perf_counter() - started
+        started = time.perf_counter()
+        dc_ranges.load_index(directory)
+        cached_s = time.perf_counter() - started
+
+        probes = random_ips(lookups, seed=size)
+        hits = []
+        latencies, wall = timed_loop(lambda i: hits.append(index.lookup(probes[i]) is not None), len(probes),
+                                     max_seconds)
+        results.append(result("dc_range_lookup", {"size": size}, latencies, wall,
+                              ranges=len(index), compile_ms=round(compile_s * 1000, 1),
+                              cached_load_ms=round(cached_s * 1000, 1), hit_ratio=round(sum(hits) / len(hits), 3)))
+    return results
+
+
+def bench_group_ips(sizes: List[int], max_seconds: float) -> List[dict]:
+    import optimize_blacklist
+
+    results = []
+    for size in sizes:
+        entries = generate_blacklist(size)
+        latencies, wall = timed_loop(
+            lambda i: optimize_blacklist.group_ips(entries, optimize_blacklist.MIN_IPS_PER_24,
+                                                   optimize_blacklist.RATIO_24_PER_16,
+                                                   optimize_blacklist.RATIO_16_PER_8),
+            3, max_seconds)
+        results.append(result("group_ips", {"size": size}, latencies, wall,
+                              entries_per_s=round(size * len(latencies) / wall, 1)))
+    return results
+
+
+def _add_ip_writer(args):
+    writer, count = args
+    import run_add_project_address
+
+    latencies = []
+    for i in range(count):
+        ip = f"10.{writer % 256}.{i // 250 % 256}.{i % 250 + 1}"
+        t0 = time.perf_counter()
+        run_add_project_address.add_ip_to_project(ip, "bench", 20000)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return latencies
+
+
+def bench_add_ip(writers_list: List[int], per_writer: int) -> List[dict]:
+    import logging
+
+    logging.disable(logging.CRITICAL)
+    results = []
+    ctx = multiprocessing.get_context("fork")
+    for writers in writers_list:
+        reset_html_dir()
+        started = time.perf_counter()
+        with ctx.Pool(writers) as pool:
+            per_process = pool.map(_add_ip_writer, [(w, per_writer) for w in range(writers)])
+        wall = time.perf_counter() - started
+        latencies = [lat for chunk in per_process for lat in chunk]
+        stored = json.loads((HTML_DIR / "ip_mapping.json").read_text(encoding="utf-8")).get("bench", [])
+        expected = writers * per_writer
+        results.append(result("add_ip_to_project", {"writers": writers, "per_writer": per_writer}, latencies, wall,
+                              expected_ips=expected, stored_ips=len(set(stored)),
+                              lost_updates=expected - len(set(stored))))
+    logging.disable(logging.NOTSET)
+    return results
+
+
+def _run_script_main(fn: Callable[[], None], argv: List[str]) -> int:
+    saved = sys.argv
+    sys.argv = argv
+    try:
+        return fn() or 0
+    except SystemExit as e:
+        return e.code or 0
+    finally:
+        sys.argv = saved
+
+
+def bench_flows(latency_ms: float, runs: int, max_seconds: float) -> List[dict]:
+    iphub = start_iphub(latency_ms=latency_ms)
+    flux = start_flux(latency_ms=latency_ms)
+    try:
+        import check_blacklist
+        import remove_app
+        import restart_app
+
+        remove_app.FLUX_API_URL = restart_app.FLUX_API_URL = flux.url
+        check_blacklist.API_URL = f"{iphub.url}/ip/"
+        # The node signer (sudo node sign_message.js) is replaced by a constant signature
+        remove_app.sign_message_in_js = lambda message: "bench-signature"
+        restart_app.sign_message = lambda message, key: "bench-signature"
+        check_blacklist.API_DAILY_LIMIT = 10 ** 9
+
+        results = []
+        reset_html_dir()
+        probes = random_ips(runs, seed=7)
+        latencies, wall = timed_loop(lambda i: _run_script_main(lambda: check_blacklist.run_full_check(probes[i]), []),
+                                     runs, max_seconds)
+        results.append(result("check_flow_iphub", {"latency_ms": latency_ms}, latencies, wall,
+                              iphub_calls=iphub.calls.get("ip", 0)))
+
+        exit_codes = []
+        latencies, wall = timed_loop(
+            lambda i: exit_codes.append(_run_script_main(remove_app.compare_and_remove, ["remove_app.py", "127.0.0.1"])),
+            runs, max_seconds)
+        results.append(result("remove_flow", {"latency_ms": latency_ms}, latencies, wall,
+                              failures=sum(1 for c in exit_codes if c)))
+
+        exit_codes = []
+        latencies, wall = timed_loop(
+            lambda i: exit_codes.append(_run_script_main(restart_app.main, ["restart_app.py", "127.0.0.1"])),
+            runs, max_seconds)
+        results.append(result("restart_flow", {"latency_ms": latency_ms}, latencies, wall,
+                              failures=sum(1 for c in exit_codes if c)))
+        return results
+    finally:
+        iphub.stop()
+        flux.stop()
+
+
+# === Regression check ===
+
+def compare_with_baseline(results: List[dict], baseline_path: str, tolerance: float) -> List[str]:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        old = baseline.get((r["name"], json.dumps(r["params"], sort_keys=True)))
+        if not old:
+            continue
+        if old["p99_ms"] and r["p99_ms"] > old["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{r['name']} {r['params']}: p99 {old['p99_ms']}ms -> {r['p99_ms']}ms")
+        if old["throughput_ops_s"] and r["throughput_ops_s"] < old["throughput_ops_s"] * (1 - tolerance):
+            regressions.append(
+                f"{r['name']} {r['params']}: throughput {old['throughput_ops_s']} -> {r['throughput_ops_s']} ops/s")
+    return regressions
+
+
+def parse_int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the central scripts")
+    parser.add_argument("--sizes", type=parse_int_list, default=[1000, 10000, 100000],
+                        help="blacklist sizes (up to 10000000)")
+    parser.add_argument("--lookups", type=int, default=200, help="is_ip_in_list probes per size")
+    parser.add_argument("--writers", type=parse_int_list, default=[1, 4, 16], help="concurrent add_ip_to_project writers")
+    parser.add_argument("--per-writer", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="mock IPHub/Flux latency")
+    parser.add_argument("--flow-runs", type=int, default=20)
+    parser.add_argument("--max-seconds", type=float, default=30.0, help="time budget per case")
+    parser.add_argument("--only", default="", help="comma-separated subset: lookup,ranges,group,add_ip,flows")
+    parser.add_argument("--out", help="write JSON here instead of stdout")
+    parser.add_argument("--baseline", help="previous JSON output to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--keep", action="store_true", help="keep the generated data and logs")
+    args = parser.parse_args()
+
+    out_path = Path(args.out).resolve() if args.out else None
+    baseline_path = Path(args.baseline).resolve() if args.baseline else None
+
+    work_dir = Path(tempfile.mkdtemp(prefix="flux-bench-"))
+    cwd = os.getcwd()
+    try:
+        run(args, work_dir, out_path, baseline_path)
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f"Data and logs kept in {work_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run(args, work_dir: Path, out_path, baseline_path):
+    use_work_dir(work_dir)
+    os.chdir(WORK_DIR)  # restart_app.py opens its log under ./logs at import time
+    import check_blacklist  # noqa: F401
+    import optimize_blacklist  # noqa: F401
+    import remove_app  # noqa: F401
+    import restart_app  # noqa: F401
+    from loguru import logger
+    logger.remove()  # the scripts log every step; keep benchmark output clean
+
+    only = set(filter(None, args.only.split(",")))
+    results = []
+    if not only or "lookup" in only:
+        results += bench_is_ip_in_list(args.sizes, args.lookups, args.max_seconds)
+    if not only or "ranges" in only:
+        results += bench_dc_ranges(args.sizes, args.lookups, args.max_seconds)
+    if not only or "group" in only:
+        results += bench_group_ips(args.sizes, args.max_seconds)
+    if not only or "add_ip" in only:
+        results += bench_add_ip(args.writers, args.per_writer)
+    if not only or "flows" in only:
+        results += bench_flows(args.latency_ms, args.flow_runs, args.max_seconds)
+
+    report = {
+        "meta": {
+            "timestamp": int(time.time()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if out_path:
+        out_path.write_text(output, encoding="utf-8")
+    else:
+        print(output)
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, str(baseline_path), args.tolerance)
+        for line in regressions:
+            print(f"❌ Regression: {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Several central nodes (nginx + sshd + port_api.py) sharing one fleet.
+
+central_nodes.json (CENTRAL_NODES_FILE, same file on every node) lists the
+nodes; CENTRAL_NODE_ID in each node's .env says which entry it is:
+
+    {"nodes": {
+        "central-1": {"host": "185.0.0.1", "api_port": 8080, "ssh_port": 22,
+                      "peer_url": "http://10.0.0.1:8081", "control_url": "https://185.0.0.1:8443"},
+        "central-2": {"host": "185.0.0.2", "api_port": 8080, "ssh_port": 22,
+                      "peer_url": "http://10.0.0.2:8081", "weight": 2}
+    }}
+
+host/api_port/ssh_port/control_url are what containers connect to,
+peer_url is where the other port_api.py instances pull replicas from
+(replication.py). Every real project is owned by one node, chosen by
+consistent hashing of the project name, so adding a node moves only about
+1/N of the projects. 'other' is served by every node: a port is only taken
+on the host whose sshd listens on it.
+
+Without the file or without CENTRAL_NODE_ID the tier is a single node and
+nothing changes.
+"""
+import hashlib
+import json
+import os
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from port_mapping import OTHER_PROJECT
+
+CENTRAL_NODES_FILE = Path(os.getenv("CENTRAL_NODES_FILE", "/fluxsign/central_nodes.json"))
+CENTRAL_NODE_ID = os.getenv("CENTRAL_NODE_ID", "").strip()
+# Points per unit of weight on the ring; more points give a more even split
+RING_POINTS = int(os.getenv("CENTRAL_RING_POINTS", 64))
+# Fields a container needs to switch to a node
+PUBLIC_FIELDS = ("host", "api_port", "ssh_port", "control_url")
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.sha1(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, nodes: Dict[str, dict], points: int = RING_POINTS):
+        ring = []
+        for node_id, node in nodes.items():
+            for i in range(max(1, int(points * float(node.get("weight", 1))))):
+                ring.append((_hash(f"{node_id}#{i}"), node_id))
+        ring.sort()
+        self._keys = [key for key, _ in ring]
+        self._nodes = [node_id for _, node_id in ring]
+
+    def node_for(self, project: str) -> Optional[str]:
+        if not self._keys:
+            return None
+        pos = bisect_right(self._keys, _hash(project)) % len(self._keys)
+        return self._nodes[pos]
+
+
+class CentralNodes:
+    def __init__(self, nodes: Dict[str, dict], self_id: str):
+        if self_id and nodes and self_id not in nodes:
+            raise ValueError(f"CENTRAL_NODE_ID {self_id} is not in central_nodes.json")
+        self.nodes = nodes
+        self.self_id = self_id
+        self.ring = HashRing(nodes)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.self_id) and len(self.nodes) > 1
+
+    def owner(self, project: str) -> str:
+        """Node serving project's tunnels; 'other' and single-node setups are served locally."""
+        if not self.enabled or project == OTHER_PROJECT:
+            return self.self_id
+        return self.ring.node_for(project)
+
+    def owns(self, project: str) -> bool:
+        return self.owner(project) == self.self_id
+
+    def peers(self) -> List[str]:
+        return [node_id for node_id in self.nodes if node_id != self.self_id] if self.enabled else []
+
+    def public_info(self, node_id: str) -> dict:
+        node = self.nodes.get(node_id, {})
+        info = {"id": node_id}
+        info.update({key: node[key] for key in PUBLIC_FIELDS if key in node})
+        return info
+
+
+def load_nodes(path: Path = CENTRAL_NODES_FILE, self_id: str = CENTRAL_NODE_ID) -> CentralNodes:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            nodes = json.load(f).get("nodes", {})
+    except FileNotFoundError:
+        nodes = {}
+    return CentralNodes(nodes, self_id)
@@ -1,5 +1,6 @@
 import sys
 import json
+import time
 import ipaddress
 import requests
 from loguru import logger
@@ -8,6 +9,10 @@ from datetime import datetime
 from dotenv import load_dotenv
 import os
 
+import dc_ranges
+from ip_leases import load_json, mapping_lock, write_json_atomic
+from trace_span import span
+
 # === Load .env ===
 ENV_PATH = Path("/fluxsign/.env")
 if ENV_PATH.exists():
@@ -19,13 +24,32 @@ USE_API = True
 
 # === Config from .env or defaults ===
 API_KEY = os.getenv("IPHUB_API_KEY", "").strip()
-BLACKLIST_FILE = Path("/usr/share/nginx/html/blacklist.json")
-WHITELIST_FILE = Path("/usr/share/nginx/html/whitelist.json")
-API_URL = "https://v2.api.iphub.info/ip/"
-API_USAGE_LOG = Path("/tmp/iphub_api_usage.log")
+HTML_DIR = Path(os.getenv("NGINX_HTML_DIR", "/usr/share/nginx/html"))
+BLACKLIST_FILE = HTML_DIR / "blacklist.json"
+WHITELIST_FILE = HTML_DIR / "whitelist.json"
+# {ip: unix time of the last IPHub verdict}; prescreen.py re-checks verdicts that go stale
+VERDICT_TIMES_FILE = HTML_DIR / "verdict_times.json"
+# flock shared by every writer of the lists: SSH checks, control_api.py threads,
+# prescreen.py and optimize_blacklist.py
+LISTS_LOCK_FILE = HTML_DIR / ".lists.lock"
+API_URL = os.getenv("IPHUB_API_URL", "https://v2.api.iphub.info/ip/")
+API_USAGE_LOG = Path(os.getenv("IPHUB_USAGE_LOG", "/tmp/iphub_api_usage.log"))
+# One line per IPHub request; appends and pruning hold this flock
+API_USAGE_LOCK = API_USAGE_LOG.with_name(API_USAGE_LOG.name + ".lock")
 API_DAILY_LIMIT = 990
 LOG_FILE_PATH = "/tmp/check_blacklist.log"
 
+# Exit codes of this script (start.sh reacts to them) and their log labels
+CHECK_RESULTS = {
+    0: "GOOD",
+    1: "BLACKLIST_HIT",
+    2: "INVALID_IP",
+    3: "BLOCKED_BY_API",  # also BLOCKED_BY_RANGE (dc_ranges.py)
+    4: "ERROR_API_LIMIT",
+    5: "ERROR_API_RESPONSE",
+    6: "ERROR_NO_API_KEY",
+}
+
 # === Configure Loguru ===
 logger.add(sys.stderr, format="{time} {level} {message}", level="INFO")
 logger.add(
@@ -52,12 +76,15 @@ def load_json_list(path: Path, key: str) -> list:
         return []
 
 def save_json_list(path: Path, key: str, data: list):
+    """Atomic replace; callers that read-modify-write hold lists_lock()."""
     try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump({key: sorted(set(data))}, f, indent=2)
+        write_json_atomic(path, {key: sorted(set(data))}, indent=2, separators=(",", ": "))
     except Exception as e:
         logger.error(f"Failed to save {path}: {e}")
 
+def lists_lock():
+    return mapping_lock(LISTS_LOCK_FILE)
+
 def is_ip_in_list(ip: str, ip_list: list) -> bool:
     try:
         ip_obj = ipaddress.ip_address(ip.strip())
@@ -76,24 +103,28 @@ def is_ip_in_list(ip: str, ip_list: list) -> bool:
     return False
 
 def get_api_usage_today() -> int:
+    """Requests logged today; lines of earlier days are pruned under the usage lock."""
     today = datetime.now().date().isoformat()
-    if not API_USAGE_LOG.exists():
-        return 0
     try:
-        with open(API_USAGE_LOG, "r") as f:
-            lines = [line.strip() for line in f if line.strip()]
-        today_lines = [line for line in lines if line == today]
-        with open(API_USAGE_LOG, "w") as f:
-            f.write("\n".join(today_lines) + "\n")
-        return len(today_lines)
+        with mapping_lock(API_USAGE_LOCK):
+            if not API_USAGE_LOG.exists():
+                return 0
+            with open(API_USAGE_LOG, "r") as f:
+                lines = [line.strip() for line in f if line.strip()]
+            today_lines = [line for line in lines if line == today]
+            if len(today_lines) != len(lines):
+                with open(API_USAGE_LOG, "w") as f:
+                    f.write("".join(f"{line}\n" for line in today_lines))
+            return len(today_lines)
     except Exception as e:
         logger.error(f"Failed to process API usage log: {e}")
         return 0
 
 def increment_api_usage():
     today = datetime.now().date().isoformat()
-    with open(API_USAGE_LOG, "a") as f:
-        f.write(f"{today}\n")
+    with mapping_lock(API_USAGE_LOCK):
+        with open(API_USAGE_LOG, "a") as f:
+            f.write(f"{today}\n")
 
 def check_with_iphub(ip: str) -> dict:
     try:
@@ -107,58 +138,102 @@ def check_with_iphub(ip: str) -> dict:
         logger.error(f"Exception during IPHub request: {e}")
         return {}
 
+def record_verdict(ip: str, blocked: bool):
+    """Stores an IPHub verdict: adds ip to one list, drops it from the other, stamps the time."""
+    target, other = (BLACKLIST_FILE, "blacklist"), (WHITELIST_FILE, "whitelist")
+    if not blocked:
+        target, other = other, target
+    with lists_lock():
+        entries = load_json_list(*target)
+        entries.append(ip)
+        save_json_list(*target, entries)
+        other_entries = load_json_list(*other)
+        if ip in other_entries:
+            save_json_list(*other, [entry for entry in other_entries if entry != ip])
+        try:
+            times = load_json(VERDICT_TIMES_FILE, {})
+            times[ip] = int(time.time())
+            write_json_atomic(VERDICT_TIMES_FILE, times)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to update {VERDICT_TIMES_FILE}: {e}")
+
 # === Legacy mode (blacklist only) ===
 
-def run_legacy_check(ip: str):
+def run_legacy_check(ip: str) -> int:
     blacklist = load_json_list(BLACKLIST_FILE, "blacklist")
     if is_ip_in_list(ip, blacklist):
         logger.warning(f"{ip} found in blacklist")
         logger.info(f"{ip} | BLACKLIST_HIT")
-        sys.exit(1)
+        return 1
     logger.info(f"{ip} not found in blacklist")
     logger.info(f"{ip} | GOOD")
-    sys.exit(0)
-
-# === Full mode (blacklist → whitelist → IPHub) ===
-
-def run_full_check(ip: str):
-    blacklist = load_json_list(BLACKLIST_FILE, "blacklist")
-    if is_ip_in_list(ip, blacklist):
-        logger.warning(f"{ip} found in blacklist")
-        logger.info(f"{ip} | BLACKLIST_HIT")
-        sys.exit(1)
-
-    whitelist = load_json_list(WHITELIST_FILE, "whitelist")
-    if is_ip_in_list(ip, whitelist):
-        logger.info(f"{ip} found in whitelist")
-        logger.info(f"{ip} | GOOD")
-        sys.exit(0)
+    return 0
+
+# === Full mode (blacklist → whitelist → datacenter ranges → IPHub) ===
+
+def run_full_check(ip: str) -> int:
+    with span("blacklist_lookup", ip=ip):
+        blacklist = load_json_list(BLACKLIST_FILE, "blacklist")
+        if is_ip_in_list(ip, blacklist):
+            logger.warning(f"{ip} found in blacklist")
+            logger.info(f"{ip} | BLACKLIST_HIT")
+            return 1
+
+    with span("whitelist_lookup", ip=ip):
+        whitelist = load_json_list(WHITELIST_FILE, "whitelist")
+        if is_ip_in_list(ip, whitelist):
+            logger.info(f"{ip} found in whitelist")
+            logger.info(f"{ip} | GOOD")
+            return 0
+
+    # Известные диапазоны дата-центров блокируются локально, без квоты IPHub
+    with span("dc_range_lookup", ip=ip):
+        dc_label = dc_ranges.lookup(ip)
+    if dc_label is not None:
+        logger.warning(f"{ip} is in a datacenter range ({dc_label})")
+        logger.info(f"{ip} | BLOCKED_BY_RANGE")
+        return 3
 
     if get_api_usage_today() >= API_DAILY_LIMIT:
         logger.error(f"API usage limit reached: {API_DAILY_LIMIT}")
         logger.info(f"{ip} | ERROR_API_LIMIT")
-        sys.exit(4)
+        return 4
 
-    data = check_with_iphub(ip)
+    with span("iphub_request", ip=ip):
+        data = check_with_iphub(ip)
     if not data or "block" not in data:
         logger.error("IPHub API error or invalid response")
         logger.info(f"{ip} | ERROR_API_RESPONSE")
-        sys.exit(5)
+        return 5
 
     increment_api_usage()
 
     if data["block"] == 1:
         logger.warning(f"{ip} is classified as bad (data center or proxy)")
         logger.info(f"{ip} | BLOCKED_BY_API")
-        blacklist.append(ip)
-        save_json_list(BLACKLIST_FILE, "blacklist", blacklist)
-        sys.exit(3)
+        record_verdict(ip, blocked=True)
+        return 3
     else:
         logger.info(f"{ip} is classified as good (residential)")
         logger.info(f"{ip} | GOOD")
-        whitelist.append(ip)
-        save_json_list(WHITELIST_FILE, "whitelist", whitelist)
-        sys.exit(0)
+        record_verdict(ip, blocked=False)
+        return 0
+
+
+def check_ip(ip: str) -> int:
+    """Full check of one IP; returns the script's exit code (see CHECK_RESULTS)."""
+    try:
+        ipaddress.ip_address(ip.strip())
+    except ValueError:
+        logger.error(f"Invalid IP address: {ip}")
+        return 2
+    if not USE_API:
+        return run_legacy_check(ip)
+    if not API_KEY:
+        logger.error("IPHUB_API_KEY is not set in .env")
+        logger.info(f"{ip} | ERROR_NO_API_KEY")
+        return 6
+    return run_full_check(ip)
 
 # === Entry point ===
 
@@ -169,11 +244,5 @@ if __name__ == "__main__":
 
     ip_to_check = sys.argv[1]
 
-    if USE_API:
-        if not API_KEY:
-            logger.error("IPHUB_API_KEY is not set in .env")
-            logger.info(f"{ip_to_check} | ERROR_NO_API_KEY")
-            sys.exit(6)
-        run_full_check(ip_to_check)
-    else:
-        run_legacy_check(ip_to_check)
+    with span("check_blacklist", ip=ip_to_check):
+        sys.exit(check_ip(ip_to_check))
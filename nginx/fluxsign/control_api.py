@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Central control API: the mutations that used to run as SSH remote commands,
+served in-process by one resident server.
+
+All endpoints are POST with a JSON body and require
+"Authorization: Bearer <CONTROL_API_TOKEN>". X-Trace-Id is honoured.
+
+POST /check        {"ip"}                        -> {"ip", "code", "verdict"}
+POST /add-mapping  {"ip", "project", "port"[, "slot"]}  -> {"ip", "result"}
+POST /register     {"ip", "project", "port"[, "slot"]}  -> {"ip", "code", "verdict", "result"}
+POST /heartbeat    {"ip"[, "port", "traffic"]}   -> {"ip", "result"}
+POST /remove       {"ip"}                        -> {"ip", "code"}
+POST /restart      {"ip"}                        -> {"ip", "code"}
+POST /waitlist     {"ip", "project"}             -> {"ip", "project", "position"}
+
+"code" is the exit code the matching script would have returned
+(check_blacklist.py, remove_app.py, restart_app.py), so callers keep their
+existing handling. /register is /check followed by /add-mapping when the IP
+is clean. The SSH scripts in /home/proxyuser stay as thin wrappers that call
+this API and fall back to running the script when it is unavailable.
+
+Run from /fluxsign (remove_app.py and restart_app.py read .env and write
+logs relative to the working directory):
+    cd /fluxsign && python3 control_api.py
+"""
+import hmac
+import ipaddress
+import json
+import os
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from dotenv import load_dotenv
+from loguru import logger
+
+ENV_PATH = Path("/fluxsign/.env")
+if ENV_PATH.exists():
+    load_dotenv(dotenv_path=ENV_PATH)
+
+# Логика регистрации и heartbeat живёт в скриптах proxyuser
+sys.path.append(os.getenv("PROXYUSER_DIR", "/home/proxyuser"))
+
+import check_blacklist  # noqa: E402
+import remove_app  # noqa: E402
+import restart_app  # noqa: E402
+from ip_leases import TRAFFIC_COUNTERS  # noqa: E402
+from run_add_project_address import add_ip_to_project  # noqa: E402
+from run_heartbeat import heartbeat  # noqa: E402
+from trace_span import span, trace_context  # noqa: E402
+from waitlist import join as join_waitlist  # noqa: E402
+
+API_HOST = os.getenv("CONTROL_API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("CONTROL_API_PORT", 8082))
+API_TOKEN = os.getenv("CONTROL_API_TOKEN", "").strip()
+MAX_BODY = 64 * 1024
+# Upper bound for the tunnel slot of one node (TUNNELS_PER_NODE in start.sh)
+MAX_TUNNEL_SLOTS = int(os.getenv("MAX_TUNNEL_SLOTS", 8))
+
+
+def require_ip(payload: dict) -> str:
+    ip = str(payload.get("ip", "")).strip()
+    ipaddress.ip_address(ip)  # ValueError -> 400
+    return ip
+
+
+def require_port(payload: dict, required: bool = True):
+    if payload.get("port") in (None, "") and not required:
+        return None
+    return int(payload["port"])
+
+
+def require_slot(payload: dict) -> int:
+    slot = int(payload.get("slot") or 0)
+    if not 0 <= slot < MAX_TUNNEL_SLOTS:
+        raise ValueError(f"slot must be in 0..{MAX_TUNNEL_SLOTS - 1}")
+    return slot
+
+
+def do_check(payload: dict) -> dict:
+    ip = require_ip(payload)
+    with span("check_blacklist", ip=ip) as fields:
+        code = check_blacklist.check_ip(ip)
+        fields["code"] = code
+    return {"ip": ip, "code": code, "verdict": check_blacklist.CHECK_RESULTS.get(code, "UNKNOWN")}
+
+
+def do_add_mapping(payload: dict) -> dict:
+    ip, project, port = require_ip(payload), str(payload["project"]), require_port(payload)
+    slot = require_slot(payload)
+    with span("add_project_address", ip=ip, project=project, port=port, slot=slot) as fields:
+        result = add_ip_to_project(ip, project, port, slot)
+        fields["result"] = result
+    return {"ip": ip, "result": result}
+
+
+def do_register(payload: dict) -> dict:
+    response = do_check(payload)
+    response["result"] = None
+    if response["code"] == 0:
+        response["result"] = do_add_mapping(payload)["result"]
+    return response
+
+
+def require_traffic(payload: dict):
+    traffic = payload.get("traffic")
+    if traffic in (None, ""):
+        return None
+    if not isinstance(traffic, dict):
+        raise ValueError("traffic must be an object")
+    return {key: int(value) for key, value in traffic.items() if key in TRAFFIC_COUNTERS + ("seconds",)}
+
+
+def do_heartbeat(payload: dict) -> dict:
+    ip, port = require_ip(payload), require_port(payload, required=False)
+    slot = require_slot(payload) if "slot" in payload else None
+    return {"ip": ip, "result": heartbeat(ip, port, require_traffic(payload), slot)}
+
+
+def do_remove(payload: dict) -> dict:
+    ip = require_ip(payload)
+    with span("remove_app", ip=ip) as fields:
+        code = remove_app.remove_by_ip(ip)
+        fields["exit_code"] = code
+    return {"ip": ip, "code": code}
+
+
+def do_restart(payload: dict) -> dict:
+    ip = require_ip(payload)
+    with span("restart_app", ip=ip) as fields:
+        code = 0 if restart_app.restart_by_ip(ip) else 1
+        fields["exit_code"] = code
+    return {"ip": ip, "code": code}
+
+
+def do_waitlist(payload: dict) -> dict:
+    ip, project = require_ip(payload), str(payload["project"])
+    with span("join_waitlist", ip=ip, project=project) as fields:
+        position = join_waitlist(ip, project)
+        fields["position"] = position
+    return {"ip": ip, "project": project, "position": position}
+
+
+ENDPOINTS = {
+    "/check": do_check,
+    "/add-mapping": do_add_mapping,
+    "/register": do_register,
+    "/heartbeat": do_heartbeat,
+    "/remove": do_remove,
+    "/restart": do_restart,
+    "/waitlist": do_waitlist,
+}
+
+
+class ControlAPIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, token: str):
+        super().__init__(address, ControlAPIHandler)
+        self.token = token
+
+
+class ControlAPIHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authorized(self) -> bool:
+        header = self.headers.get("Authorization", "")
+        token = header[len("Bearer "):].strip() if header.startswith("Bearer ") else ""
+        return bool(token) and hmac.compare_digest(token.encode(), self.server.token.encode())
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            raise ValueError("request body too large")
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(payload, dict):
+            raise ValueError("JSON object expected")
+        return payload
+
+    def do_GET(self):
+        self.send_json({"error": "use POST"}, 405)
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        if not self.authorized():
+            logger.warning(f"{self.address_string()} | unauthorized {path}")
+            return self.send_json({"error": "unauthorized"}, 401)
+        endpoint = ENDPOINTS.get(path)
+        if endpoint is None:
+            return self.send_json({"error": "not found"}, 404)
+
+        trace_id = self.headers.get("X-Trace-Id", "-")
+        with trace_context(trace_id):
+            try:
+                result = endpoint(self.read_json())
+            except (KeyError, ValueError) as e:
+                return self.send_json({"error": f"bad request: {e}"}, 400)
+            except Exception as e:
+                logger.error(f"Error handling {path}: {e}")
+                return self.send_json({"error": "internal error"}, 500)
+        logger.info(f"{result.get('ip')} | {path} -> {result} | trace={trace_id}")
+        self.send_json(result)
+
+
+def main():
+    logger.remove(0)  # check_blacklist.py already logs to stderr
+    if not API_TOKEN:
+        logger.error("CONTROL_API_TOKEN is not set in .env, refusing to start")
+        sys.exit(1)
+    server = ControlAPIServer((API_HOST, API_PORT), API_TOKEN)
+    logger.info(f"Control API listening on {API_HOST}:{API_PORT}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Minimal client for control_api.py, used by the SSH wrapper scripts in
+/home/proxyuser. Standard library only.
+
+The API is used when a token is available: CONTROL_API_TOKEN, or the file
+CONTROL_API_TOKEN_FILE (default ~/.control_api_token). call() returns None
+when the API is not configured, not reachable (the request was never
+delivered) or does not know the endpoint, and the caller then falls back to
+running the script as before.
+
+Once the API has answered, its answer stands: an HTTP error (400 for a
+rejected payload, 401 for a wrong token, ...) comes back as
+{"error": ..., "status": code} and must not be retried locally, which
+would bypass the server-side validation. A request that reached the server
+but timed out waiting for the answer is retried locally only for
+idempotent endpoints; /remove and /restart would run the Flux operation a
+second time, so they get {"error": "timeout"} instead.
+"""
+import json
+import os
+import socket
+import urllib.error
+import urllib.request
+from typing import Optional
+
+from trace_span import get_trace_id
+
+CONTROL_API_URL = os.getenv("CONTROL_API_URL", "http://127.0.0.1:8082").rstrip("/")
+CONTROL_API_TOKEN_FILE = os.path.expanduser(os.getenv("CONTROL_API_TOKEN_FILE", "~/.control_api_token"))
+CONTROL_API_TIMEOUT = float(os.getenv("CONTROL_API_TIMEOUT", 120))
+# Endpoints that must not run twice when the first answer was lost
+NON_IDEMPOTENT = {"remove", "restart"}
+
+
+def load_token() -> str:
+    token = os.getenv("CONTROL_API_TOKEN", "").strip()
+    if token:
+        return token
+    try:
+        with open(CONTROL_API_TOKEN_FILE, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def call(endpoint: str, payload: dict, timeout: float = CONTROL_API_TIMEOUT) -> Optional[dict]:
+    token = load_token()
+    if not token:
+        return None
+    request = urllib.request.Request(
+        f"{CONTROL_API_URL}/{endpoint.lstrip('/')}",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {token}",
+            "X-Trace-Id": get_trace_id(),
+        },
+        method="POST",
+    )
+    name = endpoint.strip("/")
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            return None  # старый сервер без этого endpoint — работаем по-старому
+        try:
+            error = json.loads(e.read()).get("error", e.reason)
+        except (OSError, ValueError, AttributeError):
+            error = e.reason
+        return {"error": str(error), "status": e.code}
+    except urllib.error.URLError:
+        # Соединение не установлено (сервер не запущен, адрес недоступен): запрос не дошёл
+        return None
+    except (socket.timeout, OSError, ValueError) as e:
+        # Запрос дошёл, но ответа нет или он битый: повторять можно только идемпотентные вызовы
+        if name in NON_IDEMPOTENT:
+            return {"error": f"no answer from control API: {e or 'timeout'}"}
+        return None
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Offline datacenter / hosting range database.
+
+Every *.csv file in DC_RANGES_DIR is read. A row is one of:
+
+    203.0.113.0/24[,label...]          CIDR (cloud provider lists)
+    203.0.113.0,203.0.113.255[,label]  first and last address (ASN-to-prefix dumps)
+
+Header lines, comments (#) and rows that do not parse are skipped; the
+rest of the row (provider, ASN, region) is kept as the label. Ranges are
+merged and compiled into sorted start/end arrays per IP version, so a
+lookup is one bisect. The compiled index is cached as plain JSON arrays and
+rebuilt when a CSV file changes. root (control_api.py, cron) writes
+DC_RANGES_DIR/.compiled.json, any other user (proxyuser running
+check_blacklist.py over SSH) its own .compiled.<uid>.json. A cache is only
+read when it is owned by root or by the current user and nobody else can
+write it.
+
+check_blacklist.py consults it between the whitelist and IPHub: a hit is
+"blocked" without spending API quota.
+
+    python3 dc_ranges.py --compile
+    python3 dc_ranges.py --lookup 203.0.113.7
+"""
+import argparse
+import csv
+import ipaddress
+import json
+import os
+import stat
+import sys
+import time
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+DC_RANGES_DIR = Path(os.getenv("DC_RANGES_DIR", "/fluxsign/dc_ranges"))
+COMPILED_NAME = ".compiled.json"
+# How often a long-running process (control_api.py) looks for changed CSV files
+RECHECK_SECONDS = 60
+
+
+class RangeIndex:
+    def __init__(self, ranges: Dict[int, List[Tuple[int, int, str]]]):
+        # version -> (starts, ends, labels), non-overlapping and sorted by start
+        self.tables = {}
+        for version, items in ranges.items():
+            starts, ends, labels = [], [], []
+            for first, last, label in sorted(items):
+                if ends and first <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], last)
+                    continue
+                starts.append(first)
+                ends.append(last)
+                labels.append(label)
+            self.tables[version] = (starts, ends, labels)
+
+    @classmethod
+    def from_tables(cls, tables: dict) -> "RangeIndex":
+        index = cls({})
+        index.tables = tables
+        return index
+
+    @classmethod
+    def from_json(cls, data: dict) -> "RangeIndex":
+        tables = {}
+        for version, (starts, ends, labels) in data.items():
+            if not len(starts) == len(ends) == len(labels):
+                raise ValueError(f"IPv{version} table is inconsistent")
+            tables[int(version)] = (starts, ends, labels)
+        return cls.from_tables(tables)
+
+    def __len__(self) -> int:
+        return sum(len(starts) for starts, _, _ in self.tables.values())
+
+    def lookup(self, ip: str) -> Optional[str]:
+        """Label of the range containing ip (may be ""), or None."""
+        try:
+            addr = ipaddress.ip_address(ip.strip())
+        except ValueError:
+            return None
+        table = self.tables.get(addr.version)
+        if not table:
+            return None
+        starts, ends, labels = table
+        value = int(addr)
+        pos = bisect_right(starts, value) - 1
+        if pos >= 0 and value <= ends[pos]:
+            return labels[pos]
+        return None
+
+
+def parse_row(row: List[str]) -> Optional[Tuple[int, int, int, str]]:
+    fields = [field.strip() for field in row]
+    if not fields or not fields[0] or fields[0].startswith("#"):
+        return None
+    try:
+        if "/" in fields[0]:
+            net = ipaddress.ip_network(fields[0], strict=False)
+            return net.version, int(net.network_address), int(net.broadcast_address), " ".join(fields[1:])
+        first, last = ipaddress.ip_address(fields[0]), ipaddress.ip_address(fields[1])
+    except (ValueError, IndexError):
+        return None
+    if first.version != last.version or int(first) > int(last):
+        return None
+    return first.version, int(first), int(last), " ".join(fields[2:])
+
+
+def source_files(directory: Path) -> List[Path]:
+    try:
+        return sorted(path for path in directory.iterdir() if path.suffix == ".csv")
+    except OSError:
+        return []
+
+
+def signature(files: List[Path]) -> list:
+    result = []
+    for path in files:
+        try:
+            st = path.stat()
+            result.append([path.name, st.st_mtime_ns, st.st_size])
+        except OSError:
+            continue
+    return result
+
+
+def cache_path(directory: Path, uid: int) -> Path:
+    """root's cache is shared; other users keep their own, so nobody replaces another user's file."""
+    if uid == 0:
+        return directory / COMPILED_NAME
+    return directory / COMPILED_NAME.replace(".json", f".{uid}.json")
+
+
+def trusted(path: Path) -> bool:
+    """A cache owned by root or by this user that nobody else can write."""
+    st = os.stat(path)
+    return st.st_uid in (0, os.getuid()) and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def compile_index(files: List[Path]) -> RangeIndex:
+    ranges: Dict[int, List[Tuple[int, int, str]]] = {}
+    for path in files:
+        label_prefix = path.stem
+        with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+            dialect = "excel-tab" if "\t" in f.readline() else "excel"
+            f.seek(0)
+            for row in csv.reader(f, dialect):
+                parsed = parse_row(row)
+                if parsed:
+                    version, first, last, label = parsed
+                    ranges.setdefault(version, []).append((first, last, f"{label_prefix}: {label}".rstrip(": ")))
+    return RangeIndex(ranges)
+
+
+def load_index(directory: Path = DC_RANGES_DIR) -> RangeIndex:
+    """Compiled index for directory; recompiles (and re-caches) when the CSV files changed."""
+    files = source_files(directory)
+    sig = signature(files)
+    cache = cache_path(directory, os.getuid())
+    # root's cache first: usually fresh, so other users never compile at all
+    for path in dict.fromkeys((directory / COMPILED_NAME, cache)):
+        try:
+            if trusted(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    cached = json.load(f)
+                if cached["signature"] == sig:
+                    return RangeIndex.from_json(cached["tables"])
+        except (OSError, ValueError, KeyError, TypeError):
+            continue
+    index = compile_index(files)
+    if files:
+        tmp = cache.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                os.chmod(tmp, 0o644)
+                json.dump({"signature": sig, "tables": index.tables}, f, separators=(",", ":"))
+            os.replace(tmp, cache)
+        except OSError as e:
+            # Still usable, but every load compiles the CSV files again
+            logger.warning(f"Cannot write DC range cache {cache}: {e}")
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+    return index
+
+
+_index: Optional[RangeIndex] = None
+_checked_at = 0.0
+
+
+def lookup(ip: str) -> Optional[str]:
+    """Module-level lookup with a lazily loaded index that follows changes of DC_RANGES_DIR."""
+    global _index, _checked_at
+    now = time.monotonic()
+    if _index is None or now - _checked_at > RECHECK_SECONDS:
+        _index, _checked_at = load_index(DC_RANGES_DIR), now
+    return _index.lookup(ip)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline datacenter range database")
+    parser.add_argument("--dir", type=Path, default=DC_RANGES_DIR, help=f"CSV directory (default {DC_RANGES_DIR})")
+    parser.add_argument("--compile", action="store_true", help="compile and cache the index")
+    parser.add_argument("--lookup", nargs="*", default=[], metavar="IP", help="look up addresses")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index = load_index(args.dir)
+    print(f"{len(index)} ranges from {len(source_files(args.dir))} files in {time.perf_counter() - started:.3f}s")
+    for ip in args.lookup:
+        label = index.lookup(ip)
+        print(f"{ip}\t{'blocked (' + label + ')' if label is not None else 'not listed'}")
+    if not args.compile and not args.lookup:
+        parser.print_usage(sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
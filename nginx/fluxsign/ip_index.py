@@ -0,0 +1,99 @@
+"""
+In-memory per-IP index over the central JSON files.
+
+Built from ip_mapping.json, ip_leases.json, blacklist.json and
+whitelist.json, so a single IP resolves in O(1) instead of every client
+downloading and scanning the whole mapping. port_api.py rebuilds it when
+any of the files changes (by mtime).
+"""
+import ipaddress
+import os
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from ip_leases import load_json
+
+INDEX_FILES = ("ip_mapping.json", "ip_leases.json", "blacklist.json", "whitelist.json")
+
+
+class NetworkSet:
+    """
+    Single IPs and CIDRs from blacklist.json/whitelist.json. Networks are
+    grouped by prefix length, so a lookup costs one set probe per distinct
+    prefix length rather than a scan over every entry.
+    """
+
+    def __init__(self, entries):
+        self.by_prefix: Dict[Tuple[int, int], set] = {}
+        for entry in entries:
+            try:
+                net = ipaddress.ip_network(str(entry).strip(), strict=False)
+            except ValueError:
+                continue
+            self.by_prefix.setdefault((net.version, net.prefixlen), set()).add(int(net.network_address))
+        self.prefixes = sorted(self.by_prefix, key=lambda key: -key[1])
+
+    def __contains__(self, addr) -> bool:
+        value, bits = int(addr), addr.max_prefixlen
+        for version, prefixlen in self.prefixes:
+            if version != addr.version:
+                continue
+            if (value >> (bits - prefixlen) << (bits - prefixlen)) in self.by_prefix[(version, prefixlen)]:
+                return True
+        return False
+
+
+class IPIndex:
+    def __init__(self, ip_mapping: dict, leases: dict, blacklist: list, whitelist: list):
+        self.project_of: Dict[str, str] = {}
+        self.bound_counts: Dict[str, int] = {}
+        for project, ips in ip_mapping.items():
+            self.bound_counts[project] = len(ips)
+            for ip in ips:
+                self.project_of.setdefault(ip, project)
+        self.leases = leases
+        self.blacklist = NetworkSet(blacklist)
+        self.whitelist = NetworkSet(whitelist)
+
+    def project(self, ip: str) -> Optional[str]:
+        return self.project_of.get(ip)
+
+    def verdict(self, addr) -> str:
+        # Тот же порядок, что в check_blacklist.py: чёрный список важнее белого
+        if addr in self.blacklist:
+            return "blacklisted"
+        if addr in self.whitelist:
+            return "whitelisted"
+        return "unchecked"
+
+    def lookup(self, ip: str) -> dict:
+        """Raises ValueError for a malformed address."""
+        addr = ipaddress.ip_address(ip)
+        ip = str(addr)
+        project = self.project(ip)
+        return {
+            "ip": ip,
+            "project": project,
+            "bound": project is not None,
+            "lease": self.leases.get(ip),
+            "verdict": self.verdict(addr),
+        }
+
+
+def index_mtimes(html_dir: Path) -> tuple:
+    mtimes = []
+    for name in INDEX_FILES:
+        try:
+            mtimes.append(os.stat(html_dir / name).st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+
+def build_index(html_dir: Path) -> IPIndex:
+    return IPIndex(
+        load_json(html_dir / "ip_mapping.json", {}),
+        load_json(html_dir / "ip_leases.json", {}),
+        load_json(html_dir / "blacklist.json", {}).get("blacklist", []),
+        load_json(html_dir / "whitelist.json", {}).get("whitelist", []),
+    )
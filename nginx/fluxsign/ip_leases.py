@@ -0,0 +1,240 @@
+"""
+Leases for IP→project bindings in ip_mapping.json.
+
+ip_mapping.json keeps its original format ({"project": [ip, ...]}) for
+existing clients. Lease data lives next to it in ip_leases.json:
+
+    {"1.2.3.4": {"project": "my_project", "port": 21200, "last_seen": 1760000000,
+                 "traffic": {"bytes_in": 0, "bytes_out": 0, "connections": 0, "since": 1760000000,
+                             "last": {"bytes_in": 0, "bytes_out": 0, "connections": 0, "seconds": 300}}}}
+
+Registration (run_add_project_address.py) and tunnel heartbeats
+(run_heartbeat.py) refresh last_seen; reap_leases.py drops bindings idle for
+longer than LEASE_TTL_HOURS. Heartbeats may carry the 3proxy counters of
+the node for the last interval; they are added to "traffic".
+
+A node without a binding whose tunnel runs in 'other' gets a lease with
+"project": "other" and no entry in ip_mapping.json, so reconcile.py can
+tell it from an instance that never registered. Such leases expire after
+LEASE_TTL_HOURS like any other.
+
+A node with several tunnels (TUNNELS_PER_NODE in start.sh) registers each
+one with its slot number. Slot 0 stays in "port"; the others are kept in
+"ports" ({"1": 21201, ...}). A tunnel port belongs to one slot of one lease.
+
+With several central nodes (central_nodes.py) a lease also records the
+"node" whose sshd holds its ports, since the same port number is free on
+every other host. Released and expired bindings leave a tombstone
+({ip: time}) in ip_tombstones.json, so replication.py can tell a removal
+from a binding the peer has not seen yet.
+
+Every writer holds MAPPING_LOCK while it reads and republishes the files.
+Files are replaced atomically, so NGINX never serves a half-written
+document.
+"""
+import fcntl
+import json
+import os
+import stat
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+HTML_DIR = Path(os.getenv("NGINX_HTML_DIR", "/usr/share/nginx/html"))
+IP_MAPPING_FILE = HTML_DIR / "ip_mapping.json"
+LEASES_FILE = HTML_DIR / "ip_leases.json"
+MAPPING_LOCK = HTML_DIR / ".ip_mapping.lock"
+LEASE_TTL_SECONDS = int(float(os.getenv("LEASE_TTL_HOURS", 24)) * 3600)
+OTHER_PROJECT = "other"
+
+
+@contextmanager
+def mapping_lock(lock_path: Path = MAPPING_LOCK):
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def load_json(path: Path, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def write_json_atomic(path: Path, data, **dump_kwargs):
+    """Writes to a temporary file in the same directory and renames it over path."""
+    path = Path(path)
+    dump_kwargs.setdefault("separators", (",", ":"))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, **dump_kwargs)
+        mode = stat.S_IMODE(os.stat(path).st_mode) if path.exists() else 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def current_node() -> str:
+    """CENTRAL_NODE_ID, set only on multi-node central tiers (see central_nodes.py).
+    Read on every call: some scripts load .env after importing this module."""
+    return os.getenv("CENTRAL_NODE_ID", "").strip()
+
+
+def lease_ports(lease: dict) -> set:
+    """All tunnel ports of a lease, slot 0 and the extra slots."""
+    ports = set(lease.get("ports", {}).values())
+    if lease.get("port") is not None:
+        ports.add(lease["port"])
+    return ports
+
+
+def forget_port(lease: dict, port: int):
+    if lease.get("port") == port:
+        lease.pop("port")
+    extra = lease.get("ports")
+    if extra:
+        for slot in [slot for slot, value in extra.items() if value == port]:
+            del extra[slot]
+        if not extra:
+            lease.pop("ports")
+
+
+def touch_lease(leases: Dict[str, dict], ip: str, project: str, port: Optional[int] = None,
+                now: Optional[float] = None, slot: Optional[int] = None):
+    """
+    Refreshes the lease of ip. With slot the port is recorded for that
+    tunnel slot; without it (heartbeats) a port the lease already holds is
+    left where it is and a new one is recorded as slot 0.
+    """
+    node = current_node()
+    lease = leases.setdefault(ip, {})
+    lease["project"] = project
+    lease["last_seen"] = int(now or time.time())
+    if port is None or (slot is None and port in lease_ports(lease) and lease.get("node", node) == node):
+        return
+    if lease.get("node", node) != node:
+        # The node moved to this central host: its old ports were on another one
+        lease.pop("port", None)
+        lease.pop("ports", None)
+    if node:
+        lease["node"] = node
+    # A port belongs to one tunnel at a time; forget it on any older lease or slot of this host
+    for other in leases.values():
+        if other.get("node", node) == node:
+            forget_port(other, port)
+    if not slot:
+        lease["port"] = port
+    else:
+        lease.setdefault("ports", {})[str(slot)] = port
+
+
+TRAFFIC_COUNTERS = ("bytes_in", "bytes_out", "connections")
+
+
+def add_traffic(lease: dict, counters: dict, now: Optional[float] = None):
+    """Adds one heartbeat interval of 3proxy counters to the lease totals."""
+    last = {key: max(0, int(counters.get(key) or 0)) for key in TRAFFIC_COUNTERS}
+    if counters.get("seconds") is not None:
+        last["seconds"] = max(0, int(counters["seconds"]))
+    traffic = lease.setdefault("traffic", {key: 0 for key in TRAFFIC_COUNTERS})
+    traffic.setdefault("since", int(now or time.time()))
+    for key in TRAFFIC_COUNTERS:
+        traffic[key] = traffic.get(key, 0) + last[key]
+    traffic["last"] = last
+
+
+def refresh_by_ports(leases: Dict[str, dict], live_ports, now: Optional[float] = None) -> int:
+    """Treats a lease whose tunnel port is still listening as seen now."""
+    now = int(now or time.time())
+    node = current_node()
+    refreshed = 0
+    for lease in leases.values():
+        if lease.get("node", node) == node and not lease_ports(lease).isdisjoint(live_ports):
+            lease["last_seen"] = now
+            refreshed += 1
+    return refreshed
+
+
+def reap(ip_mapping: Dict[str, list], leases: Dict[str, dict], ttl: int = LEASE_TTL_SECONDS,
+         now: Optional[float] = None) -> List[Tuple[str, str]]:
+    """
+    Removes bindings idle for longer than ttl from both documents (in place)
+    and returns them as (ip, project). Bindings without a lease (written
+    before leases existed) get one starting now instead of being dropped.
+    Leases of unbound 'other' tunnels are kept while fresh and dropped
+    silently once idle.
+    """
+    now = int(now or time.time())
+    expired = []
+    bound = set()
+    for project, ips in ip_mapping.items():
+        if project == OTHER_PROJECT:
+            continue
+        kept = []
+        for ip in ips:
+            lease = leases.get(ip)
+            if lease is None:
+                touch_lease(leases, ip, project, now=now)
+            elif now - lease.get("last_seen", 0) > ttl:
+                expired.append((ip, project))
+                continue
+            kept.append(ip)
+            bound.add(ip)
+        ip_mapping[project] = kept
+    for ip, lease in list(leases.items()):
+        if ip in bound:
+            continue
+        if lease.get("project") != OTHER_PROJECT or now - lease.get("last_seen", 0) > ttl:
+            del leases[ip]
+    return expired
+
+
+def add_tombstones(html_dir: Path, ips, now: Optional[float] = None):
+    """Records removed bindings for replication; a no-op on a single central node. Caller holds the lock."""
+    if not current_node() or not ips:
+        return
+    path = html_dir / "ip_tombstones.json"
+    tombstones = load_json(path, {})
+    now = int(now or time.time())
+    for ip in ips:
+        tombstones[ip] = now
+    write_json_atomic(path, tombstones)
+
+
+def release(ip: str, html_dir: Path = HTML_DIR, seen_at: Optional[int] = None) -> Optional[str]:
+    """
+    Drops the binding and lease of ip; returns the project it was bound to.
+    With seen_at (last_seen read before a slow check, e.g. in reconcile.py)
+    nothing is dropped, and None returned, unless ip is still bound and its
+    lease has not been refreshed since.
+    """
+    mapping_path, leases_path = html_dir / "ip_mapping.json", html_dir / "ip_leases.json"
+    with mapping_lock(html_dir / ".ip_mapping.lock"):
+        ip_mapping = load_json(mapping_path, {})
+        leases = load_json(leases_path, {})
+        project = next((name for name, ips in ip_mapping.items() if ip in ips), None)
+        if project is None and ip not in leases:
+            return None
+        if seen_at is not None and (project is None or leases.get(ip, {}).get("last_seen", 0) > seen_at):
+            return None
+        if project is not None:
+            ip_mapping[project] = [x for x in ip_mapping[project] if x != ip]
+            write_json_atomic(mapping_path, ip_mapping)
+        leases.pop(ip, None)
+        write_json_atomic(leases_path, leases)
+        add_tombstones(html_dir, [ip])
+        return project
@@ -7,14 +7,18 @@ from dotenv import load_dotenv
 import os
 from loguru import logger
 
+from ip_leases import mapping_lock, write_json_atomic
+
 # === Load environment config ===
 ENV_PATH = Path("/fluxsign/.env")
 if ENV_PATH.exists():
     load_dotenv(dotenv_path=ENV_PATH)
 
-BLACKLIST_PATH = Path("/usr/share/nginx/html/blacklist.json")
-TMP_PATH = Path("/usr/share/nginx/html/blacklist.json.tmp")
-LOG_DIR = Path("/fluxsign/logs")
+HTML_DIR = Path(os.getenv("NGINX_HTML_DIR", "/usr/share/nginx/html"))
+BLACKLIST_PATH = HTML_DIR / "blacklist.json"
+# Same lock as check_blacklist.py, so verdicts recorded meanwhile are not lost
+LISTS_LOCK_FILE = HTML_DIR / ".lists.lock"
+LOG_DIR = Path(os.getenv("FLUXSIGN_LOG_DIR", "/fluxsign/logs"))
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 LOG_FILE = LOG_DIR / "optimize_blacklist.log"
 
@@ -42,10 +46,9 @@ def load_blacklist(path):
         logger.error(f"Failed to load blacklist: {e}")
         return []
 
-def save_blacklist_atomic(data, tmp_path, final_path):
+def save_blacklist_atomic(data, final_path):
     try:
-        tmp_path.write_text(json.dumps({"blacklist": [str(n) for n in data]}, indent=2), encoding="utf-8")
-        tmp_path.rename(final_path)
+        write_json_atomic(final_path, {"blacklist": [str(n) for n in data]}, indent=2, separators=(",", ": "))
         logger.info(f"✔ Optimization complete. Total entries: {len(data)}")
         logger.info(f"✔ Saved to: {final_path}")
     except Exception as e:
@@ -135,9 +138,10 @@ def group_ips(ips, min_ip_per_24, min_24_ratio_per_16, min_16_ratio_per_8):
 
 def main():
     logger.info("🔍 Starting blacklist optimization...")
-    raw = load_blacklist(BLACKLIST_PATH)
-    optimized = group_ips(raw, MIN_IPS_PER_24, RATIO_24_PER_16, RATIO_16_PER_8)
-    save_blacklist_atomic(optimized, TMP_PATH, BLACKLIST_PATH)
+    with mapping_lock(LISTS_LOCK_FILE):
+        raw = load_blacklist(BLACKLIST_PATH)
+        optimized = group_ips(raw, MIN_IPS_PER_24, RATIO_24_PER_16, RATIO_16_PER_8)
+        save_blacklist_atomic(optimized, BLACKLIST_PATH)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Central port API (proxied by NGINX on NGINX_PORT_API).
+
+GET /available_ports[?project=&format=ranges&limit=]
+        legacy: {"<project>": {"available_ports": [...]}}
+        format=ranges: {"<project>": {"available_ranges": ["21200-21299", ...], "free": N}}
+GET /next_port?project=<name>[&after=<port>]
+        -> {"project", "port", "free"}   (port is null when the project is full)
+GET /assign_project?ip=<addr>[&project=<name>]
+        -> {"project", "bound", "available_ports", "free", "load"[, "node"]}
+GET /ip/<addr>
+        -> {"ip", "project", "bound", "lease", "verdict"}   (ETag / If-None-Match -> 304)
+GET /replica?since=<version>
+        -> {"node", "version", "records", "free"}   (multi-node tiers, see replication.py)
+
+/assign_project keeps an existing IP→project binding from ip_mapping.json.
+For a new IP it picks the least-loaded project by weight and quota from
+port_mapping.json. The choice and one port are reserved for
+ASSIGN_HOLD_SECONDS and counted towards that project's load, so a burst
+of new nodes is spread out and nodes are not offered each other's ports.
+
+Per-IP answers come from an in-memory index (ip_index.py) that is rebuilt
+only when ip_mapping.json, ip_leases.json or the black/white lists change.
+
+On a multi-node central tier (central_nodes.py) each instance serves the
+projects it owns. /assign_project still answers for every project, using
+the free-port counts its peers report in /replica, and adds "node" – the
+host the container has to register with. project= asks the owner for a
+project another node already picked. A background thread pulls the
+peers' mapping and leases every REPLICATION_INTERVAL seconds.
+"""
+import hashlib
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from dotenv import load_dotenv
+from loguru import logger
+
+from ip_index import IPIndex, build_index, index_mtimes
+from port_mapping import (OTHER_PROJECT, count_ports, free_masks, listening_ports, load_projects, pick_project,
+                          project_load)
+
+ENV_PATH = Path("/fluxsign/.env")
+if ENV_PATH.exists():
+    load_dotenv(dotenv_path=ENV_PATH)
+
+import replication  # noqa: E402
+from central_nodes import load_nodes  # noqa: E402
+
+HTML_DIR = Path(os.getenv("NGINX_HTML_DIR", "/usr/share/nginx/html"))
+API_HOST = os.getenv("PORT_API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("PORT_API_PORT", 8081))
+ASSIGN_HOLD_SECONDS = int(os.getenv("ASSIGN_HOLD_SECONDS", 300))
+# How many candidate ports /assign_project offers (start.sh probes them with nc -z)
+ASSIGN_PORT_LIMIT = int(os.getenv("ASSIGN_PORT_LIMIT", 20))
+
+
+class PortAPIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, html_dir: Path = HTML_DIR):
+        super().__init__(address, PortAPIHandler)
+        self.html_dir = Path(html_dir)
+        self.lock = threading.Lock()
+        self.pending = {}  # ip -> (project, reserved_port, assigned_at)
+        self._projects = None
+        self._projects_mtime = None
+        self._index = None
+        self._index_mtimes = None
+        self.nodes = load_nodes()
+        self.peer_free = {}  # project -> free ports reported by its owner
+        self.peer_since = {}  # node id -> last replicated version
+
+    def projects(self) -> dict:
+        """port_mapping.json, re-parsed only when the file changes; a broken edit keeps the last good state."""
+        path = self.html_dir / "port_mapping.json"
+        mtime = path.stat().st_mtime
+        if mtime != self._projects_mtime:
+            try:
+                self._projects = load_projects(path)
+            except ValueError as e:
+                logger.error(f"Invalid {path}: {e}")
+                if self._projects is None:
+                    raise
+            self._projects_mtime = mtime
+        return self._projects
+
+    def ip_index(self):
+        """IPIndex over the mapping, leases and black/white lists; a file caught mid-edit keeps the last good index."""
+        mtimes = index_mtimes(self.html_dir)
+        if mtimes != self._index_mtimes:
+            try:
+                index = build_index(self.html_dir)
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to rebuild IP index: {e}")
+                if self._index is None:
+                    index = IPIndex({}, {}, [], [])
+                else:
+                    return self._index
+            self._index, self._index_mtimes = index, mtimes
+        return self._index
+
+    def load_state(self):
+        projects = self.projects()
+        return projects, self.ip_index(), free_masks(projects, listening_ports())
+
+    def free_counts(self, projects: dict, masks: dict) -> dict:
+        """Free ports per project: local ones for owned projects, the owner's last report for the rest."""
+        return {
+            name: count_ports(masks[name]) if self.nodes.owns(name) else self.peer_free.get(name, 0)
+            for name in projects
+        }
+
+    def assign(self, ip: str, preferred: Optional[str] = None) -> dict:
+        projects, index, masks = self.load_state()
+        bound_counts = dict(index.bound_counts)
+        bound_project = index.project(ip)
+        owns = self.nodes.owns
+
+        with self.lock:
+            now = time.time()
+            self.pending = {k: v for k, v in self.pending.items() if now - v[2] < ASSIGN_HOLD_SECONDS}
+            if bound_project:
+                self.pending.pop(ip, None)
+
+            # Ports promised to other new nodes are not free for this one
+            for other_ip, (pending_project, port, _) in self.pending.items():
+                if other_ip == ip or pending_project not in projects:
+                    continue
+                bound_counts[pending_project] = bound_counts.get(pending_project, 0) + 1
+                if port is not None and owns(pending_project) and port in projects[pending_project]["ports"]:
+                    masks[pending_project] &= ~(1 << (port - projects[pending_project]["ports"].start))
+
+            free = self.free_counts(projects, masks)
+            if bound_project:
+                project = bound_project
+            elif ip in self.pending:
+                project = self.pending[ip][0]
+            elif preferred in projects and owns(preferred) and free[preferred]:
+                # Picked by another node, which sent the container here
+                project = preferred
+            else:
+                project = pick_project(projects, free, bound_counts)
+
+            # Ports of a project owned by another node are offered by that node
+            ports = projects.get(project, {}).get("ports") if owns(project) else None
+            mask = masks.get(project, 0) if ports else 0
+            offered = list(ports.iter_ports(mask, ASSIGN_PORT_LIMIT)) if ports else []
+            if not bound_project and project != OTHER_PROJECT:
+                held = self.pending.get(ip, (None, None, None))[1]
+                if held in offered:
+                    offered.remove(held)
+                    offered.insert(0, held)
+                self.pending[ip] = (project, offered[0] if offered else None, now)
+
+        load = {
+            name: round(project_load(p, free[name], bound_counts.get(name, 0)), 4)
+            for name, p in projects.items() if name != OTHER_PROJECT
+        }
+        result = {
+            "project": project,
+            "bound": bound_project is not None,
+            "available_ports": offered,
+            "free": free.get(project, 0),
+            "load": load,
+        }
+        if self.nodes.enabled:
+            result["node"] = self.nodes.public_info(self.nodes.owner(project))
+        return result
+
+    def replica(self, since: int) -> dict:
+        """This node's records newer than since, plus the free ports of the projects it owns."""
+        projects, _, masks = self.load_state()
+        payload = {"node": self.nodes.self_id, **replication.export(self.html_dir, since)}
+        payload["free"] = {
+            name: count_ports(masks[name]) for name in projects if name != OTHER_PROJECT and self.nodes.owns(name)
+        }
+        return payload
+
+    def replicate_once(self):
+        for node_id in self.nodes.peers():
+            peer_url = self.nodes.nodes[node_id].get("peer_url")
+            if not peer_url:
+                continue
+            since = self.peer_since.get(node_id, 0)
+            try:
+                payload = replication.pull(peer_url, max(0, since - replication.REPLICATION_OVERLAP))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Replication from {node_id} failed: {e}")
+                continue
+            applied = replication.apply_records(self.html_dir, payload.get("records", {}))
+            if applied:
+                logger.info(f"Replicated {applied} IPs from {node_id}")
+            self.peer_free.update(payload.get("free", {}))
+            self.peer_since[node_id] = max(since, payload.get("version", 0))
+
+    def replicate_forever(self):
+        while True:
+            try:
+                self.replicate_once()
+            except Exception as e:
+                logger.error(f"Replication error: {e}")
+            time.sleep(replication.REPLICATION_INTERVAL)
+
+
+class PortAPIHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_cached_json(self, payload):
+        """Like send_json, but with an ETag of the body; a matching If-None-Match gets 304 without a body."""
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        if etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def available_ports(self, query: dict) -> dict:
+        projects, _, masks = self.server.load_state()
+        wanted = query.get("project", [None])[0]
+        limit = int(query["limit"][0]) if "limit" in query else None
+        compact = query.get("format", [""])[0] == "ranges"
+        result = {}
+        for name, project in projects.items():
+            if wanted and name != wanted:
+                continue
+            ports, mask = project["ports"], masks[name]
+            if compact:
+                result[name] = {"available_ranges": ports.to_ranges(mask), "free": count_ports(mask)}
+            else:
+                result[name] = {"available_ports": list(ports.iter_ports(mask, limit))}
+        return result
+
+    def next_port(self, query: dict):
+        project = query.get("project", [""])[0]
+        projects, _, masks = self.server.load_state()
+        if project not in projects:
+            return {"error": f"unknown project {project}"}, 404
+        after = int(query["after"][0]) if "after" in query else None
+        port = projects[project]["ports"].next_port(masks[project], after)
+        return {"project": project, "port": port, "free": count_ports(masks[project])}, 200
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        trace_id = self.headers.get("X-Trace-Id", "-")
+        try:
+            if url.path == "/available_ports":
+                return self.send_json(self.available_ports(query))
+            if url.path == "/next_port":
+                return self.send_json(*self.next_port(query))
+            if url.path == "/assign_project":
+                ip = query.get("ip", [""])[0].strip()
+                if not ip:
+                    return self.send_json({"error": "ip is required"}, 400)
+                result = self.server.assign(ip, query.get("project", [None])[0])
+                logger.info(f"{ip} | assigned {result['project']} (bound={result['bound']}) | trace={trace_id}")
+                return self.send_json(result)
+            if url.path == "/replica":
+                token = replication.REPLICATION_TOKEN
+                if self.server.nodes.enabled and not token:
+                    # Records of every IP must not be public on a multi-node tier
+                    return self.send_json({"error": "CENTRAL_REPLICATION_TOKEN is not set"}, 403)
+                if token and not hmac.compare_digest(self.headers.get("Authorization", "").encode(),
+                                                     f"Bearer {token}".encode()):
+                    return self.send_json({"error": "unauthorized"}, 401)
+                return self.send_json(self.server.replica(int(query.get("since", ["0"])[0])))
+            if url.path.startswith("/ip/"):
+                return self.send_cached_json(self.server.ip_index().lookup(url.path[len("/ip/"):]))
+            self.send_json({"error": "not found"}, 404)
+        except ValueError as e:
+            self.send_json({"error": str(e)}, 400)
+        except Exception as e:
+            logger.error(f"Error handling {url.path}: {e}")
+            self.send_json({"error": "internal error"}, 500)
+
+
+def main():
+    logger.remove()
+    logger.add(sys.stderr, format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}", level="INFO")
+    server = PortAPIServer((API_HOST, API_PORT))
+    try:
+        server.projects()  # refuse to start on overlapping or malformed port_mapping.json
+    except (OSError, ValueError) as e:
+        logger.error(f"Cannot load port_mapping.json: {e}")
+        sys.exit(1)
+    logger.info(f"Port API listening on {API_HOST}:{API_PORT}, data dir {HTML_DIR}")
+    if server.nodes.enabled:
+        logger.info(f"Central node {server.nodes.self_id}, peers: {', '.join(server.nodes.peers())}")
+        if not replication.REPLICATION_TOKEN:
+            logger.warning("CENTRAL_REPLICATION_TOKEN is not set: /replica is refused, peers cannot pull from this node")
+        threading.Thread(target=server.replicate_forever, daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+port_mapping.json parsing and port allocation helpers.
+
+A project entry is either a list of ports or an object with optional
+balancing settings. Ports may be single numbers or inclusive ranges:
+
+    {
+      "project_a": ["21200-23199", 23500],
+      "project_b": {"ports": ["24000-24999"], "weight": 2, "quota": 100},
+      "other": []
+    }
+
+weight  – relative share of new nodes the project should receive (default 1);
+quota   – maximum number of IPs bound to the project (default: unlimited).
+
+Ranges of different projects must not overlap. Each project's ports are kept
+as a bitmap, so free-port counts, "next free port" and compact range listings
+are computed without expanding thousands of ports into lists.
+"""
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+OTHER_PROJECT = "other"
+# Tunnels are opened with `ssh -R 127.0.0.1:<port>:...`, so a port is taken
+# when sshd listens on it at this address.
+LISTEN_ADDR = os.getenv("PORT_LISTEN_ADDR", "127.0.0.1")
+
+
+def count_ports(mask: int) -> int:
+    """Number of set bits; int.bit_count() needs Python 3.10."""
+    return bin(mask).count("1")
+
+
+class ProjectPorts:
+    """Ports of one project as a bitmap: bit i stands for port start + i."""
+
+    def __init__(self, ranges: List[Tuple[int, int]]):
+        self.ranges = merge_ranges(ranges)
+        self.start = self.ranges[0][0] if self.ranges else 0
+        self.mask = 0
+        for first, last in self.ranges:
+            self.mask |= ((1 << (last - first + 1)) - 1) << (first - self.start)
+        self.size = count_ports(self.mask)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, port: int) -> bool:
+        offset = port - self.start
+        return offset >= 0 and bool(self.mask >> offset & 1)
+
+    def free_mask(self, busy: Iterable[int]) -> int:
+        """Bitmap of this project's ports that are not in busy."""
+        taken = 0
+        for port in busy:
+            if port in self:
+                taken |= 1 << (port - self.start)
+        return self.mask & ~taken
+
+    def iter_ports(self, mask: int, limit: Optional[int] = None):
+        count = 0
+        while mask and (limit is None or count < limit):
+            low = mask & -mask
+            yield self.start + low.bit_length() - 1
+            mask ^= low
+            count += 1
+
+    def next_port(self, mask: int, after: Optional[int] = None) -> Optional[int]:
+        if after is not None:
+            mask &= ~((1 << max(0, after - self.start + 1)) - 1)
+        if not mask:
+            return None
+        return self.start + (mask & -mask).bit_length() - 1
+
+    def to_ranges(self, mask: int) -> List[str]:
+        """Compact listing like ["21200-21299", "21305"]."""
+        result, offset = [], 0
+        while mask:
+            skip = (mask & -mask).bit_length() - 1
+            mask >>= skip
+            offset += skip
+            run = (~mask & (mask + 1)).bit_length() - 1
+            first, last = self.start + offset, self.start + offset + run - 1
+            result.append(str(first) if first == last else f"{first}-{last}")
+            mask >>= run
+            offset += run
+        return result
+
+
+def merge_ranges(ranges: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def parse_port_spec(spec) -> Tuple[int, int]:
+    """21200, "21200" or "21200-23199" -> (first, last)."""
+    if isinstance(spec, int):
+        first = last = spec
+    else:
+        text = str(spec).strip()
+        if "-" in text:
+            first_text, last_text = text.split("-", 1)
+            first, last = int(first_text), int(last_text)
+        else:
+            first = last = int(text)
+    if not (1 <= first <= last <= 65535):
+        raise ValueError(f"invalid port range: {spec!r}")
+    return first, last
+
+
+def normalize_entry(entry) -> dict:
+    if isinstance(entry, dict):
+        specs = entry.get("ports", [])
+        weight = float(entry.get("weight", 1) or 1)
+        quota = entry.get("quota")
+    else:
+        specs, weight, quota = entry, 1.0, None
+    return {
+        "ports": ProjectPorts([parse_port_spec(spec) for spec in specs]),
+        "weight": weight if weight > 0 else 1.0,
+        "quota": int(quota) if quota is not None else None,
+    }
+
+
+def find_overlaps(projects: Dict[str, dict]) -> List[str]:
+    spans = sorted(
+        (first, last, name)
+        for name, project in projects.items()
+        for first, last in project["ports"].ranges
+    )
+    overlaps = []
+    reach, owner = 0, None
+    for first, last, name in spans:
+        if owner is not None and first <= reach and name != owner:
+            overlaps.append(f"{owner} and {name} overlap on {first}-{min(last, reach)}")
+        if last > reach:
+            reach, owner = last, name
+    return overlaps
+
+
+def load_projects(path) -> Dict[str, dict]:
+    """
+    Returns {project: {"ports": ProjectPorts, "weight", "quota"}} in file order.
+    Raises ValueError on malformed entries or ports shared between projects.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    projects = {name: normalize_entry(entry) for name, entry in raw.items()}
+    overlaps = find_overlaps(projects)
+    if overlaps:
+        raise ValueError("; ".join(overlaps))
+    return projects
+
+
+def port_in_project(path, project: str, port: int) -> bool:
+    try:
+        projects = load_projects(path)
+    except (OSError, ValueError):
+        return False
+    return project in projects and port in projects[project]["ports"]
+
+
+def _hex_addr(addr: str) -> Optional[str]:
+    parts = addr.split(".")
+    if len(parts) != 4:
+        return None
+    return "".join(f"{int(p):02X}" for p in reversed(parts))
+
+
+def listening_ports(addr: str = LISTEN_ADDR) -> set:
+    """
+    TCP ports in LISTEN state bound to addr (or to any address), read from
+    /proc/net/tcp the same way `ss -ltn` does.
+    """
+    wanted = {_hex_addr(addr), "00000000"} if addr else None
+    ports = set()
+    try:
+        with open("/proc/net/tcp", "r") as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                if fields[3] != "0A":
+                    continue
+                local_addr, local_port = fields[1].split(":")
+                if wanted is None or local_addr in wanted:
+                    ports.add(int(local_port, 16))
+    except OSError:
+        pass
+    return ports
+
+
+def free_masks(projects: Dict[str, dict], busy: Iterable[int]) -> Dict[str, int]:
+    busy = set(busy)
+    return {name: project["ports"].free_mask(busy) for name, project in projects.items()}
+
+
+def project_load(project: dict, free: int, bound_ips: int) -> float:
+    """
+    Weighted utilisation of a project: the larger of port usage and quota
+    usage, divided by the project's weight. Lower is less loaded.
+    """
+    capacity = len(project["ports"])
+    if not capacity:
+        return float("inf")
+    usage = (capacity - free) / capacity
+    if project["quota"]:
+        usage = max(usage, bound_ips / project["quota"])
+    return usage / project["weight"]
+
+
+def pick_project(projects: Dict[str, dict], free: Dict[str, int], bound_counts: Dict[str, int]) -> str:
+    """
+    Least-loaded real project that still has a free port and quota; otherwise 'other'.
+    free maps project -> number of free ports.
+    """
+    candidates = []
+    for name, project in projects.items():
+        if name == OTHER_PROJECT or not free.get(name):
+            continue
+        bound = bound_counts.get(name, 0)
+        if project["quota"] is not None and bound >= project["quota"]:
+            continue
+        load = project_load(project, free[name], bound)
+        candidates.append((load, bound, name))
+    if not candidates:
+        return OTHER_PROJECT
+    return min(candidates)[2]
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Pre-screens known Flux instances with spare IPHub quota.
+
+Registrations of IPs that are not yet in blacklist.json/whitelist.json
+spend IPHub quota at the worst moment. When the daily limit is reached,
+start.sh gets exit code 4 and the node sleeps until midnight, even if it
+is clean. This scheduler fetches apps/location during quiet hours and
+checks instances ahead of time, so registrations hit a warm list:
+
+    1. IPs in neither list (instances not bound to a project first);
+    2. whitelisted IPs whose verdict is older than VERDICT_TTL_DAYS
+       (or has no timestamp in verdict_times.json), oldest first.
+
+Blacklisted IPs and IPs in known datacenter ranges (dc_ranges.py) are
+not checked. Each run spends at most
+API_DAILY_LIMIT - PRESCREEN_RESERVE - (used today) requests, never more
+than PRESCREEN_BATCH, at PRESCREEN_RATE_PER_MIN, so live registrations
+always have PRESCREEN_RESERVE requests left. A run holds PRESCREEN_LOCK for
+its whole duration; a run started while the previous one is still going
+exits at once.
+
+Run from cron, e.g. every 10 minutes; outside PRESCREEN_QUIET_HOURS it exits at once:
+    */10 * * * * cd /fluxsign && python3 prescreen.py
+    python3 prescreen.py --dry-run
+"""
+import argparse
+import fcntl
+import ipaddress
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import load_dotenv
+from loguru import logger
+
+ENV_PATH = Path("/fluxsign/.env")
+if ENV_PATH.exists():
+    load_dotenv(dotenv_path=ENV_PATH)
+
+import check_blacklist  # noqa: E402
+import dc_ranges  # noqa: E402
+from ip_index import NetworkSet  # noqa: E402
+from ip_leases import load_json  # noqa: E402
+from remove_app import fetch_app_locations  # noqa: E402
+from trace_span import span  # noqa: E402
+
+QUIET_HOURS = os.getenv("PRESCREEN_QUIET_HOURS", "0-6")
+RESERVE = int(os.getenv("PRESCREEN_RESERVE", 200))
+BATCH = int(os.getenv("PRESCREEN_BATCH", 300))
+RATE_PER_MIN = float(os.getenv("PRESCREEN_RATE_PER_MIN", 30))
+VERDICT_TTL_SECONDS = int(float(os.getenv("VERDICT_TTL_DAYS", 30)) * 86400)
+PRESCREEN_LOCK = Path(os.getenv("PRESCREEN_LOCK", "/tmp/prescreen.lock"))
+
+
+def acquire_run_lock(path: Path = PRESCREEN_LOCK):
+    """Exclusive lock for the whole run; None if another run holds it. The descriptor stays open until exit."""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def in_quiet_hours(spec: str, hour: int) -> bool:
+    """spec "0-6" covers 00:00–05:59, "22-6" wraps over midnight."""
+    first, last = (int(part) for part in spec.split("-", 1))
+    if first <= last:
+        return first <= hour < last
+    return hour >= first or hour < last
+
+
+def pick_candidates(locations, blacklist: list, whitelist: list, verdict_times: dict, bound: set,
+                    ttl: int, now: float) -> list:
+    """Running IPs to check, most useful first."""
+    black, white = NetworkSet(blacklist), NetworkSet(whitelist)
+    exact_white = set(whitelist)
+    ranked = []
+    for ip in set(locations):
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            continue
+        if addr in black or dc_ranges.lookup(ip) is not None:
+            continue
+        if addr not in white:
+            ranked.append(((0, ip in bound, 0), ip))
+        elif ip in exact_white:
+            # Whole whitelisted networks are configured by hand and never go stale
+            checked_at = verdict_times.get(ip, 0)
+            if now - checked_at > ttl:
+                ranked.append(((1, False, checked_at), ip))
+    ranked.sort()
+    return [ip for _, ip in ranked]
+
+
+def screen(ip: str) -> str:
+    with span("prescreen_iphub", ip=ip) as fields:
+        data = check_blacklist.check_with_iphub(ip)
+        if not data or "block" not in data:
+            fields["result"] = "error"
+            return "error"
+        check_blacklist.increment_api_usage()
+        blocked = data["block"] == 1
+        check_blacklist.record_verdict(ip, blocked)
+        fields["result"] = "blocked" if blocked else "good"
+        return fields["result"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-screen Flux instances with spare IPHub quota")
+    parser.add_argument("--dry-run", action="store_true", help="only show the budget and candidates")
+    parser.add_argument("--ignore-quiet-hours", action="store_true", help="run now regardless of the hour")
+    args = parser.parse_args()
+
+    if not args.ignore_quiet_hours and not in_quiet_hours(QUIET_HOURS, datetime.now().hour):
+        return
+    if not check_blacklist.API_KEY:
+        logger.error("IPHUB_API_KEY is not set in .env")
+        sys.exit(1)
+    if not args.dry_run and acquire_run_lock() is None:
+        logger.info("Previous pre-screen run is still going, skipping")
+        return
+
+    used = check_blacklist.get_api_usage_today()
+    budget = min(BATCH, check_blacklist.API_DAILY_LIMIT - RESERVE - used)
+    if budget <= 0 and not args.dry_run:
+        logger.info(f"No spare quota: used {used}, reserve {RESERVE}")
+        return
+
+    try:
+        locations = fetch_app_locations()
+    except Exception as e:
+        logger.error(f"Cannot fetch apps/location: {e}")
+        sys.exit(1)
+
+    html_dir = check_blacklist.HTML_DIR
+    ip_mapping = load_json(html_dir / "ip_mapping.json", {})
+    bound = {ip for ips in ip_mapping.values() for ip in ips}
+    candidates = pick_candidates(
+        locations,
+        check_blacklist.load_json_list(check_blacklist.BLACKLIST_FILE, "blacklist"),
+        check_blacklist.load_json_list(check_blacklist.WHITELIST_FILE, "whitelist"),
+        load_json(check_blacklist.VERDICT_TIMES_FILE, {}),
+        bound, VERDICT_TTL_SECONDS, time.time(),
+    )
+    logger.info(f"Instances: {len(locations)}, candidates: {len(candidates)}, "
+                f"quota used today: {used}, budget: {max(budget, 0)}")
+    if args.dry_run:
+        print(json.dumps({"used": used, "budget": max(budget, 0), "candidates": candidates}, indent=2))
+        return
+
+    results = {}
+    interval = 60.0 / RATE_PER_MIN if RATE_PER_MIN > 0 else 0
+    for ip in candidates[:budget]:
+        # Живые регистрации могли потратить квоту, пока мы работали
+        if check_blacklist.get_api_usage_today() >= check_blacklist.API_DAILY_LIMIT - RESERVE:
+            logger.info("Reserve reached, stopping")
+            break
+        result = screen(ip)
+        results[result] = results.get(result, 0) + 1
+        logger.info(f"{ip} | PRESCREEN_{result.upper()}")
+        if result == "error":
+            break  # IPHub недоступен — не тратим время и квоту до следующего запуска
+        time.sleep(interval)
+    logger.info(f"Pre-screen done: {results}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Expires idle IP→project bindings from ip_mapping.json.
+
+A binding whose lease (ip_leases.json) has not been refreshed by a
+registration or tunnel heartbeat for LEASE_TTL_HOURS is removed, and the
+compacted ip_mapping.json is published atomically. A lease whose tunnel
+port is still listening on this host counts as seen, so nodes running an
+older start.sh without heartbeats are not expired while online.
+
+Run from cron, e.g. every 15 minutes:
+    */15 * * * * python3 /fluxsign/reap_leases.py
+    python3 /fluxsign/reap_leases.py --dry-run
+"""
+import argparse
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from loguru import logger
+
+ENV_PATH = Path("/fluxsign/.env")
+if ENV_PATH.exists():
+    load_dotenv(dotenv_path=ENV_PATH)
+
+import ip_leases  # noqa: E402  (reads NGINX_HTML_DIR / LEASE_TTL_HOURS from .env)
+from port_mapping import listening_ports  # noqa: E402
+
+LOG_DIR = Path(os.getenv("FLUXSIGN_LOG_DIR", "/fluxsign/logs"))
+LOG_DIR.mkdir(parents=True, exist_ok=True)
+LOG_FILE = LOG_DIR / "reap_leases.log"
+
+logger.add(
+    str(LOG_FILE),
+    rotation="5 MB",
+    retention=0,
+    format="{time:YYYY-MM-DD HH:mm:ss} | {message}",
+    level="INFO",
+    enqueue=True,
+    backtrace=False,
+    diagnose=False
+)
+
+
+def reap_once(ttl: int, dry_run: bool = False) -> list:
+    with ip_leases.mapping_lock():
+        ip_mapping = ip_leases.load_json(ip_leases.IP_MAPPING_FILE, {})
+        leases = ip_leases.load_json(ip_leases.LEASES_FILE, {})
+        total = sum(len(ips) for ips in ip_mapping.values())
+
+        refreshed = ip_leases.refresh_by_ports(leases, listening_ports())
+        expired = ip_leases.reap(ip_mapping, leases, ttl)
+
+        for ip, project in expired:
+            logger.info(f"⌛ Expired {ip} from {project}")
+        logger.info(f"🔍 Bindings: {total}, live tunnels: {refreshed}, expired: {len(expired)}")
+
+        if dry_run:
+            logger.info("Dry run, nothing written")
+            return expired
+        ip_leases.write_json_atomic(ip_leases.LEASES_FILE, leases)
+        if expired:
+            ip_leases.write_json_atomic(ip_leases.IP_MAPPING_FILE, ip_mapping)
+            ip_leases.add_tombstones(ip_leases.HTML_DIR, [ip for ip, _ in expired])
+            logger.info(f"✔ Published compacted {ip_leases.IP_MAPPING_FILE}")
+    return expired
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expire idle IP→project bindings")
+    parser.add_argument("--ttl-hours", type=float, help="idle window (default LEASE_TTL_HOURS or 24)")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would expire")
+    args = parser.parse_args()
+
+    ttl = int(args.ttl_hours * 3600) if args.ttl_hours is not None else ip_leases.LEASE_TTL_SECONDS
+    reap_once(ttl, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
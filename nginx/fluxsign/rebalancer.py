@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Moves nodes waiting in 'other' back to their own projects.
+
+A node bound to a full project runs its tunnel in 'other' and joins the
+project's FIFO waitlist (waitlist.json, see waitlist.py). Each run of the
+rebalancer:
+
+    1. drops entries whose IP is no longer bound to the project, or whose
+       tunnel is already back on a listening port of the project;
+    2. counts the free ports of every project, minus entries restarted
+       less than REBALANCE_GRACE_SECONDS ago (their port is promised);
+    3. gives the remaining free ports to the oldest waiting entries, at most
+       REBALANCE_BATCH restarts per run;
+    4. restarts them in Flux with one authentication and at most
+       REBALANCE_CONCURRENCY requests at a time. After the restart start.sh
+       registers in the project.
+
+An entry whose restart failed, or whose node did not come back within the
+grace period, keeps its place and is retried. This replaces the
+port_project_watcher.sh poller that used to run on every stranded node.
+
+Run from cron, e.g. every minute:
+    * * * * * cd /fluxsign && python3 rebalancer.py
+    python3 rebalancer.py --dry-run
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from dotenv import load_dotenv
+from loguru import logger
+
+ENV_PATH = Path("/fluxsign/.env")
+if ENV_PATH.exists():
+    load_dotenv(dotenv_path=ENV_PATH)
+
+import ip_leases  # noqa: E402
+import remove_app  # noqa: E402
+from port_mapping import count_ports, free_masks, listening_ports, load_projects  # noqa: E402
+from trace_span import span  # noqa: E402
+from waitlist import WAITLIST_NAME  # noqa: E402
+
+HTML_DIR = Path(os.getenv("NGINX_HTML_DIR", "/usr/share/nginx/html"))
+WAITLIST_FILE = HTML_DIR / WAITLIST_NAME
+REBALANCE_BATCH = int(os.getenv("REBALANCE_BATCH", 10))
+REBALANCE_CONCURRENCY = int(os.getenv("REBALANCE_CONCURRENCY", 4))
+REBALANCE_GRACE_SECONDS = int(os.getenv("REBALANCE_GRACE_SECONDS", 600))
+
+LOG_DIR = Path(os.getenv("FLUXSIGN_LOG_DIR", "/fluxsign/logs"))
+LOG_DIR.mkdir(parents=True, exist_ok=True)
+LOG_FILE = LOG_DIR / "rebalancer.log"
+
+logger.add(
+    str(LOG_FILE),
+    rotation="5 MB",
+    retention=0,
+    format="{time:YYYY-MM-DD HH:mm:ss} | {message}",
+    level="INFO",
+    enqueue=True,
+    backtrace=False,
+    diagnose=False
+)
+
+
+def plan(waitlist: dict, ip_mapping: dict, leases: dict, projects: dict, masks: dict, live_ports: set,
+         batch: int, grace: int, now: float):
+    """
+    Updates waitlist in place and returns (restarts, dropped):
+    restarts – [(ip, project)] in FIFO order, dropped – [(ip, project, reason)].
+    """
+    restarts, dropped = [], []
+    for project in list(waitlist):
+        entries = waitlist[project]
+        if project not in projects:
+            dropped += [(entry["ip"], project, "unknown project") for entry in entries]
+            del waitlist[project]
+            continue
+        ports = projects[project]["ports"]
+        bound = set(ip_mapping.get(project, []))
+        kept, in_flight = [], 0
+        for entry in entries:
+            ip = entry["ip"]
+            if ip not in bound:
+                dropped.append((ip, project, "unbound"))
+                continue
+            if any(port in ports for port in ip_leases.lease_ports(leases.get(ip, {})) & live_ports):
+                dropped.append((ip, project, "home"))
+                continue
+            if now - entry.get("restarted_at", 0) < grace:
+                in_flight += 1
+            else:
+                entry.pop("restarted_at", None)
+            kept.append(entry)
+
+        free = count_ports(masks.get(project, 0)) - in_flight
+        for entry in kept:
+            if free <= 0 or len(restarts) >= batch:
+                break
+            if "restarted_at" in entry:
+                continue
+            entry["restarted_at"] = int(now)
+            entry["attempts"] = entry.get("attempts", 0) + 1
+            restarts.append((entry["ip"], project))
+            free -= 1
+        if kept:
+            waitlist[project] = kept
+        else:
+            del waitlist[project]
+    return restarts, dropped
+
+
+def restart_batch(restarts: list, concurrency: int) -> dict:
+    """Restarts [(ip, project)] in Flux; returns {ip: ok}."""
+    with span("flux_location"):
+        locations = remove_app.fetch_app_locations()
+    with span("flux_auth"):
+        loginphrase, signature = remove_app.authenticate()
+    if not (loginphrase and signature):
+        logger.error("❌ Flux authentication failed, batch skipped")
+        return {ip: False for ip, _ in restarts}
+
+    import restart_app  # adds its own log sink, needed only for restarts
+
+    def run(job):
+        ip, project = job
+        with span("rebalance_restart", ip=ip, project=project) as fields:
+            if ip not in locations:
+                logger.warning(f"{ip} is not running in Flux, restart skipped")
+                ok = False
+            else:
+                try:
+                    ok = all([restart_app.restart_app(ip, str(port), loginphrase, signature)
+                              for port in locations[ip]])
+                except Exception as e:
+                    logger.error(f"restart {ip} failed: {e}")
+                    ok = False
+            fields["result"] = "ok" if ok else "failed"
+        return ip, ok
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        return dict(pool.map(run, restarts))
+
+
+def rebalance_once(batch: int, concurrency: int, grace: int, dry_run: bool = False) -> dict:
+    projects = load_projects(HTML_DIR / "port_mapping.json")
+    live_ports = listening_ports()
+    masks = free_masks(projects, live_ports)
+
+    with ip_leases.mapping_lock(HTML_DIR / ".ip_mapping.lock"):
+        waitlist = ip_leases.load_json(WAITLIST_FILE, {})
+        waiting = sum(len(entries) for entries in waitlist.values())
+        restarts, dropped = plan(
+            waitlist,
+            ip_leases.load_json(HTML_DIR / "ip_mapping.json", {}),
+            ip_leases.load_json(HTML_DIR / "ip_leases.json", {}),
+            projects, masks, live_ports, batch, grace, time.time(),
+        )
+        if not dry_run:
+            ip_leases.write_json_atomic(WAITLIST_FILE, waitlist)
+
+    for ip, project, reason in dropped:
+        logger.info(f"🧹 {ip} left the {project} waitlist ({reason})")
+    logger.info(f"🔍 Waiting: {waiting}, dropped: {len(dropped)}, restarts: {len(restarts)}")
+    result = {"restarts": [ip for ip, _ in restarts], "dropped": [ip for ip, _, _ in dropped]}
+    if dry_run or not restarts:
+        return result
+
+    # Flux не трогаем под блокировкой: порты уже обещаны отметкой restarted_at
+    try:
+        outcome = restart_batch(restarts, concurrency)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error(f"❌ Cannot fetch apps/location: {e}")
+        outcome = {ip: False for ip, _ in restarts}
+    failed = {ip for ip, ok in outcome.items() if not ok}
+    if failed:
+        # Неудачный перезапуск не должен держать порт весь grace-период
+        with ip_leases.mapping_lock(HTML_DIR / ".ip_mapping.lock"):
+            waitlist = ip_leases.load_json(WAITLIST_FILE, {})
+            for entries in waitlist.values():
+                for entry in entries:
+                    if entry["ip"] in failed:
+                        entry.pop("restarted_at", None)
+            ip_leases.write_json_atomic(WAITLIST_FILE, waitlist)
+    for ip, project in restarts:
+        logger.info(f"{'🔄' if ip not in failed else '❌'} {ip} -> {project}")
+    result["failed"] = sorted(failed)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Restart nodes waiting in 'other' as their projects free up")
+    parser.add_argument("--batch", type=int, default=REBALANCE_BATCH,
+                        help=f"restarts per run (default {REBALANCE_BATCH})")
+    parser.add_argument("--concurrency", type=int, default=REBALANCE_CONCURRENCY,
+                        help=f"parallel Flux requests (default {REBALANCE_CONCURRENCY})")
+    parser.add_argument("--dry-run", action="store_true", help="only show what would be restarted")
+    args = parser.parse_args()
+
+    try:
+        result = rebalance_once(args.batch, args.concurrency, REBALANCE_GRACE_SECONDS, args.dry_run)
+    except (OSError, ValueError, requests.exceptions.RequestException) as e:
+        logger.error(f"❌ Rebalance failed: {e}")
+        sys.exit(1)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
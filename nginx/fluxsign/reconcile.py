@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Reconciles Flux's view of APP_NAME with the central mappings.
+
+Fetches apps/location once and diffs it against ip_mapping.json, the
+leases of live tunnels (ip_leases.json + ports listening on this host) and
+blacklist.json. Three sets are reported:
+
+    orphaned      – bound in ip_mapping.json, but Flux no longer runs the
+                    app there and no tunnel is up;
+    unregistered  – running in Flux, but neither bound nor tunnelled, nor
+                    running in 'other' (listed there or holding a fresh
+                    'other' lease from a registration or heartbeat);
+    blacklisted   – running in Flux although the IP is in blacklist.json.
+
+Nothing is changed without --apply. With --apply orphaned bindings are
+released, blacklisted instances are removed and (with
+--restart-unregistered) unregistered instances are restarted so their
+start.sh registers again. Flux calls go out as one batch: a single
+authentication, then at most RECONCILE_CONCURRENCY requests at a time.
+
+Run from cron, e.g. hourly:
+    0 * * * * cd /fluxsign && python3 reconcile.py --apply
+"""
+import argparse
+import ipaddress
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import requests
+from dotenv import load_dotenv
+from loguru import logger
+
+ENV_PATH = Path("/fluxsign/.env")
+if ENV_PATH.exists():
+    load_dotenv(dotenv_path=ENV_PATH)
+
+import ip_leases  # noqa: E402
+import remove_app  # noqa: E402
+from port_mapping import OTHER_PROJECT, listening_ports  # noqa: E402
+from trace_span import span  # noqa: E402
+
+HTML_DIR = Path(os.getenv("NGINX_HTML_DIR", "/usr/share/nginx/html"))
+BLACKLIST_FILE = HTML_DIR / "blacklist.json"
+RECONCILE_CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", 4))
+
+LOG_DIR = Path(os.getenv("FLUXSIGN_LOG_DIR", "/fluxsign/logs"))
+LOG_DIR.mkdir(parents=True, exist_ok=True)
+LOG_FILE = LOG_DIR / "reconcile.log"
+
+logger.add(
+    str(LOG_FILE),
+    rotation="5 MB",
+    retention=0,
+    format="{time:YYYY-MM-DD HH:mm:ss} | {message}",
+    level="INFO",
+    enqueue=True,
+    backtrace=False,
+    diagnose=False
+)
+
+
+def load_networks(path: Path) -> list:
+    """blacklist.json entries (single IPs and CIDRs) parsed once for the whole run."""
+    networks = []
+    for entry in ip_leases.load_json(path, {}).get("blacklist", []):
+        try:
+            networks.append(ipaddress.ip_network(entry.strip(), strict=False))
+        except ValueError:
+            continue
+    return networks
+
+
+def in_networks(ip: str, networks: list) -> bool:
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(addr in net for net in networks if net.version == addr.version)
+
+
+def diff_state(locations: dict, ip_mapping: dict, leases: dict, live_ports: set, blacklist: list,
+               ttl: int = ip_leases.LEASE_TTL_SECONDS, now: Optional[float] = None) -> dict:
+    now = now or time.time()
+    bound = {ip for name, ips in ip_mapping.items() if name != OTHER_PROJECT for ip in ips}
+    # Узлы в 'other' не привязаны к проекту, но зарегистрированы
+    in_other = set(ip_mapping.get(OTHER_PROJECT, [])) | {
+        ip for ip, lease in leases.items()
+        if lease.get("project") == OTHER_PROJECT and now - lease.get("last_seen", 0) <= ttl
+    }
+    tunnelled = {ip for ip, lease in leases.items() if not ip_leases.lease_ports(lease).isdisjoint(live_ports)}
+    running = set(locations)
+    return {
+        "orphaned": sorted(bound - running - tunnelled),
+        "unregistered": sorted(running - bound - in_other - tunnelled),
+        "blacklisted": sorted(ip for ip in running if in_networks(ip, blacklist)),
+    }
+
+
+def run_batch(jobs: list, concurrency: int) -> dict:
+    """jobs: [(action, ip, callable)]; returns {action: {"ok": [...], "failed": [...]}}."""
+    results = {}
+
+    def run(job):
+        action, ip, func = job
+        with span(f"reconcile_{action}", ip=ip) as fields:
+            try:
+                ok = bool(func())
+            except Exception as e:
+                logger.error(f"{action} {ip} failed: {e}")
+                ok = False
+            fields["result"] = "ok" if ok else "failed"
+        return action, ip, ok
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for action, ip, ok in pool.map(run, jobs):
+            bucket = results.setdefault(action, {"ok": [], "failed": []})
+            bucket["ok" if ok else "failed"].append(ip)
+    return results
+
+
+def apply_changes(report: dict, locations: dict, leases: dict, restart_unregistered: bool, concurrency: int) -> dict:
+    results = {}
+    released = {"ok": [], "failed": [], "skipped": []}
+    for ip in report["orphaned"]:
+        # Узел мог зарегистрироваться или прислать heartbeat, пока шёл запрос к Flux
+        project = ip_leases.release(ip, HTML_DIR, seen_at=leases.get(ip, {}).get("last_seen", 0))
+        if project is None:
+            logger.info(f"⏭ {ip} is no longer bound or was seen during the scan, not released")
+            released["skipped"].append(ip)
+            continue
+        logger.info(f"🧹 Released orphaned {ip} from {project}")
+        released["ok"].append(ip)
+    if report["orphaned"]:
+        results["release"] = released
+
+    flux_jobs = [("remove", ip) for ip in report["blacklisted"]]
+    if restart_unregistered:
+        blacklisted = set(report["blacklisted"])
+        flux_jobs += [("restart", ip) for ip in report["unregistered"] if ip not in blacklisted]
+    if not flux_jobs:
+        return results
+
+    # Одна аутентификация на весь пакет: zelidauth действует и для appremove, и для apprestart
+    with span("flux_auth"):
+        loginphrase, signature = remove_app.authenticate()
+    if not (loginphrase and signature):
+        logger.error("❌ Flux authentication failed, batch skipped")
+        for action, ip in flux_jobs:
+            results.setdefault(action, {"ok": [], "failed": []})["failed"].append(ip)
+        return results
+
+    jobs = []
+    for action, ip in flux_jobs:
+        ports = locations[ip]  # все экземпляры приложения на этом IP
+        if action == "remove":
+            def func(ip=ip, ports=ports):
+                if not all(remove_app.remove_app(loginphrase, signature, ip, port) for port in ports):
+                    return False
+                ip_leases.release(ip, HTML_DIR)
+                return True
+        else:
+            import restart_app  # adds its own log sink, needed only for restarts
+
+            def func(ip=ip, ports=ports):
+                return all([restart_app.restart_app(ip, str(port), loginphrase, signature) for port in ports])
+        jobs.append((action, ip, func))
+
+    for action, outcome in run_batch(jobs, concurrency).items():
+        results[action] = outcome
+    for action, outcome in results.items():
+        logger.info(f"✔ {action}: ok {len(outcome['ok'])}, failed {len(outcome['failed'])}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Diff Flux apps/location against ip_mapping.json and live tunnels")
+    parser.add_argument("--apply", action="store_true", help="release orphans and remove blacklisted instances")
+    parser.add_argument("--restart-unregistered", action="store_true",
+                        help="with --apply also restart instances that never registered")
+    parser.add_argument("--concurrency", type=int, default=RECONCILE_CONCURRENCY,
+                        help=f"parallel Flux requests (default {RECONCILE_CONCURRENCY})")
+    args = parser.parse_args()
+
+    try:
+        with span("flux_location"):
+            locations = remove_app.fetch_app_locations()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error(f"❌ Cannot fetch apps/location: {e}")
+        sys.exit(1)
+    if not locations:
+        # Пустой ответ неотличим от сбоя Flux — не снимаем все привязки разом
+        logger.error("❌ apps/location returned no instances, nothing to reconcile")
+        sys.exit(1)
+
+    ip_mapping = ip_leases.load_json(HTML_DIR / "ip_mapping.json", {})
+    leases = ip_leases.load_json(HTML_DIR / "ip_leases.json", {})
+    report = diff_state(locations, ip_mapping, leases, listening_ports(), load_networks(BLACKLIST_FILE))
+    logger.info(
+        f"🔍 Running: {len(locations)}, orphaned: {len(report['orphaned'])}, "
+        f"unregistered: {len(report['unregistered'])}, blacklisted: {len(report['blacklisted'])}"
+    )
+
+    output = dict(report)
+    if args.apply:
+        output["applied"] = apply_changes(report, locations, leases, args.restart_unregistered, args.concurrency)
+    print(json.dumps(output, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,19 +9,22 @@ import subprocess
 import sys
 import urllib.parse
 from email.message import EmailMessage
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 
 import requests
 from dotenv import load_dotenv
 from loguru import logger
 
+from ip_leases import release
+from trace_span import set_trace_id, span
+
 ENABLE_EMAIL_NOTIFICATIONS = False
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Configuration from environment
-FLUX_API_URL = "https://api.runonflux.io"
+FLUX_API_URL = os.getenv("FLUX_API_URL", "https://api.runonflux.io")
 FLUX_ID = os.getenv("FLUX_ID")
 APP_NAME = os.getenv("APP_NAME")
 EXTERNAL_API_URL = os.getenv("EXTERNAL_API_URL")
@@ -121,6 +124,26 @@ def get_app_location() -> List[Tuple[str, int]]:
     return []
 
 
+def fetch_app_locations() -> Dict[str, List[int]]:
+    """
+    {ip: [port, ...]} запущенных экземпляров: Flux может держать на одном IP
+    несколько экземпляров на разных портах. В отличие от get_app_location()
+    сбой запроса выбрасывает исключение, чтобы недоступный Flux не выглядел
+    как «экземпляров нет».
+    """
+    response = requests.get(f"{FLUX_API_URL}/apps/location", params={"appname": APP_NAME}, timeout=30)
+    response.raise_for_status()
+    data = response.json()
+    if data.get("status") not in (None, "success"):
+        raise ValueError(f"apps/location returned status {data.get('status')}")
+    locations: Dict[str, List[int]] = {}
+    for entry in data.get("data", []):
+        ip, port = extract_ip_and_port(entry)
+        if port not in locations.setdefault(ip, []):
+            locations[ip].append(port)
+    return locations
+
+
 def get_external_data() -> List[str]:
     """
     Получает данные из внешнего источника и возвращает список IP-адресов черного списка.
@@ -294,39 +317,68 @@ def authenticate() -> Tuple[Optional[str], Optional[str]]:
     return loginphrase, signature
 
 
-def compare_and_remove() -> None:
-    """Удаляет приложение, если IP контейнера передан в аргументе."""
-    if len(sys.argv) != 2:
-        logger.error("❌ Не указан IP контейнера!")
-        sys.exit(1)
-
-    container_ip = sys.argv[1]
-    app_locations = get_app_location()
-
-    matched_entries = [entry for entry in app_locations if entry[0] == container_ip]
+def remove_by_ip(container_ip: str) -> int:
+    """
+    Удаляет приложение со всех портов узла container_ip и снимает его привязку.
+    Возвращает код выхода скрипта: 0 — успех, 1 — ошибка.
+    """
+    try:
+        with span("flux_location", ip=container_ip):
+            ports = fetch_app_locations().get(container_ip, [])
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error(f"Ошибка запроса к API Flux: {e}")
+        return 1
 
-    if not matched_entries:
+    if not ports:
         logger.error(f"❌ IP {container_ip} не найден среди активных приложений.")
-        sys.exit(1)
+        return 1
 
-    for ip, port in matched_entries:
-        logger.info(f"🔍 Удаление приложения для IP {ip}:{port}...")
+    # Одна аутентификация на все экземпляры узла
+    with span("flux_auth", ip=container_ip):
         loginphrase, signature = authenticate()
-
-        if loginphrase and signature:
-            success = remove_app(loginphrase, signature, ip, port)
-            if not success:
-                logger.error("❌ Удаление не удалось, повторная попытка через 30 минут в start.sh.")
-                sys.exit(1)
-        else:
-            logger.error("❌ Ошибка аутентификации, удаление невозможно.")
-            sys.exit(1)
+    if not (loginphrase and signature):
+        logger.error("❌ Ошибка аутентификации, удаление невозможно.")
+        return 1
+
+    for port in ports:
+        logger.info(f"🔍 Удаление приложения для IP {container_ip}:{port}...")
+        with span("flux_appremove", ip=container_ip, port=port):
+            success = remove_app(loginphrase, signature, container_ip, port)
+        if not success:
+            logger.error("❌ Удаление не удалось, повторная попытка через 30 минут в start.sh.")
+            return 1
+
+    # Удалённый узел больше не держит привязку к проекту
+    try:
+        project = release(container_ip)
+        if project:
+            logger.info(f"🧹 Привязка IP {container_ip} к проекту {project} снята.")
+    except OSError as e:
+        logger.error(f"❌ Не удалось снять привязку IP {container_ip}: {e}")
 
     logger.info("✅ Удаление приложения выполнено. Продолжаем выполнение start.sh.")
-    return
+    return 0
+
+
+def compare_and_remove() -> None:
+    """
+    Удаляет приложение, если IP контейнера передан в аргументе.
+    Второй необязательный аргумент — TRACE_ID (sudo не передаёт окружение).
+    """
+    if len(sys.argv) not in (2, 3):
+        logger.error("❌ Не указан IP контейнера!")
+        sys.exit(1)
+
+    if len(sys.argv) == 3:
+        set_trace_id(sys.argv[2])
+
+    exit_code = remove_by_ip(sys.argv[1])
+    if exit_code:
+        sys.exit(exit_code)
 
 
 if __name__ == "__main__":
     LOG_FILE = "email_notifications.log"
     logger.add(LOG_FILE, format="{time} {level} {message}", level="INFO", rotation="10 MB", compression="zip")
-    compare_and_remove()
+    with span("remove_app", ip=sys.argv[1] if len(sys.argv) > 1 else ""):
+        compare_and_remove()
@@ -0,0 +1,122 @@
+"""
+Last-writer-wins replication of ip_mapping.json and ip_leases.json
+between the port_api.py instances of a multi-node central tier.
+
+The unit of replication is one IP:
+
+    {"project": "my_project", "lease": {...}, "version": 1760000000}   bound
+    {"project": null, "lease": null, "version": 1760000300}             removed
+
+version is the lease's last_seen (refreshed by every registration and
+heartbeat) or the time of the tombstone left by release()/reap. A record
+replaces the local one when its (version, bound, project) key is larger,
+so every node settles on the same winner even for writes in the same
+second. Clocks of the central nodes are expected to be NTP-synchronised.
+
+Each port_api.py pulls GET /replica?since=<version> from every peer every
+REPLICATION_INTERVAL seconds and merges the answer under the mapping lock.
+"""
+import json
+import os
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, Optional
+
+from ip_leases import forget_port, lease_ports, load_json, mapping_lock, write_json_atomic
+
+REPLICATION_INTERVAL = float(os.getenv("REPLICATION_INTERVAL", 5))
+# Records that arrive late at a peer carry older versions; pull a little behind the last one seen
+REPLICATION_OVERLAP = int(os.getenv("REPLICATION_OVERLAP", 300))
+REPLICATION_TOKEN = os.getenv("CENTRAL_REPLICATION_TOKEN", "").strip()
+TOMBSTONE_TTL_SECONDS = int(float(os.getenv("TOMBSTONE_TTL_DAYS", 7)) * 86400)
+
+
+def record_key(record: dict) -> tuple:
+    return record["version"], record["project"] is not None, record["project"] or ""
+
+
+def local_records(ip_mapping: dict, leases: dict, tombstones: dict, since: int = 0) -> Dict[str, dict]:
+    records = {}
+    for ip, removed_at in tombstones.items():
+        records[ip] = {"project": None, "lease": None, "version": int(removed_at)}
+    for project, ips in ip_mapping.items():
+        for ip in ips:
+            lease = leases.get(ip)
+            record = {"project": project, "lease": lease, "version": int(lease.get("last_seen", 0)) if lease else 0}
+            if ip not in records or record_key(record) > record_key(records[ip]):
+                records[ip] = record
+    return {ip: record for ip, record in records.items() if record["version"] > since}
+
+
+def merge(ip_mapping: dict, leases: dict, tombstones: dict, records: Dict[str, dict]) -> int:
+    """Applies the newer of records to the three documents in place; returns how many IPs changed."""
+    current = local_records(ip_mapping, leases, tombstones)
+    applied = 0
+    for ip, record in records.items():
+        if ip in current and record_key(record) <= record_key(current[ip]):
+            continue
+        for project in ip_mapping:
+            if ip in ip_mapping[project]:
+                ip_mapping[project] = [x for x in ip_mapping[project] if x != ip]
+        if record["project"] is None:
+            leases.pop(ip, None)
+            tombstones[ip] = record["version"]
+        else:
+            ip_mapping.setdefault(record["project"], []).append(ip)
+            lease = record["lease"]
+            if lease:
+                # The winner's ports are taken on its host; older leases there lose them.
+                # Leases without a node id (before multi-node) cannot be placed on a host
+                node = lease.get("node")
+                for port in lease_ports(lease) if node else ():
+                    for other_ip, other in leases.items():
+                        if other_ip != ip and other.get("node") == node:
+                            forget_port(other, port)
+                leases[ip] = lease
+            else:
+                leases.pop(ip, None)
+            tombstones.pop(ip, None)
+        applied += 1
+    return applied
+
+
+def prune_tombstones(tombstones: dict, ttl: int = TOMBSTONE_TTL_SECONDS, now: Optional[float] = None) -> int:
+    now = now or time.time()
+    expired = [ip for ip, removed_at in tombstones.items() if now - removed_at > ttl]
+    for ip in expired:
+        del tombstones[ip]
+    return len(expired)
+
+
+def export(html_dir: Path, since: int = 0) -> dict:
+    records = local_records(
+        load_json(html_dir / "ip_mapping.json", {}),
+        load_json(html_dir / "ip_leases.json", {}),
+        load_json(html_dir / "ip_tombstones.json", {}),
+    )
+    version = max((record["version"] for record in records.values()), default=0)
+    return {"version": version, "records": {ip: r for ip, r in records.items() if r["version"] > since}}
+
+
+def apply_records(html_dir: Path, records: Dict[str, dict]) -> int:
+    paths = {name: html_dir / f"{name}.json" for name in ("ip_mapping", "ip_leases", "ip_tombstones")}
+    with mapping_lock(html_dir / ".ip_mapping.lock"):
+        ip_mapping = load_json(paths["ip_mapping"], {})
+        leases = load_json(paths["ip_leases"], {})
+        tombstones = load_json(paths["ip_tombstones"], {})
+        applied = merge(ip_mapping, leases, tombstones, records)
+        pruned = prune_tombstones(tombstones)
+        if applied:
+            write_json_atomic(paths["ip_mapping"], ip_mapping)
+            write_json_atomic(paths["ip_leases"], leases)
+        if applied or pruned:
+            write_json_atomic(paths["ip_tombstones"], tombstones)
+    return applied
+
+
+def pull(peer_url: str, since: int, timeout: float = 10) -> dict:
+    headers = {"Authorization": f"Bearer {REPLICATION_TOKEN}"} if REPLICATION_TOKEN else {}
+    request = urllib.request.Request(f"{peer_url.rstrip('/')}/replica?since={since}", headers=headers)
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
@@ -10,9 +10,11 @@ from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from typing import Optional, Tuple, List
 
+from trace_span import set_trace_id, span
+
 # === Конфигурация ===
 load_dotenv()
-FLUX_API_URL = "https://api.runonflux.io"
+FLUX_API_URL = os.getenv("FLUX_API_URL", "https://api.runonflux.io")
 FLUX_ID = os.getenv("FLUX_ID")
 APP_NAME = os.getenv("APP_NAME")
 PRIVATE_KEY = os.getenv("PRIVATE_KEY")
@@ -114,44 +116,53 @@ def restart_app(ip: str, port: str, loginphrase: str, signature: str) -> bool:
         logger.error(f"Ошибка запроса на перезапуск: {e}")
         return False
 
-# === Основной блок ===
-def main():
-    if len(sys.argv) < 2:
-        logger.error("Не указан IP. Использование: python3 app_restart.py <IP>")
-        sys.exit(1)
-
-    ip_arg = sys.argv[1]
-    logger.info(f"▶ Запрос на перезапуск приложения по IP: {ip_arg}")
+# === Перезапуск по IP ===
+def restart_by_ip(ip: str) -> bool:
+    logger.info(f"▶ Запрос на перезапуск приложения по IP: {ip}")
 
-    port = get_port_for_ip(ip_arg)
+    with span("flux_location", ip=ip):
+        port = get_port_for_ip(ip)
     if not port:
-        logger.error(f"Порт не найден для IP: {ip_arg}")
-        sys.exit(1)
+        logger.error(f"Порт не найден для IP: {ip}")
+        return False
 
-    loginphrase = get_loginphrase()
-    if not loginphrase:
-        logger.error("Ошибка получения loginphrase")
-        sys.exit(1)
+    with span("flux_auth", ip=ip):
+        loginphrase = get_loginphrase()
+        if not loginphrase:
+            logger.error("Ошибка получения loginphrase")
+            return False
 
-    signature = sign_message(loginphrase, PRIVATE_KEY)
-    if not signature:
-        logger.error("Ошибка подписи")
-        sys.exit(1)
+        signature = sign_message(loginphrase, PRIVATE_KEY)
+        if not signature:
+            logger.error("Ошибка подписи")
+            return False
 
-    if not provide_signature(loginphrase, signature):
-        logger.error("Ошибка provide_signature")
-        sys.exit(1)
+        if not provide_signature(loginphrase, signature):
+            logger.error("Ошибка provide_signature")
+            return False
 
-    if not verify_login(loginphrase, signature):
-        logger.error("Ошибка verify_login")
-        sys.exit(1)
+        if not verify_login(loginphrase, signature):
+            logger.error("Ошибка verify_login")
+            return False
 
-    if restart_app(ip_arg, port, loginphrase, signature):
+    with span("flux_apprestart", ip=ip, port=port):
+        restarted = restart_app(ip, port, loginphrase, signature)
+    if restarted:
         logger.success("Приложение успешно перезапущено")
-        sys.exit(0)
     else:
         logger.error("Не удалось перезапустить приложение")
+    return restarted
+
+# === Основной блок ===
+def main():
+    if len(sys.argv) < 2:
+        logger.error("Не указан IP. Использование: python3 app_restart.py <IP>")
         sys.exit(1)
 
+    if len(sys.argv) > 2:
+        set_trace_id(sys.argv[2])  # sudo не передаёт окружение, TRACE_ID приходит аргументом
+    sys.exit(0 if restart_by_ip(sys.argv[1]) else 1)
+
 if __name__ == "__main__":
-    main()
+    with span("restart_app", ip=sys.argv[1] if len(sys.argv) > 1 else ""):
+        main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Rebuilds per-node registration timelines from trace span logs.
+
+Usage:
+    trace_report.py [--ip IP] [--trace ID] [--percentiles] [--json] <trace.jsonl>...
+
+Accepts any mix of central (/fluxsign/logs/trace.jsonl) and container
+(/app/logs/trace.jsonl) logs; spans are joined by trace_id.
+"""
+import argparse
+import json
+import math
+import sys
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+
+def load_spans(paths: Iterable[str]) -> List[dict]:
+    spans = []
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if "span" in record and "start_ms" in record:
+                        spans.append(record)
+        except OSError as e:
+            print(f"⚠️ Cannot read {path}: {e}", file=sys.stderr)
+    return spans
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values: List[float]) -> dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def build_timelines(spans: List[dict]) -> Dict[str, dict]:
+    """Groups spans by trace_id; the node IP is taken from any span that carries it."""
+    traces = defaultdict(lambda: {"ip": "", "spans": []})
+    for record in spans:
+        trace = traces[record.get("trace_id", "-")]
+        trace["spans"].append(record)
+        if record.get("ip") and not trace["ip"]:
+            trace["ip"] = record["ip"]
+    for trace in traces.values():
+        trace["spans"].sort(key=lambda r: r["start_ms"])
+        first = trace["spans"][0]["start_ms"]
+        last = max(r["start_ms"] + r.get("duration_ms", 0) for r in trace["spans"])
+        trace["start_ms"] = first
+        trace["total_ms"] = last - first
+    return dict(traces)
+
+
+def stage_percentiles(spans: List[dict]) -> Dict[str, dict]:
+    by_stage = defaultdict(list)
+    for record in spans:
+        by_stage[record["span"]].append(float(record.get("duration_ms", 0)))
+    return {stage: summarize(values) for stage, values in sorted(by_stage.items())}
+
+
+def format_ms(ms: float) -> str:
+    return f"{ms / 1000:.1f}s" if ms >= 1000 else f"{ms:.0f}ms"
+
+
+def print_timeline(trace_id: str, trace: dict) -> None:
+    started = datetime.fromtimestamp(trace["start_ms"] / 1000).strftime("%Y-%m-%d %H:%M:%S")
+    print(f"=== {trace['ip'] or '?'}  trace={trace_id}  start={started}  total={format_ms(trace['total_ms'])}")
+    for record in trace["spans"]:
+        offset = record["start_ms"] - trace["start_ms"]
+        print(
+            f"  +{format_ms(offset):>8}  {format_ms(record.get('duration_ms', 0)):>8}  "
+            f"{record.get('script', ''):<28} {record['span']:<22} {record.get('status', '')}"
+        )
+
+
+def print_percentiles(stats: Dict[str, dict]) -> None:
+    print(f"{'stage':<24}{'count':>7}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+    for stage, s in stats.items():
+        print(
+            f"{stage:<24}{s['count']:>7}{format_ms(s['p50']):>10}{format_ms(s['p90']):>10}"
+            f"{format_ms(s['p99']):>10}{format_ms(s['max']):>10}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Registration trace timelines and per-stage percentiles")
+    parser.add_argument("logs", nargs="+", help="trace.jsonl files (central and/or container)")
+    parser.add_argument("--ip", help="only traces of this node IP")
+    parser.add_argument("--trace", help="only this trace id")
+    parser.add_argument("--percentiles", action="store_true", help="per-stage p50/p90/p99 instead of timelines")
+    parser.add_argument("--json", action="store_true", help="machine-readable output")
+    args = parser.parse_args()
+
+    traces = build_timelines(load_spans(args.logs))
+    if args.trace:
+        traces = {k: v for k, v in traces.items() if k == args.trace}
+    if args.ip:
+        traces = {k: v for k, v in traces.items() if v["ip"] == args.ip}
+
+    if args.percentiles:
+        selected = [r for t in traces.values() for r in t["spans"]]
+        stats = stage_percentiles(selected)
+        stats["total"] = summarize([t["total_ms"] for t in traces.values()])
+        if args.json:
+            print(json.dumps(stats, indent=2))
+        else:
+            print_percentiles(stats)
+        return
+
+    ordered = sorted(traces.items(), key=lambda kv: kv[1]["start_ms"])
+    if args.json:
+        print(json.dumps(dict(ordered), indent=2, ensure_ascii=False))
+        return
+    for trace_id, trace in ordered:
+        print_timeline(trace_id, trace)
+
+
+if __name__ == "__main__":
+    main()
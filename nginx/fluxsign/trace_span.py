@@ -0,0 +1,89 @@
+"""
+Structured timing spans for end-to-end registration tracing.
+
+start.sh generates a TRACE_ID per registration attempt and forwards it with
+every SSH command (as an environment variable) and every HTTP request
+(as the X-Trace-Id header). Central scripts wrap their stages in span(),
+which appends one JSON line per stage to TRACE_LOG. trace_report.py
+rebuilds per-node timelines from these lines.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+TRACE_LOG = Path(os.getenv("TRACE_LOG", os.path.join(os.getenv("FLUXSIGN_LOG_DIR", "/fluxsign/logs"), "trace.jsonl")))
+SCRIPT_NAME = Path(sys.argv[0]).name if sys.argv and sys.argv[0] else "python"
+
+# Resident servers (control_api.py) handle several traces at once, one per thread
+_local = threading.local()
+
+
+def get_trace_id() -> str:
+    return getattr(_local, "trace_id", None) or os.getenv("TRACE_ID", "").strip() or "-"
+
+
+def set_trace_id(trace_id: str) -> None:
+    """Used by scripts that receive the trace id as an argument (sudo drops the environment)."""
+    if trace_id:
+        os.environ["TRACE_ID"] = trace_id
+
+
+@contextmanager
+def trace_context(trace_id: str):
+    """Sets the trace id for the current thread only, e.g. from a request's X-Trace-Id."""
+    previous = getattr(_local, "trace_id", None)
+    _local.trace_id = trace_id if trace_id and trace_id != "-" else None
+    try:
+        yield
+    finally:
+        _local.trace_id = previous
+
+
+def emit(record: dict) -> None:
+    line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+    try:
+        TRACE_LOG.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(TRACE_LOG, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        try:
+            os.write(fd, line.encode("utf-8"))
+        finally:
+            os.close(fd)
+    except OSError:
+        pass  # Tracing must never break the traced script
+
+
+@contextmanager
+def span(name: str, ip: str = "", **fields):
+    """
+    Measures the wrapped block and writes it as a span.
+
+    The yielded dict may be updated by the caller to attach extra fields
+    (e.g. a result code). SystemExit is recorded as the span status.
+    """
+    start_ms = int(time.time() * 1000)
+    started = time.monotonic()
+    status = "ok"
+    try:
+        yield fields
+    except SystemExit as e:
+        status = "ok" if e.code in (0, None) else f"exit:{e.code}"
+        raise
+    except Exception as e:
+        status = f"error:{type(e).__name__}"
+        raise
+    finally:
+        record = {
+            "trace_id": get_trace_id(),
+            "script": SCRIPT_NAME,
+            "span": name,
+            "ip": ip,
+            "start_ms": start_ms,
+            "duration_ms": round((time.monotonic() - started) * 1000, 1),
+            "status": fields.pop("status", status),
+        }
+        record.update(fields)
+        emit(record)
@@ -0,0 +1,53 @@
+"""
+Per-project FIFO waitlist of nodes that run in 'other' because their own
+project was full.
+
+waitlist.json lives next to ip_mapping.json:
+
+    {"my_project": [{"ip": "1.2.3.4", "since": 1760000000},
+                    {"ip": "5.6.7.8", "since": 1760000100, "restarted_at": 1760000400, "attempts": 1}]}
+
+start.sh joins it (run_join_waitlist.py or POST /waitlist on control_api.py)
+instead of polling for a free port itself; rebalancer.py hands free ports
+to the entries in order and restarts them. Writers hold the mapping lock
+of ip_leases.py, like every other writer of the mapping files.
+"""
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ip_leases import HTML_DIR, OTHER_PROJECT, load_json, mapping_lock, write_json_atomic
+
+WAITLIST_NAME = "waitlist.json"
+
+
+def remove_ip(waitlist: Dict[str, List[dict]], ip: str, keep_project: Optional[str] = None):
+    """Drops ip from every project list except keep_project (in place)."""
+    for project in list(waitlist):
+        if project == keep_project:
+            continue
+        waitlist[project] = [entry for entry in waitlist[project] if entry["ip"] != ip]
+        if not waitlist[project]:
+            del waitlist[project]
+
+
+def add_entry(waitlist: Dict[str, List[dict]], ip: str, project: str, now: Optional[float] = None) -> int:
+    """Queues ip for project and returns its 1-based position; a node already queued keeps its place."""
+    remove_ip(waitlist, ip, keep_project=project)
+    entries = waitlist.setdefault(project, [])
+    for position, entry in enumerate(entries, 1):
+        if entry["ip"] == ip:
+            return position
+    entries.append({"ip": ip, "since": int(now or time.time())})
+    return len(entries)
+
+
+def join(ip: str, project: str, html_dir: Path = HTML_DIR) -> int:
+    if project == OTHER_PROJECT:
+        raise ValueError("cannot wait for 'other'")
+    path = html_dir / WAITLIST_NAME
+    with mapping_lock(html_dir / ".ip_mapping.lock"):
+        waitlist = load_json(path, {})
+        position = add_entry(waitlist, ip, project)
+        write_json_atomic(path, waitlist)
+    return position
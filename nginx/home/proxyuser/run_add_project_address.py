@@ -1,12 +1,23 @@
 import json
+import os
 import sys
 import logging
 
+# Общие модули центральных скриптов лежат в /fluxsign
+sys.path.insert(0, os.getenv("FLUXSIGN_DIR", "/fluxsign"))
+import control_client  # noqa: E402
+from ip_leases import OTHER_PROJECT, mapping_lock, touch_lease, write_json_atomic  # noqa: E402
+from port_mapping import port_in_project  # noqa: E402
+from trace_span import span  # noqa: E402
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-PORTS_FILE = "/usr/share/nginx/html/port_mapping.json"
-IP_MAPPING_FILE = "/usr/share/nginx/html/ip_mapping.json"
+HTML_DIR = os.getenv("NGINX_HTML_DIR", "/usr/share/nginx/html")
+PORTS_FILE = os.path.join(HTML_DIR, "port_mapping.json")
+IP_MAPPING_FILE = os.path.join(HTML_DIR, "ip_mapping.json")
+LEASES_FILE = os.path.join(HTML_DIR, "ip_leases.json")
+MAPPING_LOCK = os.path.join(HTML_DIR, ".ip_mapping.lock")
 
 def load_json(file_path):
     """ Загружает JSON-файл """
@@ -21,10 +32,9 @@ def load_json(file_path):
         return {}
 
 def save_json(file_path, data):
-    """ Сохраняет JSON-файл с обновленными данными """
+    """ Атомарно сохраняет JSON-файл с обновленными данными """
     try:
-        with open(file_path, "w") as file:
-            json.dump(data, file, separators=(",", ":"))
+        write_json_atomic(file_path, data)
         logging.info(f"Файл {file_path} успешно обновлен.")
         return True
     except PermissionError:
@@ -36,21 +46,28 @@ def save_json(file_path, data):
 
 def validate_project_and_port(project_name, port):
     """ Проверяет, существует ли проект и порт """
-    ports_data = load_json(PORTS_FILE)
-    if project_name in ports_data and port in ports_data[project_name]:
+    if port_in_project(PORTS_FILE, project_name, port):
         return True
     logging.error(f"Порт {port} не связан с проектом {project_name}.")
     return False
 
-def add_ip_to_project(container_ip, project_name, port):
-    """Добавляет IP контейнера в проект, если это разрешено."""
+def add_ip_to_project(container_ip, project_name, port, slot=0):
+    """Добавляет IP контейнера в проект, если это разрешено. slot — номер туннеля узла (TUNNELS_PER_NODE)."""
 
-    # 1) Если проект — "other", ничего не делаем
+    # 1) Если проект — "other", в маппинг не добавляем. Непривязанный IP получает
+    #    аренду 'other', чтобы reconcile.py не считал его незарегистрированным
     if project_name.lower() == "other":
         logging.info(
             f"Проект определен как 'other', "
             f"IP {container_ip} не был добавлен."
         )
+        if port_in_project(PORTS_FILE, OTHER_PROJECT, port):
+            with mapping_lock(MAPPING_LOCK):
+                ip_data = load_json(IP_MAPPING_FILE)
+                if not any(container_ip in ips for ips in ip_data.values()):
+                    leases = load_json(LEASES_FILE) if os.path.exists(LEASES_FILE) else {}
+                    touch_lease(leases, container_ip, OTHER_PROJECT, port, slot=slot)
+                    save_json(LEASES_FILE, leases)
         return (
             f"Проект определен как 'other', "
             f"IP {container_ip} не был добавлен."
@@ -64,35 +81,47 @@ def add_ip_to_project(container_ip, project_name, port):
         )
         return "Ошибка: порт не соответствует проекту."
 
-    # 3) Загружаем текущее распределение IP
-    ip_data = load_json(IP_MAPPING_FILE)
-
-    # 4) Глобальная проверка: IP не должен быть в другом проекте
-    for existing_proj, ips in ip_data.items():
-        if existing_proj != project_name and container_ip in ips:
-            logging.error(
-                f"IP {container_ip} уже принадлежит проекту {existing_proj}, "
-                f"нельзя добавить в {project_name}."
-            )
-            return (
-                f"Ошибка: IP {container_ip} уже назначен проекту "
-                f"{existing_proj}."
-            )
-
-    # 5) Если проекта нет в маппинге — создаём подраздел
-    if project_name not in ip_data:
-        ip_data[project_name] = []
-
-    # 6) Если IP ещё не в своём проекте — добавляем и сохраняем
-    if container_ip not in ip_data[project_name]:
-        ip_data[project_name].append(container_ip)
-        save_json(IP_MAPPING_FILE, ip_data)
-        logging.info(
-            f"Успешно добавлен IP {container_ip} в проект {project_name}."
-        )
-        return "success"
-
-    # 7) Если IP уже в списке этого же проекта — просто возвращаем успех
+    try:
+        # 3) Загружаем текущее распределение IP. Чтение и запись — под блокировкой,
+        #    иначе параллельные регистрации затирают друг друга
+        with mapping_lock(MAPPING_LOCK):
+            ip_data = load_json(IP_MAPPING_FILE)
+
+            # 4) Глобальная проверка: IP не должен быть в другом проекте
+            for existing_proj, ips in ip_data.items():
+                if existing_proj != project_name and container_ip in ips:
+                    logging.error(
+                        f"IP {container_ip} уже принадлежит проекту {existing_proj}, "
+                        f"нельзя добавить в {project_name}."
+                    )
+                    return (
+                        f"Ошибка: IP {container_ip} уже назначен проекту "
+                        f"{existing_proj}."
+                    )
+
+            # 5) Если проекта нет в маппинге — создаём подраздел
+            if project_name not in ip_data:
+                ip_data[project_name] = []
+
+            # 6) Регистрация продлевает аренду привязки (см. reap_leases.py)
+            leases = load_json(LEASES_FILE) if os.path.exists(LEASES_FILE) else {}
+            touch_lease(leases, container_ip, project_name, port, slot=slot)
+            save_json(LEASES_FILE, leases)
+
+            # 7) Если IP ещё не в своём проекте — добавляем и сохраняем
+            if container_ip not in ip_data[project_name]:
+                ip_data[project_name].append(container_ip)
+                save_json(IP_MAPPING_FILE, ip_data)
+                logging.info(
+                    f"Успешно добавлен IP {container_ip} в проект {project_name}."
+                )
+                return "success"
+    except PermissionError as e:
+        # .ip_mapping.lock и временные файлы создаются в самом HTML_DIR
+        logging.error(f"Нет прав на запись в {HTML_DIR}: {e}")
+        return f"Ошибка: нет прав на запись в {HTML_DIR}."
+
+    # 8) Если IP уже в списке этого же проекта — просто возвращаем успех
     logging.info(
         f"IP {container_ip} уже присутствует "
         f"в проекте {project_name}."
@@ -101,19 +130,30 @@ def add_ip_to_project(container_ip, project_name, port):
 
 
 def main():
-    if len(sys.argv) != 4:
-        logging.error("Использование: python3 run_add_project_address.py <container_ip> <project_name> <port>")
+    if len(sys.argv) not in (4, 5):
+        logging.error("Использование: python3 run_add_project_address.py <container_ip> <project_name> <port> [slot]")
         sys.exit(1)
     
     container_ip = sys.argv[1]
     project_name = sys.argv[2]
     try:
         port = int(sys.argv[3])
+        slot = int(sys.argv[4]) if len(sys.argv) == 5 else 0
     except ValueError:
-        logging.error("Ошибка: указан неверный номер порта.")
+        logging.error("Ошибка: указан неверный номер порта или слота.")
         sys.exit(1)
 
-    result = add_ip_to_project(container_ip, project_name, port)
+    with span("add_project_address", ip=container_ip, project=project_name, port=port, slot=slot) as fields:
+        response = control_client.call("add-mapping", {"ip": container_ip, "project": project_name, "port": port,
+                                                       "slot": slot})
+        if response is not None and "result" in response:
+            result, fields["via"] = response["result"], "control_api"
+        elif response is not None:
+            # API ответил отказом — локально не повторяем, чтобы не обойти его проверки
+            result, fields["via"] = f"Ошибка: {response.get('error')}", "control_api"
+        else:
+            result = add_ip_to_project(container_ip, project_name, port, slot)
+        fields["result"] = result
     print(result)
     
 if __name__ == "__main__":
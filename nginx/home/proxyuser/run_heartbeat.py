@@ -0,0 +1,101 @@
+import os
+import sys
+import logging
+
+sys.path.insert(0, os.getenv("FLUXSIGN_DIR", "/fluxsign"))
+import control_client  # noqa: E402
+from ip_leases import (  # noqa: E402
+    OTHER_PROJECT, TRAFFIC_COUNTERS, add_traffic, load_json, mapping_lock, touch_lease, write_json_atomic,
+)
+from port_mapping import port_in_project  # noqa: E402
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+HTML_DIR = os.getenv("NGINX_HTML_DIR", "/usr/share/nginx/html")
+PORTS_FILE = os.path.join(HTML_DIR, "port_mapping.json")
+IP_MAPPING_FILE = os.path.join(HTML_DIR, "ip_mapping.json")
+LEASES_FILE = os.path.join(HTML_DIR, "ip_leases.json")
+MAPPING_LOCK = os.path.join(HTML_DIR, ".ip_mapping.lock")
+
+
+def heartbeat(container_ip, port=None, traffic=None, slot=None):
+    """
+    Продлевает аренду привязки IP к проекту и добавляет к ней счётчики 3proxy
+    за интервал (traffic: bytes_in, bytes_out, connections[, seconds]).
+    slot — номер туннеля узла (TUNNELS_PER_NODE > 1): порт продлевается за этим слотом.
+    IP без привязки с туннелем в 'other' получает аренду проекта 'other'
+    (по ней reconcile.py отличает его от незарегистрированного экземпляра).
+    """
+    if traffic:
+        logging.info(f"Трафик {container_ip}: " + ", ".join(f"{key}={traffic.get(key, 0)}" for key in TRAFFIC_COUNTERS))
+    try:
+        with mapping_lock(MAPPING_LOCK):
+            ip_data = load_json(IP_MAPPING_FILE, {})
+            project = next((name for name, ips in ip_data.items() if container_ip in ips), None)
+            if project is None and (port is None or not port_in_project(PORTS_FILE, OTHER_PROJECT, port)):
+                logging.info(f"IP {container_ip} не привязан к проекту, аренда не продлевается.")
+                return "unbound"
+            if project is not None and port is not None and not port_in_project(PORTS_FILE, project, port):
+                # Порт не из диапазона проекта: продлеваем только last_seen, порт не записываем
+                logging.warning(f"Порт {port} не связан с проектом {project}, IP {container_ip}.")
+                port = None
+            leases = load_json(LEASES_FILE, {})
+            touch_lease(leases, container_ip, project or OTHER_PROJECT, port, slot=slot)
+            if traffic:
+                add_traffic(leases[container_ip], traffic)
+            write_json_atomic(LEASES_FILE, leases)
+    except PermissionError as e:
+        logging.error(f"Нет прав на запись в {HTML_DIR}: {e}")
+        return "error"
+
+    logging.info(f"Аренда IP {container_ip} в проекте {project} продлена.")
+    return "success"
+
+
+def main():
+    slot = None
+    if "--slot" in sys.argv[:-1]:
+        index = sys.argv.index("--slot")
+        try:
+            slot = int(sys.argv[index + 1])
+        except ValueError:
+            logging.error("Ошибка: указан неверный номер слота.")
+            sys.exit(1)
+        del sys.argv[index:index + 2]
+    if len(sys.argv) not in (2, 3, 6, 7):
+        logging.error("Использование: python3 run_heartbeat.py <container_ip> [port] "
+                      "[bytes_in bytes_out connections [seconds]] [--slot N]")
+        sys.exit(1)
+
+    container_ip = sys.argv[1]
+    try:
+        port = int(sys.argv[2]) if len(sys.argv) >= 3 else None
+    except ValueError:
+        logging.error("Ошибка: указан неверный номер порта.")
+        sys.exit(1)
+    traffic = None
+    if len(sys.argv) >= 6:
+        try:
+            traffic = dict(zip(TRAFFIC_COUNTERS + ("seconds",), (int(value) for value in sys.argv[3:])))
+        except ValueError:
+            logging.error("Ошибка: счётчики трафика должны быть целыми числами.")
+            sys.exit(1)
+
+    payload = {"ip": container_ip, "port": port}
+    if traffic:
+        payload["traffic"] = traffic
+    if slot is not None:
+        payload["slot"] = slot
+    response = control_client.call("heartbeat", payload)
+    if response is not None and "result" in response:
+        print(response["result"])
+    elif response is not None:
+        logging.error(f"Control API: {response.get('error')}")
+        sys.exit(1)
+    else:
+        print(heartbeat(container_ip, port, traffic, slot))
+
+
+if __name__ == "__main__":
+    main()
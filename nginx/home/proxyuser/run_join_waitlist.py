@@ -0,0 +1,40 @@
+import os
+import sys
+import logging
+
+sys.path.insert(0, os.getenv("FLUXSIGN_DIR", "/fluxsign"))
+import control_client  # noqa: E402
+from trace_span import span  # noqa: E402
+from waitlist import join  # noqa: E402
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+def main():
+    """Ставит узел, временно работающий в 'other', в очередь своего проекта (см. /fluxsign/rebalancer.py)."""
+    if len(sys.argv) != 3:
+        logging.error("Использование: python3 run_join_waitlist.py <container_ip> <project_name>")
+        sys.exit(1)
+
+    container_ip, project_name = sys.argv[1], sys.argv[2]
+    with span("join_waitlist", ip=container_ip, project=project_name) as fields:
+        response = control_client.call("waitlist", {"ip": container_ip, "project": project_name})
+        if response is not None and "position" in response:
+            position, fields["via"] = response["position"], "control_api"
+        elif response is not None:
+            logging.error(f"Ошибка: {response.get('error')}")
+            sys.exit(1)
+        else:
+            try:
+                position = join(container_ip, project_name)
+            except ValueError as e:
+                logging.error(f"Ошибка: {e}")
+                sys.exit(1)
+        fields["position"] = position
+    logging.info(f"IP {container_ip} в очереди проекта {project_name}, позиция {position}.")
+    print(position)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,12 @@
+import os
 import subprocess
 import sys
 import logging
 
+sys.path.insert(0, os.getenv("FLUXSIGN_DIR", "/fluxsign"))
+import control_client  # noqa: E402
+from trace_span import get_trace_id, span  # noqa: E402
+
 # ????????? ??????????? ? ???????
 logging.basicConfig(
     level=logging.DEBUG,             # ??????? ???????????
@@ -11,8 +16,17 @@ logging.basicConfig(
 def run_remove_app(container_ip: str) -> int:
     logging.info(f"Starting removal process for container: {container_ip}")
     
+    # Резидентный control API выполняет то же самое без sudo и запуска Python
+    response = control_client.call("remove", {"ip": container_ip})
+    if response is not None:
+        logging.info(f"Control API response: {response}")
+        return int(response.get("code", 1))
+
     try:
         command = ["sudo", "python3", "/fluxsign/remove_app.py", container_ip]
+        if get_trace_id() != "-":
+            # sudo сбрасывает окружение, поэтому TRACE_ID передаётся аргументом
+            command.append(get_trace_id())
         logging.debug(f"Executing command: {' '.join(command)}")
         
         result = subprocess.run(
@@ -39,6 +53,8 @@ if __name__ == "__main__":
     
     container_ip = sys.argv[1]
     logging.info(f"Script started with IP: {container_ip}")
-    exit_code = run_remove_app(container_ip)
+    with span("run_remove_app", ip=container_ip) as fields:
+        exit_code = run_remove_app(container_ip)
+        fields["exit_code"] = exit_code
     logging.info(f"Script finished with exit code: {exit_code}")
     sys.exit(exit_code)
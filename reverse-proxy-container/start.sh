@@ -26,11 +26,68 @@ done
 REMOTE_SCRIPT_PATH="/home/proxyuser/run_remove_app.py"
 REMOTE_ADD_PROJECT_SCRIPT="/home/proxyuser/run_add_project_address.py"
 REMOTE_BLACKLIST_SCRIPT="/fluxsign/check_blacklist.py"
+REMOTE_HEARTBEAT_SCRIPT="/home/proxyuser/run_heartbeat.py"
+REMOTE_WAITLIST_SCRIPT="/home/proxyuser/run_join_waitlist.py"
+# Как часто продлевать аренду привязки IP к проекту (центральный reap_leases.py
+# снимает привязки, которые не продлевались дольше LEASE_TTL_HOURS)
+LEASE_HEARTBEAT_INTERVAL="${LEASE_HEARTBEAT_INTERVAL:-300}"
+# Сколько свободных портов запрашивать у API для проверки через nc -z
+PORT_CANDIDATES="${PORT_CANDIDATES:-20}"
+# Сколько параллельных туннелей (ssh -R) держит узел; 1 — прежний режим с одним туннелем
+TUNNELS_PER_NODE="${TUNNELS_PER_NODE:-1}"
+# После стольких неудачных регистраций подряд слот выходит, и проект выбирается заново
+TUNNEL_REGISTER_RETRIES="${TUNNEL_REGISTER_RETRIES:-3}"
 
 log() {
     echo "$(date '+%Y-%m-%d %H:%M:%S') $1"
 }
 
+# === Трассировка регистрации ===
+# TRACE_ID передаётся в каждую SSH-команду (переменной окружения) и в каждый
+# HTTP-запрос (заголовком X-Trace-Id); центральные скрипты пишут с ним JSON-спаны.
+TRACE_LOG="/app/logs/trace.jsonl"
+mkdir -p /app/logs
+
+new_trace_id() {
+    cat /proc/sys/kernel/random/uuid 2>/dev/null || echo "$(date +%s)-$RANDOM$RANDOM"
+}
+
+now_ms() {
+    date +%s%3N
+}
+
+# trace_span <name> <start_ms> [status]
+trace_span() {
+    local END_MS
+    END_MS=$(now_ms)
+    printf '{"trace_id":"%s","script":"start.sh","span":"%s","ip":"%s","start_ms":%s,"duration_ms":%s,"status":"%s"}\n' \
+        "$TRACE_ID" "$1" "$CONTAINER_IP" "$2" "$((END_MS - $2))" "${3:-ok}" >> "$TRACE_LOG"
+}
+
+api_get() {
+    curl -s -H "X-Trace-Id: $TRACE_ID" "http://$NGINX_HOST:$NGINX_PORT_API/$1"
+}
+
+# === Control API (необязательно) ===
+# Если в .env заданы CONTROL_API_URL и CONTROL_API_TOKEN, проверка, регистрация,
+# heartbeat и удаление идут одним HTTP-запросом вместо SSH-команды.
+# Если API не настроен или недоступен, используется прежний путь через SSH.
+# control_post <endpoint> <json> — тело ответа в stdout, код 1 при недоступности
+control_post() {
+    if [ -z "$CONTROL_API_URL" ] || [ -z "$CONTROL_API_TOKEN" ]; then
+        return 1
+    fi
+    curl -sf -m 180 -X POST \
+        -H "Authorization: Bearer $CONTROL_API_TOKEN" \
+        -H "Content-Type: application/json" \
+        -H "X-Trace-Id: $TRACE_ID" \
+        -d "$2" "${CONTROL_API_URL%/}/$1"
+}
+
+export TRACE_ID
+TRACE_ID=$(new_trace_id)
+log "🧵 Trace id: $TRACE_ID"
+
 # Получаем внешний IP контейнера
 get_external_ip() {
     IP_SERVICES=(
@@ -55,6 +112,7 @@ get_external_ip() {
 }
 
 # Попытка получить внешний IP с периодическим ожиданием
+SPAN_START=$(now_ms)
 while true; do
     CONTAINER_IP=$(get_external_ip)
     if [[ -n "$CONTAINER_IP" ]]; then
@@ -65,14 +123,24 @@ while true; do
     log "❌ Failed to determine external IP. Retrying in 15 minutes..."
     sleep 900
 done
+trace_span "ip_detect" "$SPAN_START"
 
 # Проверка на наличие IP контейнера в черном списке
 check_blacklist() {
     log "🔍 Checking if IP $CONTAINER_IP is valid via remote script..."
 
-    SSH_CMD="python3 $REMOTE_BLACKLIST_SCRIPT '$CONTAINER_IP'"
-    sshpass -p "$SSH_PASS" ssh -o StrictHostKeyChecking=no "$SSH_USER@$NGINX_HOST" "$SSH_CMD"
-    EXIT_CODE=$?
+    SSH_CMD="TRACE_ID='$TRACE_ID' python3 $REMOTE_BLACKLIST_SCRIPT '$CONTAINER_IP'"
+    local SPAN_START CHECK_RESPONSE
+    SPAN_START=$(now_ms)
+    if CHECK_RESPONSE=$(control_post check "{\"ip\":\"$CONTAINER_IP\"}") \
+        && EXIT_CODE=$(echo "$CHECK_RESPONSE" | jq -er '.code'); then
+        log "📡 Control API response (check): $CHECK_RESPONSE"
+        trace_span "blacklist_api" "$SPAN_START" "exit:$EXIT_CODE"
+    else
+        sshpass -p "$SSH_PASS" ssh -o StrictHostKeyChecking=no "$SSH_USER@$NGINX_HOST" "$SSH_CMD"
+        EXIT_CODE=$?
+        trace_span "blacklist_ssh" "$SPAN_START" "exit:$EXIT_CODE"
+    fi
 
     log "📡 Remote check exit code: $EXIT_CODE"
 
@@ -84,8 +152,13 @@ check_blacklist() {
             log "❌ IP is blacklisted or blocked. Triggering remote removal..."
 
             while true; do
-                sshpass -p "$SSH_PASS" ssh -o StrictHostKeyChecking=no "$SSH_USER@$NGINX_HOST" \
-                    "python3 $REMOTE_SCRIPT_PATH '$CONTAINER_IP'"
+                if REMOVE_RESPONSE=$(control_post remove "{\"ip\":\"$CONTAINER_IP\"}"); then
+                    log "📡 Control API response (remove): $REMOVE_RESPONSE"
+                    echo "$REMOVE_RESPONSE" | jq -e '.code == 0' >/dev/null
+                else
+                    sshpass -p "$SSH_PASS" ssh -o StrictHostKeyChecking=no "$SSH_USER@$NGINX_HOST" \
+                        "TRACE_ID='$TRACE_ID' python3 $REMOTE_SCRIPT_PATH '$CONTAINER_IP'"
+                fi
                 # shellcheck disable=SC2181
                 if [[ $? -eq 0 ]]; then
                     log "✅ remove_app.py executed successfully!"
@@ -132,11 +205,70 @@ check_blacklist() {
 
 add_project_address() {
     log "📡 Adding IP $CONTAINER_IP to project: $PROJECT_NAME with port: $AVAILABLE_PORT"
-    ADD_PROJECT_RESPONSE=$(sshpass -p "$SSH_PASS" ssh -o StrictHostKeyChecking=no "$SSH_USER@$NGINX_HOST" \
-        "python3 $REMOTE_ADD_PROJECT_SCRIPT '$CONTAINER_IP' '$PROJECT_NAME' '$AVAILABLE_PORT'" 2>&1)
+    local SPAN_START
+    SPAN_START=$(now_ms)
+    if ADD_PROJECT_RESPONSE=$(control_post add-mapping \
+        "{\"ip\":\"$CONTAINER_IP\",\"project\":\"$PROJECT_NAME\",\"port\":$AVAILABLE_PORT${TUNNEL_SLOT:+,\"slot\":$TUNNEL_SLOT}}"); then
+        ADD_PROJECT_RESPONSE=$(echo "$ADD_PROJECT_RESPONSE" | jq -r '.result')
+        trace_span "add_project_api" "$SPAN_START"
+    else
+        ADD_PROJECT_RESPONSE=$(sshpass -p "$SSH_PASS" ssh -o StrictHostKeyChecking=no "$SSH_USER@$NGINX_HOST" \
+            "TRACE_ID='$TRACE_ID' python3 $REMOTE_ADD_PROJECT_SCRIPT '$CONTAINER_IP' '$PROJECT_NAME' '$AVAILABLE_PORT'${TUNNEL_SLOT:+ '$TUNNEL_SLOT'}" 2>&1)
+        trace_span "add_project_ssh" "$SPAN_START"
+    fi
     log "📡 Response from run_add_project_address.py: $ADD_PROJECT_RESPONSE"
 }
 
+# Очередь своего проекта: пока узел работает в 'other', центральный rebalancer.py
+# перезапустит его, когда в проекте освободится порт (FIFO, пакетами)
+join_waitlist() {
+    local POSITION SPAN_START
+    SPAN_START=$(now_ms)
+    if POSITION=$(control_post waitlist "{\"ip\":\"$CONTAINER_IP\",\"project\":\"$1\"}"); then
+        POSITION=$(echo "$POSITION" | jq -r '.position')
+        trace_span "waitlist_api" "$SPAN_START"
+    else
+        POSITION=$(sshpass -p "$SSH_PASS" ssh -o StrictHostKeyChecking=no -o ConnectTimeout=10 "$SSH_USER@$NGINX_HOST" \
+            "TRACE_ID='$TRACE_ID' python3 $REMOTE_WAITLIST_SCRIPT '$CONTAINER_IP' '$1'" 2>/dev/null)
+        trace_span "waitlist_ssh" "$SPAN_START"
+    fi
+    log "📋 Waitlist of $1: position ${POSITION:-unknown}"
+}
+
+# Фоновое продление аренды, пока жив туннель
+start_lease_heartbeat() {
+    stop_lease_heartbeat
+    (
+        local BYTES_IN BYTES_OUT CONNECTIONS TRAFFIC_JSON TRAFFIC_ARGS
+        while true; do
+            sleep "$LEASE_HEARTBEAT_INTERVAL"
+            TRAFFIC_JSON=""
+            TRAFFIC_ARGS=""
+            # Счётчики 3proxy за интервал уходят на сервер вместе с heartbeat
+            # (один 3proxy на узел, поэтому при нескольких туннелях их отправляет только слот 0)
+            if [ "${TUNNEL_SLOT:-0}" = 0 ] && read -r BYTES_IN BYTES_OUT CONNECTIONS < <(collect_traffic) \
+                && [ -n "$CONNECTIONS" ]; then
+                TRAFFIC_JSON=",\"traffic\":{\"bytes_in\":$BYTES_IN,\"bytes_out\":$BYTES_OUT,\"connections\":$CONNECTIONS,\"seconds\":$LEASE_HEARTBEAT_INTERVAL}"
+                TRAFFIC_ARGS=" '$BYTES_IN' '$BYTES_OUT' '$CONNECTIONS' '$LEASE_HEARTBEAT_INTERVAL'"
+                log "📊 Traffic: in $BYTES_IN B, out $BYTES_OUT B, $CONNECTIONS connections"
+            fi
+            control_post heartbeat "{\"ip\":\"$CONTAINER_IP\",\"port\":$AVAILABLE_PORT${TUNNEL_SLOT:+,\"slot\":$TUNNEL_SLOT}$TRAFFIC_JSON}" >/dev/null \
+                || sshpass -p "$SSH_PASS" ssh -o StrictHostKeyChecking=no -o ConnectTimeout=5 "$SSH_USER@$NGINX_HOST" \
+                    "TRACE_ID='$TRACE_ID' python3 $REMOTE_HEARTBEAT_SCRIPT '$CONTAINER_IP' '$AVAILABLE_PORT'$TRAFFIC_ARGS${TUNNEL_SLOT:+ --slot '$TUNNEL_SLOT'}" >/dev/null 2>&1 \
+                || log "⚠️ Lease heartbeat failed"
+        done
+    ) &
+    HEARTBEAT_PID=$!
+}
+
+stop_lease_heartbeat() {
+    if [ -n "$HEARTBEAT_PID" ]; then
+        kill "$HEARTBEAT_PID" 2>/dev/null
+        wait "$HEARTBEAT_PID" 2>/dev/null
+        HEARTBEAT_PID=""
+    fi
+}
+
 # Изначальная проверка черного списка
 check_blacklist
 
@@ -144,18 +276,96 @@ log "🚀 Starting 3proxy..."
 
 #!/bin/bash
 
+# === Профили 3proxy ===
+# PROXY_PROFILE в .env выбирает набор настроек: small, standard (по умолчанию),
+# heavy или legacy (прежний конфиг из четырёх строк, без DNS-кэша и счётчиков).
+# Отдельные значения профиля можно переопределить: PROXY_MAXCONN, PROXY_NSCACHE,
+# PROXY_TIMEOUTS, PROXY_NSERVERS. Списки в .env пишутся через запятую
+# (load_env_variables разбивает строки по пробелам).
+# timeouts: BYTE_SHORT BYTE_LONG STRING_SHORT STRING_LONG CHAIN CONNECT DNS CONNECTBACK
+PROXY_PROFILE="${PROXY_PROFILE:-standard}"
+PROXY_LOG="/app/logs/3proxy.log"
+# Смещение в PROXY_LOG, до которого трафик уже отправлен на сервер
+PROXY_LOG_OFFSET="/app/logs/3proxy.offset"
+# Лог обнуляется, когда вырастает больше этого размера (байт)
+PROXY_LOG_MAX_BYTES="${PROXY_LOG_MAX_BYTES:-52428800}"
+
+load_proxy_profile() {
+    local MAXCONN NSCACHE TIMEOUTS
+    case "$PROXY_PROFILE" in
+        small)
+            MAXCONN=100; NSCACHE=16384; TIMEOUTS="1 5 30 60 180 1800 15 60" ;;
+        standard)
+            MAXCONN=500; NSCACHE=65536; TIMEOUTS="1 5 30 60 180 1800 15 60" ;;
+        heavy)
+            MAXCONN=2000; NSCACHE=262144; TIMEOUTS="1 5 30 60 120 600 10 60" ;;
+        legacy)
+            MAXCONN=""; NSCACHE=""; TIMEOUTS="" ;;
+        *)
+            log "⚠️ Unknown PROXY_PROFILE '$PROXY_PROFILE', using standard"
+            PROXY_PROFILE=standard
+            MAXCONN=500; NSCACHE=65536; TIMEOUTS="1 5 30 60 180 1800 15 60" ;;
+    esac
+    PROXY_MAXCONN="${PROXY_MAXCONN:-$MAXCONN}"
+    PROXY_NSCACHE="${PROXY_NSCACHE:-$NSCACHE}"
+    PROXY_TIMEOUTS="${PROXY_TIMEOUTS:-$TIMEOUTS}"
+    PROXY_TIMEOUTS="${PROXY_TIMEOUTS//,/ }"
+    if [ "$PROXY_PROFILE" != legacy ]; then
+        PROXY_NSERVERS="${PROXY_NSERVERS:-1.1.1.1 8.8.8.8}"
+    fi
+    PROXY_NSERVERS="${PROXY_NSERVERS//,/ }"
+}
+
 # Function to write the 3proxy configuration
 write_config() {
-    echo "📄 Writing to 3proxy.cfg with user $PROXY_USER..."
+    echo "📄 Writing to 3proxy.cfg with user $PROXY_USER (profile $PROXY_PROFILE)..."
 
-    cat <<EOF > /app/3proxy.cfg
+    {
+        local NSERVER
+        for NSERVER in $PROXY_NSERVERS; do
+            echo "nserver $NSERVER"
+        done
+        [ -n "$PROXY_NSCACHE" ] && echo "nscache $PROXY_NSCACHE"
+        [ -n "$PROXY_TIMEOUTS" ] && echo "timeouts $PROXY_TIMEOUTS"
+        [ -n "$PROXY_MAXCONN" ] && echo "maxconn $PROXY_MAXCONN"
+        if [ "$PROXY_PROFILE" != legacy ]; then
+            # Одна строка на завершённое соединение: дата время код_ошибки байт_от_клиента байт_к_клиенту клиент
+            echo "log $PROXY_LOG"
+            echo 'logformat "L%Y-%m-%d %H:%M:%S %E %I %O %C"'
+        fi
+        cat <<EOF
 auth strong
 users $PROXY_USER:CL:$PROXY_PASS
 socks -p1080
 allow $PROXY_USER
 EOF
+    } > /app/3proxy.cfg
 }
 
+# collect_traffic — печатает "bytes_in bytes_out connections" по строкам PROXY_LOG,
+# появившимся после прошлого вызова, и сдвигает смещение. Код 1, если лога нет.
+collect_traffic() {
+    [ -f "$PROXY_LOG" ] || return 1
+    local SIZE OFFSET
+    SIZE=$(stat -c %s "$PROXY_LOG" 2>/dev/null) || return 1
+    OFFSET=$(cat "$PROXY_LOG_OFFSET" 2>/dev/null)
+    # Лог обнулили или он новый — считаем с начала
+    if ! [[ "$OFFSET" =~ ^[0-9]+$ ]] || [ "$OFFSET" -gt "$SIZE" ]; then
+        OFFSET=0
+    fi
+    tail -c +"$((OFFSET + 1))" "$PROXY_LOG" | head -c "$((SIZE - OFFSET))" \
+        | awk '{ bytes_in += $4; bytes_out += $5; connections++ }
+               END { printf "%d %d %d\n", bytes_in, bytes_out, connections }'
+    if [ "$SIZE" -gt "$PROXY_LOG_MAX_BYTES" ]; then
+        # 3proxy пишет с O_APPEND, поэтому усечение безопасно; теряются лишь строки последних мгновений
+        : > "$PROXY_LOG"
+        SIZE=0
+    fi
+    echo "$SIZE" > "$PROXY_LOG_OFFSET"
+}
+
+load_proxy_profile
+
 # Infinite loop to attempt writing the configuration
 while true; do
     write_config
@@ -172,41 +382,249 @@ done
 # Start 3proxy in the background
 3proxy /app/3proxy.cfg &
 
+# Узел центра из .env. В многоузловом центре проект обслуживает один из узлов
+# (поле "node" в ответе /assign_project); каждая итерация начинает с узла из .env.
+ENTRY_NGINX_HOST="$NGINX_HOST"
+ENTRY_NGINX_PORT_API="$NGINX_PORT_API"
+ENTRY_NGINX_SSH_PORT="$NGINX_SSH_PORT"
+ENTRY_CONTROL_API_URL="$CONTROL_API_URL"
+
+reset_central_node() {
+    NGINX_HOST="$ENTRY_NGINX_HOST"
+    NGINX_PORT_API="$ENTRY_NGINX_PORT_API"
+    NGINX_SSH_PORT="$ENTRY_NGINX_SSH_PORT"
+    CONTROL_API_URL="$ENTRY_CONTROL_API_URL"
+}
 
-while true; do
-    log "🔍 Fetching available ports..."
-    RESPONSE=$(curl -s http://$NGINX_HOST:$NGINX_PORT_API/available_ports)
-    log "📡 API response (available_ports): $RESPONSE"
-
-    log "🔍 Checking if IP $CONTAINER_IP exists in ip_mapping..."
-    IP_MAPPING_RESPONSE=$(curl -s http://$NGINX_HOST:$NGINX_PORT_API/ip_mapping.json)
-    log "📡 API response (ip_mapping.json): $IP_MAPPING_RESPONSE"
-
-    # Определяем, привязан ли IP к проекту
-    PROJECT=$(echo "$IP_MAPPING_RESPONSE" | jq -r --arg CONTAINER_IP "$CONTAINER_IP" 'to_entries | map(select(.value[]? == $CONTAINER_IP)) | if length == 0 then null else .[0].key end')
-    if [ -n "$PROJECT" ] && [ "$PROJECT" != "null" ]; then
-        IP_FOUND=true  # IP уже есть в ip_mapping
-        log "📡 Project found: $PROJECT"
-    else
-        IP_FOUND=false # IP новый, ищем проект с портами
-        log "🔎 IP $CONTAINER_IP not found in any project. Searching for available project..."
-        for PROJ in $(echo "$RESPONSE" | jq -r 'keys_unsorted[]' | grep -v '^other$'); do
-            PORTS=$(echo "$RESPONSE" | jq -r --arg PROJECT "$PROJ" '.[$PROJECT].available_ports | .[]')
-            if [ -n "$PORTS" ]; then
-                PROJECT="$PROJ"
-                log "✅ Found available ports in project: $PROJECT"
+# switch_central_node <ответ assign_project> — переходит на узел проекта
+# (API, sshd, control API). Код 1 — проект обслуживает текущий узел.
+switch_central_node() {
+    local HOST API SSH
+    HOST=$(echo "$1" | jq -r '.node.host // empty' 2>/dev/null)
+    if [ -z "$HOST" ]; then
+        return 1
+    fi
+    API=$(echo "$1" | jq -r --arg DEFAULT "$NGINX_PORT_API" '.node.api_port // $DEFAULT')
+    SSH=$(echo "$1" | jq -r --arg DEFAULT "$NGINX_SSH_PORT" '.node.ssh_port // $DEFAULT')
+    if [ "$HOST" = "$NGINX_HOST" ] && [ "$API" = "$NGINX_PORT_API" ] && [ "$SSH" = "$NGINX_SSH_PORT" ]; then
+        return 1
+    fi
+    log "🔀 Project is served by central node $(echo "$1" | jq -r '.node.id') ($HOST, API $API, SSH $SSH)"
+    NGINX_HOST="$HOST"
+    NGINX_PORT_API="$API"
+    NGINX_SSH_PORT="$SSH"
+    # Без control_url у узла регистрация идёт по SSH
+    CONTROL_API_URL=$(echo "$1" | jq -r '.node.control_url // empty')
+    return 0
+}
+
+# Назначение проекта сервером: существующая привязка IP сохраняется, новый IP
+# получает наименее загруженный проект (веса и квоты из port_mapping.json).
+# Возвращает 1, если сервер не поддерживает /assign_project.
+request_assignment() {
+    local ASSIGN_RESPONSE ASSIGNED
+    ASSIGN_RESPONSE=$(api_get "assign_project?ip=$CONTAINER_IP")
+    log "📡 API response (assign_project): $ASSIGN_RESPONSE"
+    ASSIGNED=$(echo "$ASSIGN_RESPONSE" | jq -r '.project // empty' 2>/dev/null)
+    if [ -z "$ASSIGNED" ]; then
+        return 1
+    fi
+    if switch_central_node "$ASSIGN_RESPONSE"; then
+        # Порты проекта выдаёт его узел; просим там выбранный проект
+        ASSIGN_RESPONSE=$(api_get "assign_project?ip=$CONTAINER_IP&project=$ASSIGNED")
+        log "📡 API response (assign_project, $NGINX_HOST): $ASSIGN_RESPONSE"
+        ASSIGNED=$(echo "$ASSIGN_RESPONSE" | jq -r '.project // empty' 2>/dev/null)
+        if [ -z "$ASSIGNED" ]; then
+            return 1
+        fi
+    fi
+    PROJECT="$ASSIGNED"
+    IP_FOUND=$(echo "$ASSIGN_RESPONSE" | jq -r '.bound')
+    ASSIGNED_PORTS=$(echo "$ASSIGN_RESPONSE" | jq -r '.available_ports | .[]')
+    return 0
+}
+
+# Проект этого IP из /ip/<addr>: ответ кэшируется между итерациями и
+# перезапрашивается с If-None-Match. Код 1 — сервер не знает /ip/.
+IP_INFO_CACHE="/tmp/ip_info.json"
+IP_INFO_ETAG=""
+lookup_own_project() {
+    local HEADERS STATUS BODY
+    HEADERS=$(mktemp)
+    BODY=$(curl -s -D "$HEADERS" -H "X-Trace-Id: $TRACE_ID" \
+        ${IP_INFO_ETAG:+-H "If-None-Match: $IP_INFO_ETAG"} \
+        "http://$NGINX_HOST:$NGINX_PORT_API/ip/$CONTAINER_IP")
+    STATUS=$(head -n 1 "$HEADERS" | awk '{print $2}')
+    if [ "$STATUS" = "200" ]; then
+        echo "$BODY" > "$IP_INFO_CACHE"
+        IP_INFO_ETAG=$(grep -i '^etag:' "$HEADERS" | cut -d' ' -f2 | tr -d '\r')
+    elif [ "$STATUS" != "304" ] || [ ! -s "$IP_INFO_CACHE" ]; then
+        rm -f "$HEADERS"
+        IP_INFO_ETAG=""
+        return 1
+    fi
+    rm -f "$HEADERS"
+    log "📡 API response (ip/$CONTAINER_IP, $STATUS): $(cat "$IP_INFO_CACHE")"
+    PROJECT=$(jq -r '.project // "null"' "$IP_INFO_CACHE")
+    return 0
+}
+
+# === Несколько туннелей на узел (TUNNELS_PER_NODE > 1) ===
+# Каждый слот — отдельный фоновый процесс со своим портом и своей арендой порта
+# (регистрация с номером слота, одна привязка IP→проект на все слоты). Упавший
+# туннель слот поднимает сам, остальные продолжают обслуживать трафик. Слот,
+# который TUNNEL_REGISTER_RETRIES раз подряд не смог зарегистрироваться, выходит:
+# тогда останавливаются все слоты и основной цикл заново выбирает проект.
+SLOT_PIDS=()
+
+# run_tunnel_slot <slot> — держит один туннель проекта $PROJECT, пока жив процесс
+run_tunnel_slot() {
+    TUNNEL_SLOT="$1"
+    local CANDIDATES PORT SKIP SSH_PID FAILURES=0
+    local SSH_OUT="/app/logs/ssh_slot_$TUNNEL_SLOT.log"
+    # wait прерывается сигналом, поэтому ssh запускается в фоне и ожидается через wait
+    trap '[ -n "$SSH_PID" ] && kill "$SSH_PID" 2>/dev/null; stop_lease_heartbeat; exit 0' TERM
+    while true; do
+        TRACE_ID=$(new_trace_id)
+        # Слоты начинают с разных кандидатов, чтобы не спорить за один порт
+        CANDIDATES=$(api_get "available_ports?project=$PROJECT&limit=$((PORT_CANDIDATES + TUNNEL_SLOT))" \
+            | jq -r --arg PROJECT "$PROJECT" '.[$PROJECT].available_ports | .[]' 2>/dev/null)
+        AVAILABLE_PORT=""
+        SKIP="$TUNNEL_SLOT"
+        for PORT in $CANDIDATES; do
+            if [ "$SKIP" -gt 0 ]; then
+                SKIP=$((SKIP - 1))
+                continue
+            fi
+            if ! nc -z "$NGINX_HOST" "$PORT" 2>/dev/null; then
+                AVAILABLE_PORT="$PORT"
                 break
             fi
         done
-        if [ -z "$PROJECT" ] || [ "$PROJECT" == "null" ]; then
-            log "❗ No available ports in any project. Using fallback project: 'other'."
-            PROJECT="other"
+        if [ -z "$AVAILABLE_PORT" ]; then
+            log "❌ [slot $TUNNEL_SLOT] Нет свободных портов в $PROJECT, ждём 1 минуту"
+            sleep 60
+            continue
+        fi
+
+        PROJECT_NAME="$PROJECT"
+        add_project_address
+        # По SSH в ответ попадает и лог скрипта, результат — последняя строка
+        if ! echo "$ADD_PROJECT_RESPONSE" | tail -n 1 | grep -qx "success"; then
+            FAILURES=$((FAILURES + 1))
+            if [ "$FAILURES" -ge "$TUNNEL_REGISTER_RETRIES" ]; then
+                log "❌ [slot $TUNNEL_SLOT] Регистрация в $PROJECT не удалась $FAILURES раз подряд, выходим"
+                exit 1
+            fi
+            log "⚠️ [slot $TUNNEL_SLOT] Регистрация не удалась ($FAILURES/$TUNNEL_REGISTER_RETRIES), повтор через 10 s"
+            sleep 10
+            continue
         fi
+        FAILURES=0
+        log "🔗 [slot $TUNNEL_SLOT] Establishing SSH tunnel on port $AVAILABLE_PORT..."
+        start_lease_heartbeat
+        SPAN_START=$(now_ms)
+        # ssh -N работает, пока жив туннель; выход — сбой или обрыв
+        sshpass -p "$SSH_PASS" ssh \
+            -o StrictHostKeyChecking=no \
+            -o ServerAliveInterval=30 \
+            -o ServerAliveCountMax=3 \
+            -o ExitOnForwardFailure=yes \
+            -o ConnectTimeout=5 \
+            -N -R 127.0.0.1:"$AVAILABLE_PORT":127.0.0.1:1080 \
+            "$SSH_USER"@"$NGINX_HOST" -p "$NGINX_SSH_PORT" > "$SSH_OUT" 2>&1 &
+        SSH_PID=$!
+        wait "$SSH_PID"
+        SSH_PID=""
+        log "📡 [slot $TUNNEL_SLOT] SSH response: $(cat "$SSH_OUT")"
+        trace_span "ssh_tunnel_slot_$TUNNEL_SLOT" "$SPAN_START" "closed"
+        stop_lease_heartbeat
+        log "❌ [slot $TUNNEL_SLOT] Tunnel on port $AVAILABLE_PORT closed, re-establishing in 10 s"
+        sleep 10
+    done
+}
+
+stop_tunnel_slots() {
+    if [ "${#SLOT_PIDS[@]}" -gt 0 ]; then
+        kill "${SLOT_PIDS[@]}" 2>/dev/null
+        wait "${SLOT_PIDS[@]}" 2>/dev/null
+        SLOT_PIDS=()
     fi
+}
+
+# Запускает TUNNELS_PER_NODE слотов и возвращается, когда любой из них вышел
+run_tunnel_slots() {
+    local SLOT PID
+    log "🔗 Starting $TUNNELS_PER_NODE tunnels for project $PROJECT"
+    trap 'stop_tunnel_slots; exit 0' TERM INT
+    for ((SLOT = 0; SLOT < TUNNELS_PER_NODE; SLOT++)); do
+        run_tunnel_slot "$SLOT" &
+        SLOT_PIDS+=("$!")
+    done
+    # wait -n не подходит: 3proxy тоже фоновая задача основного процесса
+    while true; do
+        for PID in "${SLOT_PIDS[@]}"; do
+            kill -0 "$PID" 2>/dev/null || break 2
+        done
+        sleep 5
+    done
+    log "⚠️ A tunnel slot exited, stopping the others and selecting the project again"
+    stop_tunnel_slots
+    trap - TERM INT
+}
+
+while true; do
+    reset_central_node
+    log "🔍 Requesting project assignment for $CONTAINER_IP..."
+    SPAN_START=$(now_ms)
+    PROJECT=""
+    if request_assignment; then
+        if [ "$IP_FOUND" = true ]; then
+            log "📡 Project found: $PROJECT"
+        else
+            log "✅ Server assigned project: $PROJECT"
+        fi
+    else
+        log "⚠️ /assign_project is unavailable, selecting project locally..."
+        log "🔍 Fetching available ports..."
+        RESPONSE=$(api_get available_ports)
+        log "📡 API response (available_ports): $RESPONSE"
+
+        log "🔍 Checking if IP $CONTAINER_IP exists in ip_mapping..."
+        if ! lookup_own_project; then
+            # Старый сервер без /ip/: весь ip_mapping.json и поиск через jq
+            IP_MAPPING_RESPONSE=$(api_get ip_mapping.json)
+            log "📡 API response (ip_mapping.json): $IP_MAPPING_RESPONSE"
+            PROJECT=$(echo "$IP_MAPPING_RESPONSE" | jq -r --arg CONTAINER_IP "$CONTAINER_IP" 'to_entries | map(select(.value[]? == $CONTAINER_IP)) | if length == 0 then null else .[0].key end')
+        fi
+
+        # Определяем, привязан ли IP к проекту
+        if [ -n "$PROJECT" ] && [ "$PROJECT" != "null" ]; then
+            IP_FOUND=true  # IP уже есть в ip_mapping
+            log "📡 Project found: $PROJECT"
+        else
+            IP_FOUND=false # IP новый, ищем проект с портами
+            log "🔎 IP $CONTAINER_IP not found in any project. Searching for available project..."
+            for PROJ in $(echo "$RESPONSE" | jq -r 'keys_unsorted[]' | grep -v '^other$'); do
+                PORTS=$(echo "$RESPONSE" | jq -r --arg PROJECT "$PROJ" '.[$PROJECT].available_ports | .[]')
+                if [ -n "$PORTS" ]; then
+                    PROJECT="$PROJ"
+                    log "✅ Found available ports in project: $PROJECT"
+                    break
+                fi
+            done
+            if [ -z "$PROJECT" ] || [ "$PROJECT" == "null" ]; then
+                log "❗ No available ports in any project. Using fallback project: 'other'."
+                PROJECT="other"
+            fi
+        fi
+    fi
+    trace_span "port_poll" "$SPAN_START"
 
     # Повторная проверка порта каждую минуту 2 раза (для текущего $PROJECT)
+    SPAN_START=$(now_ms)
     for i in {1..2}; do
-        RESPONSE=$(curl -s http://$NGINX_HOST:$NGINX_PORT_API/available_ports)
+        RESPONSE=$(api_get "available_ports?project=$PROJECT&limit=$PORT_CANDIDATES")
         PROJECT_PORTS=$(echo "$RESPONSE" | jq -r --arg PROJECT "$PROJECT" '.[$PROJECT].available_ports | .[]')
         if [ -n "$PROJECT_PORTS" ]; then
             log "✅ Свободные порты появились в проекте $PROJECT"
@@ -222,8 +640,8 @@ while true; do
         if [ "$IP_FOUND" = true ]; then
             # Уже привязанный IP: не переключаем проект, только временный 'other'
             log "⚠️ IP $CONTAINER_IP уже привязан к $PROJECT — не переключаемся."
-            bash /app/port_project_watcher.sh "$PROJECT" "$CONTAINER_IP" &
-            RESPONSE=$(curl -s http://$NGINX_HOST:$NGINX_PORT_API/available_ports)
+            join_waitlist "$PROJECT"
+            RESPONSE=$(api_get "available_ports?project=other&limit=$PORT_CANDIDATES")
             PROJECT_PORTS=$(echo "$RESPONSE" | jq -r '."other".available_ports | .[]')
             if [ -n "$PROJECT_PORTS" ]; then
                 PROJECT="other"
@@ -235,25 +653,32 @@ while true; do
             fi
         else
             # Новый IP: получаем свежие данные по портам
-            RESPONSE=$(curl -s http://$NGINX_HOST:$NGINX_PORT_API/available_ports)
             log "🔄 IP новый, получаем свежие данные портов..."
-
-            # Пробуем найти непустой проект (кроме other)
-            for PROJ in $(echo "$RESPONSE" | jq -r 'keys_unsorted[]' | grep -v '^other$'); do
-                PORTS=$(echo "$RESPONSE" | jq -r --arg PROJECT "$PROJ" '.[$PROJECT].available_ports | .[]')
-                if [ -n "$PORTS" ]; then
-                    PROJECT="$PROJ"
-                    PROJECT_PORTS="$PORTS"
+            if request_assignment; then
+                PROJECT_PORTS="$ASSIGNED_PORTS"
+                if [ -n "$PROJECT_PORTS" ]; then
                     log "✅ Найдены порты в проекте $PROJECT"
-                    break
                 fi
-            done
+            else
+                RESPONSE=$(api_get available_ports)
+
+                # Пробуем найти непустой проект (кроме other)
+                for PROJ in $(echo "$RESPONSE" | jq -r 'keys_unsorted[]' | grep -v '^other$'); do
+                    PORTS=$(echo "$RESPONSE" | jq -r --arg PROJECT "$PROJ" '.[$PROJECT].available_ports | .[]')
+                    if [ -n "$PORTS" ]; then
+                        PROJECT="$PROJ"
+                        PROJECT_PORTS="$PORTS"
+                        log "✅ Найдены порты в проекте $PROJECT"
+                        break
+                    fi
+                done
+            fi
 
             # Если всё ещё нет портов, делаем фолбек на other
             if [ -z "$PROJECT_PORTS" ]; then
                 log "❗ Не найдено портов ни в одном проекте. Фолбек на 'other'."
                 PROJECT="other"
-                RESPONSE=$(curl -s http://$NGINX_HOST:$NGINX_PORT_API/available_ports)
+                RESPONSE=$(api_get "available_ports?project=other&limit=$PORT_CANDIDATES")
                 PROJECT_PORTS=$(echo "$RESPONSE" | jq -r '."other".available_ports | .[]')
                 if [ -z "$PROJECT_PORTS" ]; then
                     log "❌ Нет портов даже в 'other'. Ждём и выходим."
@@ -263,10 +688,18 @@ while true; do
             fi
         fi
     fi
+    trace_span "port_wait" "$SPAN_START"
+
+    if [ "$TUNNELS_PER_NODE" -gt 1 ]; then
+        run_tunnel_slots
+        TRACE_ID=$(new_trace_id)
+        continue
+    fi
 
     # === Выбор конкретного свободного порта и попытка подключения ===
     TUNNEL_ESTABLISHED=false
     AVAILABLE_PORT=""
+    SPAN_START=$(now_ms)
     for PORT in $PROJECT_PORTS; do
         log "🔍 Checking port $PORT for project $PROJECT...."
         if nc -z $NGINX_HOST $PORT 2>/dev/null; then
@@ -275,11 +708,14 @@ while true; do
         fi
 
         log "🚀 Port $PORT is free, trying to use it!"
+        trace_span "nc_scan" "$SPAN_START"
         AVAILABLE_PORT="$PORT"
         PROJECT_NAME="$PROJECT"
         add_project_address
 
         log "🔗 Establishing SSH tunnel on port $AVAILABLE_PORT..."
+        start_lease_heartbeat
+        SPAN_START=$(now_ms)
         RESPONSE_SSH=$(sshpass -p "$SSH_PASS" ssh \
             -o StrictHostKeyChecking=no \
             -o ServerAliveInterval=30 \
@@ -289,6 +725,7 @@ while true; do
             "$SSH_USER"@"$NGINX_HOST" -p "$NGINX_SSH_PORT" 2>&1)
 
         log "📡 SSH response: $RESPONSE_SSH"
+        trace_span "ssh_tunnel" "$SPAN_START"
 
         if echo "$RESPONSE_SSH" | grep -q "successfully"; then
             log "✅ SSH tunnel established on port $AVAILABLE_PORT!"
@@ -296,13 +733,16 @@ while true; do
             break
         else
             log "❌ Error setting up SSH tunnel: $RESPONSE_SSH"
+            stop_lease_heartbeat
             AVAILABLE_PORT=""
             sleep 60
+            SPAN_START=$(now_ms)
         fi
     done
 
     if [ "$TUNNEL_ESTABLISHED" = false ]; then
         log "❌ Не удалось установить SSH-туннель ни на одном порту проекта $PROJECT"
+        TRACE_ID=$(new_trace_id)
         continue
     fi
 
@@ -322,4 +762,9 @@ while true; do
 
         sleep 10
     done
+    stop_lease_heartbeat
+
+    # Новая попытка регистрации — новый TRACE_ID
+    TRACE_ID=$(new_trace_id)
+    log "🧵 Trace id: $TRACE_ID"
 done
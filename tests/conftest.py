@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Central scripts add log sinks and create their log directory on import
+os.environ.setdefault("FLUXSIGN_LOG_DIR", tempfile.mkdtemp(prefix="fluxsign-tests-"))
+sys.path[:0] = [str(REPO_ROOT / "nginx" / "fluxsign"), str(REPO_ROOT / "nginx" / "home" / "proxyuser")]
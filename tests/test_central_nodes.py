@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from central_nodes import CentralNodes, HashRing, load_nodes
+from port_mapping import OTHER_PROJECT
+
+PROJECTS = [f"project-{i}" for i in range(2000)]
+
+
+def nodes(count: int) -> dict:
+    return {f"central-{i + 1}": {"host": f"10.0.0.{i + 1}", "api_port": 8080, "peer_url": "http://x"}
+            for i in range(count)}
+
+
+def test_ring_is_deterministic_and_empty_ring_has_no_owner():
+    assert HashRing(nodes(3)).node_for("p") == HashRing(nodes(3)).node_for("p")
+    assert HashRing({}).node_for("p") is None
+
+
+def test_adding_a_node_moves_only_its_share():
+    before, after = HashRing(nodes(3)), HashRing(nodes(4))
+    moved = [name for name in PROJECTS if before.node_for(name) != after.node_for(name)]
+    # Projects only move to the new node, roughly a quarter of them
+    assert {after.node_for(name) for name in moved} == {"central-4"}
+    assert 0.15 < len(moved) / len(PROJECTS) < 0.35
+
+
+def test_weight_shifts_the_share():
+    weighted = nodes(2)
+    weighted["central-2"]["weight"] = 3
+    ring = HashRing(weighted)
+    share = sum(1 for name in PROJECTS if ring.node_for(name) == "central-2") / len(PROJECTS)
+    assert 0.65 < share < 0.85
+
+
+def test_other_and_single_node_are_served_locally():
+    tier = CentralNodes(nodes(3), "central-1")
+    assert tier.enabled
+    assert tier.owner(OTHER_PROJECT) == "central-1"
+    assert tier.peers() == ["central-2", "central-3"]
+    assert tier.public_info("central-2") == {"id": "central-2", "host": "10.0.0.2", "api_port": 8080}
+
+    single = CentralNodes(nodes(3), "")
+    assert not single.enabled
+    assert single.owns("project-1") and single.peers() == []
+
+
+def test_unknown_node_id_is_refused(tmp_path):
+    path = tmp_path / "central_nodes.json"
+    path.write_text(json.dumps({"nodes": nodes(2)}))
+    assert load_nodes(path, "central-2").self_id == "central-2"
+    assert not load_nodes(tmp_path / "missing.json", "central-1").enabled
+    with pytest.raises(ValueError):
+        load_nodes(path, "central-9")
@@ -0,0 +1,71 @@
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import control_client
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path == "/slow" or self.path == "/remove":
+            time.sleep(1)
+        status, body = {
+            "/bad": (400, {"error": "bad request: ip"}),
+            "/missing": (404, {"error": "not found"}),
+        }.get(self.path, (200, {"result": "success"}))
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def api(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(control_client, "CONTROL_API_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setenv("CONTROL_API_TOKEN", "token")
+    yield
+    server.shutdown()
+
+
+def test_answer_is_returned(api):
+    assert control_client.call("heartbeat", {}) == {"result": "success"}
+
+
+def test_http_error_is_returned_not_retried(api):
+    assert control_client.call("bad", {}) == {"error": "bad request: ip", "status": 400}
+
+
+def test_unknown_endpoint_falls_back(api):
+    assert control_client.call("missing", {}) is None
+
+
+def test_read_timeout_falls_back_only_for_idempotent_calls(api):
+    assert control_client.call("slow", {}, timeout=0.2) is None
+    assert "error" in control_client.call("remove", {}, timeout=0.2)
+
+
+def test_refused_connection_falls_back(monkeypatch):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    monkeypatch.setattr(control_client, "CONTROL_API_URL", f"http://127.0.0.1:{port}")
+    monkeypatch.setenv("CONTROL_API_TOKEN", "token")
+    assert control_client.call("remove", {}) is None
+
+
+def test_no_token_falls_back(monkeypatch, tmp_path):
+    monkeypatch.delenv("CONTROL_API_TOKEN", raising=False)
+    monkeypatch.setattr(control_client, "CONTROL_API_TOKEN_FILE", str(tmp_path / "missing"))
+    assert control_client.call("heartbeat", {}) is None
@@ -0,0 +1,100 @@
+import os
+
+import dc_ranges
+from dc_ranges import RangeIndex
+
+
+def test_overlapping_and_adjacent_ranges_merge():
+    index = RangeIndex({4: [(10, 20, "a"), (15, 30, "b"), (31, 40, "c"), (50, 60, "d")]})
+    starts, ends, labels = index.tables[4]
+    assert starts == [10, 50]
+    assert ends == [40, 60]
+    assert labels == ["a", "d"]
+
+
+def test_lookup_bounds_and_versions(tmp_path):
+    (tmp_path / "cloud.csv").write_text("# provider list\n"
+                                        "203.0.113.0/24,example\n"
+                                        "198.51.100.10,198.51.100.20,AS64500\n"
+                                        "2001:db8::/32\n"
+                                        "not an address\n")
+    index = dc_ranges.load_index(tmp_path)
+    assert len(index) == 3
+    assert index.lookup("203.0.113.0") == "cloud: example"
+    assert index.lookup("203.0.113.255") == "cloud: example"
+    assert index.lookup("203.0.114.0") is None
+    assert index.lookup("198.51.100.20") == "cloud: AS64500"
+    assert index.lookup("198.51.100.21") is None
+    assert index.lookup("2001:db8::1") == "cloud"
+    assert index.lookup("garbage") is None
+
+
+def test_cache_is_reused_and_untrusted_cache_ignored(tmp_path, monkeypatch):
+    (tmp_path / "cloud.csv").write_text("203.0.113.0/24\n")
+    dc_ranges.load_index(tmp_path)
+    cache = tmp_path / dc_ranges.COMPILED_NAME
+    assert cache.exists()
+
+    compiled = []
+    monkeypatch.setattr(dc_ranges, "compile_index",
+                        lambda files: compiled.append(files) or RangeIndex({}))
+    assert dc_ranges.load_index(tmp_path).lookup("203.0.113.1") == "cloud"
+    assert not compiled
+
+    os.chmod(cache, 0o666)
+    dc_ranges.load_index(tmp_path)
+    assert len(compiled) == 1
+
+
+def counting_compile(monkeypatch) -> list:
+    compiled = []
+    original = dc_ranges.compile_index
+    monkeypatch.setattr(dc_ranges, "compile_index", lambda files: compiled.append(files) or original(files))
+    return compiled
+
+
+def test_cache_of_root_is_shared_with_other_users(tmp_path, monkeypatch):
+    (tmp_path / "cloud.csv").write_text("203.0.113.0/24\n")
+    compiled = counting_compile(monkeypatch)
+    monkeypatch.setattr(dc_ranges.os, "getuid", lambda: 0)
+    dc_ranges.load_index(tmp_path)
+    os.chown(tmp_path / dc_ranges.COMPILED_NAME, 0, 0)
+
+    # proxyuser running check_blacklist.py over SSH reads root's cache
+    monkeypatch.setattr(dc_ranges.os, "getuid", lambda: 1000)
+    assert dc_ranges.load_index(tmp_path).lookup("203.0.113.1") == "cloud"
+    assert len(compiled) == 1
+
+
+def test_foreign_cache_is_compiled_once_into_own_cache(tmp_path, monkeypatch):
+    (tmp_path / "cloud.csv").write_text("203.0.113.0/24\n")
+    dc_ranges.load_index(tmp_path)
+    shared = tmp_path / dc_ranges.COMPILED_NAME
+    os.chown(shared, 2000, 2000)
+
+    compiled = counting_compile(monkeypatch)
+    monkeypatch.setattr(dc_ranges.os, "getuid", lambda: 1000)
+    dc_ranges.load_index(tmp_path)
+    own = dc_ranges.cache_path(tmp_path, 1000)
+    os.chown(own, 1000, 1000)
+    assert dc_ranges.load_index(tmp_path).lookup("203.0.113.1") == "cloud"
+    assert len(compiled) == 1
+    # The foreign user's file is left alone
+    assert shared.stat().st_uid == 2000
+
+
+def test_unwritable_cache_is_logged(tmp_path, monkeypatch):
+    (tmp_path / "cloud.csv").write_text("203.0.113.0/24\n")
+
+    def refuse(src, dst):
+        raise PermissionError(13, "Permission denied")
+
+    monkeypatch.setattr(dc_ranges.os, "replace", refuse)
+    messages = []
+    sink = dc_ranges.logger.add(messages.append, level="WARNING")
+    try:
+        assert dc_ranges.load_index(tmp_path).lookup("203.0.113.1") == "cloud"
+    finally:
+        dc_ranges.logger.remove(sink)
+    assert any("Cannot write DC range cache" in message for message in messages)
+    assert [path.name for path in tmp_path.iterdir()] == ["cloud.csv"]
@@ -0,0 +1,111 @@
+import json
+
+import pytest
+
+from ip_leases import OTHER_PROJECT, forget_port, lease_ports, reap, refresh_by_ports, release, touch_lease
+
+NOW = 1_760_000_000
+TTL = 3600
+
+
+@pytest.fixture(autouse=True)
+def single_node(monkeypatch):
+    monkeypatch.setenv("CENTRAL_NODE_ID", "")
+
+
+def test_touch_lease_records_slots():
+    leases = {}
+    touch_lease(leases, "1.1.1.1", "p", 30000, now=NOW, slot=0)
+    touch_lease(leases, "1.1.1.1", "p", 30001, now=NOW, slot=1)
+    lease = leases["1.1.1.1"]
+    assert lease == {"project": "p", "last_seen": NOW, "port": 30000, "ports": {"1": 30001}}
+    assert lease_ports(lease) == {30000, 30001}
+
+    # A slot that moves to another port drops the old one
+    touch_lease(leases, "1.1.1.1", "p", 30002, now=NOW, slot=1)
+    assert lease_ports(lease) == {30000, 30002}
+
+
+def test_port_moves_to_the_newest_lease():
+    leases = {}
+    touch_lease(leases, "1.1.1.1", "p", 30000, now=NOW)
+    touch_lease(leases, "2.2.2.2", "p", 30000, now=NOW + 1)
+    assert "port" not in leases["1.1.1.1"]
+    assert leases["2.2.2.2"]["port"] == 30000
+
+    touch_lease(leases, "1.1.1.1", "p", 30001, now=NOW, slot=2)
+    touch_lease(leases, "2.2.2.2", "p", 30001, now=NOW + 1, slot=1)
+    assert "ports" not in leases["1.1.1.1"]
+    assert leases["2.2.2.2"]["ports"] == {"1": 30001}
+
+
+def test_heartbeat_without_slot_keeps_known_port_in_place():
+    leases = {}
+    touch_lease(leases, "1.1.1.1", "p", 30001, now=NOW, slot=1)
+    touch_lease(leases, "1.1.1.1", "p", 30001, now=NOW + 60)
+    assert leases["1.1.1.1"] == {"project": "p", "last_seen": NOW + 60, "ports": {"1": 30001}}
+    touch_lease(leases, "1.1.1.1", "p", now=NOW + 120)
+    assert leases["1.1.1.1"]["last_seen"] == NOW + 120
+    assert lease_ports(leases["1.1.1.1"]) == {30001}
+
+
+def test_touch_lease_on_another_central_node_drops_old_ports(monkeypatch):
+    leases = {"1.1.1.1": {"project": "p", "last_seen": NOW, "port": 30000, "node": "central-1"},
+              "2.2.2.2": {"project": "p", "last_seen": NOW, "port": 30005, "node": "central-1"}}
+    monkeypatch.setenv("CENTRAL_NODE_ID", "central-2")
+    touch_lease(leases, "1.1.1.1", "p", 30005, now=NOW + 1)
+    assert leases["1.1.1.1"] == {"project": "p", "last_seen": NOW + 1, "port": 30005, "node": "central-2"}
+    # The same port number on central-1 belongs to another tunnel
+    assert leases["2.2.2.2"]["port"] == 30005
+
+
+def test_forget_port():
+    lease = {"port": 30000, "ports": {"1": 30001, "2": 30000}}
+    forget_port(lease, 30000)
+    assert lease == {"ports": {"1": 30001}}
+    forget_port(lease, 30001)
+    assert lease == {}
+
+
+def test_refresh_by_ports_counts_live_tunnels():
+    leases = {"1.1.1.1": {"project": "p", "last_seen": NOW - TTL * 2, "ports": {"1": 30001}},
+              "2.2.2.2": {"project": "p", "last_seen": NOW - TTL * 2, "port": 30002}}
+    assert refresh_by_ports(leases, {30001}, now=NOW) == 1
+    assert leases["1.1.1.1"]["last_seen"] == NOW
+    assert leases["2.2.2.2"]["last_seen"] == NOW - TTL * 2
+
+
+def test_reap_expires_idle_bindings_and_adopts_legacy_ones():
+    ip_mapping = {"p": ["1.1.1.1", "2.2.2.2", "3.3.3.3"], OTHER_PROJECT: []}
+    leases = {"1.1.1.1": {"project": "p", "last_seen": NOW - TTL - 1},
+              "2.2.2.2": {"project": "p", "last_seen": NOW - TTL}}
+    assert reap(ip_mapping, leases, ttl=TTL, now=NOW) == [("1.1.1.1", "p")]
+    assert ip_mapping["p"] == ["2.2.2.2", "3.3.3.3"]
+    assert set(leases) == {"2.2.2.2", "3.3.3.3"}
+    assert leases["3.3.3.3"]["last_seen"] == NOW
+
+
+def test_reap_keeps_fresh_other_leases_and_drops_orphans():
+    ip_mapping = {"p": [], OTHER_PROJECT: []}
+    leases = {"1.1.1.1": {"project": OTHER_PROJECT, "last_seen": NOW - 10, "port": 30100},
+              "2.2.2.2": {"project": OTHER_PROJECT, "last_seen": NOW - TTL - 1, "port": 30101},
+              "3.3.3.3": {"project": "p", "last_seen": NOW}}
+    # Stale 'other' leases and leases of bindings removed elsewhere vanish without being reported
+    assert reap(ip_mapping, leases, ttl=TTL, now=NOW) == []
+    assert set(leases) == {"1.1.1.1"}
+
+
+def test_release_with_seen_at_skips_refreshed_and_unbound(tmp_path):
+    (tmp_path / "ip_mapping.json").write_text(json.dumps({"p": ["1.1.1.1", "2.2.2.2"]}))
+    (tmp_path / "ip_leases.json").write_text(json.dumps({
+        "1.1.1.1": {"project": "p", "last_seen": NOW + 60},
+        "2.2.2.2": {"project": "p", "last_seen": NOW},
+        "3.3.3.3": {"project": OTHER_PROJECT, "last_seen": NOW},
+    }))
+    assert release("1.1.1.1", tmp_path, seen_at=NOW) is None
+    assert release("3.3.3.3", tmp_path, seen_at=NOW) is None
+    assert release("2.2.2.2", tmp_path, seen_at=NOW) == "p"
+    assert json.loads((tmp_path / "ip_mapping.json").read_text()) == {"p": ["1.1.1.1"]}
+    assert set(json.loads((tmp_path / "ip_leases.json").read_text())) == {"1.1.1.1", "3.3.3.3"}
+    # Without seen_at the binding is dropped unconditionally
+    assert release("1.1.1.1", tmp_path) == "p"
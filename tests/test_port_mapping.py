@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from port_mapping import (OTHER_PROJECT, ProjectPorts, count_ports, find_overlaps, load_projects, merge_ranges,
+                          normalize_entry, parse_port_spec, pick_project)
+
+
+def test_project_ports_merges_overlapping_and_adjacent_ranges():
+    ports = ProjectPorts([(100, 104), (103, 106), (107, 107), (110, 111)])
+    assert ports.ranges == [(100, 107), (110, 111)]
+    assert len(ports) == 10
+    assert 107 in ports and 108 not in ports and 99 not in ports
+    assert ports.to_ranges(ports.mask) == ["100-107", "110-111"]
+
+
+def test_free_mask_next_port_and_listing():
+    ports = ProjectPorts([(100, 109)])
+    free = ports.free_mask({100, 101, 105, 200})
+    assert count_ports(free) == 7
+    assert ports.next_port(free) == 102
+    assert ports.next_port(free, after=104) == 106
+    assert ports.next_port(free, after=109) is None
+    assert list(ports.iter_ports(free, limit=3)) == [102, 103, 104]
+    assert ports.to_ranges(free) == ["102-104", "106-109"]
+
+
+def test_parse_port_spec():
+    assert parse_port_spec(21200) == (21200, 21200)
+    assert parse_port_spec(" 21200-21299 ") == (21200, 21299)
+    for bad in ("21299-21200", "0", "70000", "abc"):
+        with pytest.raises(ValueError):
+            parse_port_spec(bad)
+
+
+def test_merge_ranges_keeps_gaps():
+    assert merge_ranges([(5, 6), (1, 3), (4, 4), (8, 9)]) == [(1, 6), (8, 9)]
+
+
+def test_find_overlaps_between_projects_only():
+    projects = {
+        "a": normalize_entry(["100-110", "105-115"]),
+        "b": normalize_entry(["116-120"]),
+        "c": normalize_entry(["118-125"]),
+    }
+    assert find_overlaps(projects) == ["b and c overlap on 118-120"]
+    assert find_overlaps({"a": projects["a"], "b": projects["b"]}) == []
+
+
+def test_load_projects_refuses_overlaps(tmp_path):
+    path = tmp_path / "port_mapping.json"
+    path.write_text(json.dumps({"a": ["100-110"], "b": {"ports": ["110-120"], "weight": 2}}))
+    with pytest.raises(ValueError, match="overlap"):
+        load_projects(path)
+
+
+def test_pick_project_respects_load_quota_and_other():
+    projects = {
+        "a": normalize_entry({"ports": ["100-109"], "quota": 2}),
+        "b": normalize_entry({"ports": ["200-209"], "weight": 2}),
+        OTHER_PROJECT: normalize_entry(["300-309"]),
+    }
+    # b is as full as a but weighs twice as much
+    assert pick_project(projects, {"a": 5, "b": 5, OTHER_PROJECT: 10}, {}) == "b"
+    assert pick_project(projects, {"a": 5, "b": 0, OTHER_PROJECT: 10}, {"a": 1}) == "a"
+    assert pick_project(projects, {"a": 5, "b": 0, OTHER_PROJECT: 10}, {"a": 2}) == OTHER_PROJECT
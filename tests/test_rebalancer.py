@@ -0,0 +1,89 @@
+import pytest
+
+import rebalancer
+import waitlist
+from port_mapping import OTHER_PROJECT, normalize_entry
+
+NOW = 1_760_000_000
+GRACE = 600
+
+
+@pytest.fixture
+def projects():
+    return {"p": normalize_entry(["30000-30009"]), OTHER_PROJECT: normalize_entry(["30100-30109"])}
+
+
+def masks_with_free(projects, free: int) -> dict:
+    ports = projects["p"]["ports"]
+    return {"p": ports.free_mask(range(30000, 30010 - free))}
+
+
+def queue(*ips, **fields):
+    return [{"ip": ip, "since": NOW - 100, **fields} for ip in ips]
+
+
+def test_add_entry_is_fifo_and_moves_between_projects():
+    lists = {}
+    assert waitlist.add_entry(lists, "1.1.1.1", "p", now=NOW) == 1
+    assert waitlist.add_entry(lists, "2.2.2.2", "p", now=NOW) == 2
+    assert waitlist.add_entry(lists, "1.1.1.1", "p", now=NOW + 5) == 1
+    assert lists["p"][0]["since"] == NOW
+    assert waitlist.add_entry(lists, "1.1.1.1", "q", now=NOW) == 1
+    assert lists == {"p": [{"ip": "2.2.2.2", "since": NOW}], "q": [{"ip": "1.1.1.1", "since": NOW}]}
+
+
+def test_join_refuses_other(tmp_path):
+    with pytest.raises(ValueError):
+        waitlist.join("1.1.1.1", OTHER_PROJECT, tmp_path)
+    assert waitlist.join("1.1.1.1", "p", tmp_path) == 1
+
+
+def test_plan_restarts_in_order_up_to_free_ports_and_batch(projects):
+    lists = {"p": queue("1.1.1.1", "2.2.2.2", "3.3.3.3")}
+    ip_mapping = {"p": ["1.1.1.1", "2.2.2.2", "3.3.3.3"]}
+    restarts, dropped = rebalancer.plan(lists, ip_mapping, {}, projects, masks_with_free(projects, 2), set(),
+                                        batch=10, grace=GRACE, now=NOW)
+    assert restarts == [("1.1.1.1", "p"), ("2.2.2.2", "p")]
+    assert dropped == []
+    assert lists["p"][0]["restarted_at"] == NOW and lists["p"][0]["attempts"] == 1
+    assert "restarted_at" not in lists["p"][2]
+
+    lists = {"p": queue("1.1.1.1", "2.2.2.2", "3.3.3.3")}
+    restarts, _ = rebalancer.plan(lists, ip_mapping, {}, projects, masks_with_free(projects, 5), set(),
+                                  batch=1, grace=GRACE, now=NOW)
+    assert restarts == [("1.1.1.1", "p")]
+
+
+def test_plan_counts_in_flight_restarts_against_free_ports(projects):
+    lists = {"p": queue("1.1.1.1", restarted_at=NOW - 10, attempts=1) + queue("2.2.2.2", "3.3.3.3")}
+    ip_mapping = {"p": ["1.1.1.1", "2.2.2.2", "3.3.3.3"]}
+    # Two free ports, one already promised to 1.1.1.1 within the grace period
+    restarts, _ = rebalancer.plan(lists, ip_mapping, {}, projects, masks_with_free(projects, 2), set(),
+                                  batch=10, grace=GRACE, now=NOW)
+    assert restarts == [("2.2.2.2", "p")]
+
+    # 1.1.1.1's grace period is over and it gets another attempt; 2.2.2.2 is still in flight
+    restarts, _ = rebalancer.plan(lists, ip_mapping, {}, projects, masks_with_free(projects, 2), set(),
+                                  batch=10, grace=GRACE, now=NOW + GRACE - 5)
+    assert restarts == [("1.1.1.1", "p")]
+    assert lists["p"][0]["attempts"] == 2
+
+
+def test_plan_drops_unbound_home_and_unknown(projects):
+    lists = {"p": queue("1.1.1.1", "2.2.2.2", "3.3.3.3"), "gone": queue("4.4.4.4")}
+    ip_mapping = {"p": ["1.1.1.1", "2.2.2.2"]}
+    # 2.2.2.2 already has a live tunnel on a port of its own project
+    leases = {"2.2.2.2": {"project": "p", "last_seen": NOW, "port": 30100, "ports": {"1": 30003}}}
+    restarts, dropped = rebalancer.plan(lists, ip_mapping, leases, projects, masks_with_free(projects, 3), {30003},
+                                        batch=10, grace=GRACE, now=NOW)
+    assert restarts == [("1.1.1.1", "p")]
+    assert sorted(dropped) == [("2.2.2.2", "p", "home"), ("3.3.3.3", "p", "unbound"),
+                               ("4.4.4.4", "gone", "unknown project")]
+    assert list(lists) == ["p"]
+
+
+def test_plan_removes_empty_lists(projects):
+    lists = {"p": queue("1.1.1.1")}
+    rebalancer.plan(lists, {"p": []}, {}, projects, masks_with_free(projects, 3), set(),
+                    batch=10, grace=GRACE, now=NOW)
+    assert lists == {}
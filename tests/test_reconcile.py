@@ -0,0 +1,62 @@
+import json
+
+import reconcile
+from reconcile import apply_changes, diff_state
+
+NOW = 1760000000
+TTL = 3600
+
+
+def test_bound_node_without_instance_is_orphaned():
+    report = diff_state({}, {"p": ["1.1.1.1"]}, {}, set(), [], TTL, NOW)
+    assert report["orphaned"] == ["1.1.1.1"]
+    assert report["unregistered"] == []
+
+
+def test_tunnelled_node_is_neither_orphaned_nor_unregistered():
+    leases = {"1.1.1.1": {"project": "p", "port": 21200, "last_seen": NOW}}
+    report = diff_state({}, {"p": ["1.1.1.1"]}, leases, {21200}, [], TTL, NOW)
+    assert report["orphaned"] == []
+    report = diff_state({"1.1.1.1": [16127]}, {}, leases, {21200}, [], TTL, NOW)
+    assert report["unregistered"] == []
+
+
+def test_running_unknown_instance_is_unregistered():
+    report = diff_state({"2.2.2.2": [16127]}, {"p": []}, {}, set(), [], TTL, NOW)
+    assert report["unregistered"] == ["2.2.2.2"]
+
+
+def test_other_node_is_registered():
+    locations = {"3.3.3.3": [16127], "4.4.4.4": [16127]}
+    ip_mapping = {"p": [], "other": ["4.4.4.4"]}
+    leases = {"3.3.3.3": {"project": "other", "port": 25000, "last_seen": NOW - 60}}
+    # The tunnel is not listening right now, the lease and the 'other' listing are enough
+    report = diff_state(locations, ip_mapping, leases, set(), [], TTL, NOW)
+    assert report["unregistered"] == []
+    assert report["orphaned"] == []
+
+
+def test_stale_other_lease_does_not_count():
+    leases = {"3.3.3.3": {"project": "other", "port": 25000, "last_seen": NOW - TTL - 1}}
+    report = diff_state({"3.3.3.3": [16127]}, {}, leases, set(), [], TTL, NOW)
+    assert report["unregistered"] == ["3.3.3.3"]
+
+
+def test_blacklisted_instance():
+    import ipaddress
+    report = diff_state({"5.5.5.5": [16127]}, {}, {}, set(), [ipaddress.ip_network("5.5.5.0/24")], TTL, NOW)
+    assert report["blacklisted"] == ["5.5.5.5"]
+
+
+def test_apply_keeps_orphan_that_came_back_during_the_scan(tmp_path, monkeypatch):
+    monkeypatch.setattr(reconcile, "HTML_DIR", tmp_path)
+    monkeypatch.setenv("CENTRAL_NODE_ID", "")
+    scanned = {"1.1.1.1": {"project": "p", "last_seen": NOW}, "2.2.2.2": {"project": "p", "last_seen": NOW}}
+    (tmp_path / "ip_mapping.json").write_text(json.dumps({"p": ["1.1.1.1", "2.2.2.2"]}))
+    # 1.1.1.1 sent a heartbeat after the report was built
+    (tmp_path / "ip_leases.json").write_text(json.dumps(dict(scanned, **{"1.1.1.1": {"project": "p",
+                                                                                     "last_seen": NOW + 5}})))
+    report = {"orphaned": ["1.1.1.1", "2.2.2.2"], "unregistered": [], "blacklisted": []}
+    results = apply_changes(report, {}, scanned, restart_unregistered=False, concurrency=1)
+    assert results["release"] == {"ok": ["2.2.2.2"], "failed": [], "skipped": ["1.1.1.1"]}
+    assert json.loads((tmp_path / "ip_mapping.json").read_text()) == {"p": ["1.1.1.1"]}
@@ -0,0 +1,31 @@
+import remove_app
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+def test_fetch_app_locations_keeps_every_instance(monkeypatch):
+    payload = {"status": "success", "data": [
+        {"ip": "1.1.1.1:16127"}, {"ip": "1.1.1.1:16137"}, {"ip": "2.2.2.2"}, {"ip": "1.1.1.1:16137"},
+    ]}
+    monkeypatch.setattr(remove_app.requests, "get", lambda *args, **kwargs: FakeResponse(payload))
+    assert remove_app.fetch_app_locations() == {"1.1.1.1": [16127, 16137], "2.2.2.2": [16127]}
+
+
+def test_remove_by_ip_removes_all_instances_with_one_login(monkeypatch):
+    monkeypatch.setattr(remove_app, "fetch_app_locations", lambda: {"1.1.1.1": [16127, 16137]})
+    logins, removed = [], []
+    monkeypatch.setattr(remove_app, "authenticate", lambda: logins.append(1) or ("phrase", "sig"))
+    monkeypatch.setattr(remove_app, "remove_app", lambda phrase, sig, ip, port: removed.append((ip, port)) or True)
+    monkeypatch.setattr(remove_app, "release", lambda ip: "p")
+    assert remove_app.remove_by_ip("1.1.1.1") == 0
+    assert removed == [("1.1.1.1", 16127), ("1.1.1.1", 16137)]
+    assert len(logins) == 1
@@ -0,0 +1,76 @@
+from replication import local_records, merge, record_key
+
+
+def binding(project, version, lease=None):
+    return {"project": project, "lease": lease, "version": version}
+
+
+def removal(version):
+    return {"project": None, "lease": None, "version": version}
+
+
+def test_record_key_orders_by_version_then_binding_then_project():
+    assert record_key(binding("a", 11)) > record_key(binding("z", 10))
+    # Same version: a binding wins over a tombstone, and the larger project name over the smaller
+    assert record_key(binding("a", 10)) > record_key(removal(10))
+    assert record_key(binding("b", 10)) > record_key(binding("a", 10))
+
+
+def test_local_records_prefer_newer_of_binding_and_tombstone():
+    ip_mapping = {"p": ["1.1.1.1", "2.2.2.2"]}
+    leases = {"1.1.1.1": {"project": "p", "last_seen": 100}, "2.2.2.2": {"project": "p", "last_seen": 50}}
+    tombstones = {"1.1.1.1": 100, "2.2.2.2": 60}
+    records = local_records(ip_mapping, leases, tombstones)
+    assert records["1.1.1.1"]["project"] == "p"
+    assert records["2.2.2.2"]["project"] is None
+    assert set(local_records(ip_mapping, leases, tombstones, since=80)) == {"1.1.1.1"}
+
+
+def test_merge_applies_newer_and_ignores_older():
+    ip_mapping = {"p": ["1.1.1.1"], "q": []}
+    leases = {"1.1.1.1": {"project": "p", "last_seen": 100}}
+    tombstones = {}
+    assert merge(ip_mapping, leases, tombstones, {"1.1.1.1": binding("q", 90, {"project": "q", "last_seen": 90})}) == 0
+    assert ip_mapping == {"p": ["1.1.1.1"], "q": []}
+
+    lease = {"project": "q", "last_seen": 120}
+    assert merge(ip_mapping, leases, tombstones, {"1.1.1.1": binding("q", 120, lease)}) == 1
+    assert ip_mapping == {"p": [], "q": ["1.1.1.1"]}
+    assert leases["1.1.1.1"] == lease
+
+
+def test_merge_tombstone_tie_keeps_binding():
+    ip_mapping = {"p": ["1.1.1.1"]}
+    leases = {"1.1.1.1": {"project": "p", "last_seen": 100}}
+    tombstones = {}
+    assert merge(ip_mapping, leases, tombstones, {"1.1.1.1": removal(100)}) == 0
+    assert merge(ip_mapping, leases, tombstones, {"1.1.1.1": removal(101)}) == 1
+    assert ip_mapping == {"p": []}
+    assert "1.1.1.1" not in leases
+    assert tombstones == {"1.1.1.1": 101}
+
+    # A tombstone loses a tie against a binding arriving later as well
+    assert merge(ip_mapping, leases, tombstones, {"1.1.1.1": binding("p", 101, {"project": "p", "last_seen": 101})}) == 1
+    assert ip_mapping == {"p": ["1.1.1.1"]}
+    assert tombstones == {}
+
+
+def test_merge_takes_port_only_from_leases_of_the_same_node():
+    ip_mapping = {"p": ["1.1.1.1", "2.2.2.2"]}
+    leases = {
+        "1.1.1.1": {"project": "p", "last_seen": 100, "port": 30000, "node": "central-1"},
+        "2.2.2.2": {"project": "p", "last_seen": 100, "port": 30000, "node": "central-2"},
+    }
+    new = {"project": "p", "last_seen": 200, "port": 30000, "node": "central-1"}
+    assert merge(ip_mapping, leases, {}, {"3.3.3.3": binding("p", 200, new)}) == 1
+    assert "port" not in leases["1.1.1.1"]
+    assert leases["2.2.2.2"]["port"] == 30000
+
+
+def test_merge_legacy_leases_without_node_keep_their_ports():
+    ip_mapping = {"p": ["1.1.1.1"]}
+    leases = {"1.1.1.1": {"project": "p", "last_seen": 100, "port": 30000}}
+    legacy = {"project": "p", "last_seen": 200, "port": 30000}
+    assert merge(ip_mapping, leases, {}, {"2.2.2.2": binding("p", 200, legacy)}) == 1
+    assert leases["1.1.1.1"]["port"] == 30000
+    assert leases["2.2.2.2"]["port"] == 30000
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+import run_heartbeat
+
+
+@pytest.fixture
+def html_dir(tmp_path, monkeypatch):
+    (tmp_path / "port_mapping.json").write_text(json.dumps({
+        "project1": ["30000-30009"],
+        "other": ["30100-30109"],
+    }))
+    (tmp_path / "ip_mapping.json").write_text(json.dumps({"project1": ["10.0.0.1"], "other": []}))
+    for name, filename in (("PORTS_FILE", "port_mapping.json"), ("IP_MAPPING_FILE", "ip_mapping.json"),
+                           ("LEASES_FILE", "ip_leases.json"), ("MAPPING_LOCK", ".ip_mapping.lock")):
+        monkeypatch.setattr(run_heartbeat, name, str(tmp_path / filename))
+    monkeypatch.setenv("CENTRAL_NODE_ID", "")
+    return tmp_path
+
+
+def leases(html_dir):
+    return json.loads((html_dir / "ip_leases.json").read_text())
+
+
+def test_port_of_the_project_is_recorded(html_dir):
+    assert run_heartbeat.heartbeat("10.0.0.1", 30003) == "success"
+    assert leases(html_dir)["10.0.0.1"]["port"] == 30003
+
+
+def test_foreign_port_only_refreshes_last_seen(html_dir):
+    run_heartbeat.heartbeat("10.0.0.1", 30003)
+    assert run_heartbeat.heartbeat("10.0.0.1", 30105) == "success"
+    lease = leases(html_dir)["10.0.0.1"]
+    assert lease["port"] == 30003
+    assert lease["project"] == "project1"
+
+
+def test_unbound_ip_in_other_gets_other_lease(html_dir):
+    assert run_heartbeat.heartbeat("10.0.0.2", 30101) == "success"
+    assert leases(html_dir)["10.0.0.2"]["project"] == "other"
+    assert run_heartbeat.heartbeat("10.0.0.3", 30001) == "unbound"
+
+
+def test_slot_heartbeat_keeps_port_on_its_slot(html_dir):
+    assert run_heartbeat.heartbeat("10.0.0.1", 30003) == "success"
+    assert run_heartbeat.heartbeat("10.0.0.1", 30004, slot=1) == "success"
+    lease = leases(html_dir)["10.0.0.1"]
+    assert lease["port"] == 30003
+    assert lease["ports"] == {"1": 30004}